@@ -0,0 +1,194 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock admission control
+Per-IP and per-player rate limits plus a cap on concurrent writes
+"""
+
+import ipaddress
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+RATE_LIMIT = os.environ.get('TETROHASH_RATE_LIMIT', '1') == '1'
+# Sustained requests per second and burst size, per client IP...
+READ_RATE = float(os.environ.get('TETROHASH_RATE_READ_PER_SECOND', 20))
+READ_BURST = int(os.environ.get('TETROHASH_RATE_READ_BURST', 60))
+WRITE_RATE = float(os.environ.get('TETROHASH_RATE_WRITE_PER_SECOND', 5))
+WRITE_BURST = int(os.environ.get('TETROHASH_RATE_WRITE_BURST', 20))
+# ...and per player read about (the player_id in the URL), whichever address asks.
+# Player ids are not authenticated, so they never key a write budget: anyone
+# could spend someone else's and lock them out.
+PLAYER_READ_RATE = float(os.environ.get('TETROHASH_RATE_PLAYER_READ_PER_SECOND', 10))
+PLAYER_READ_BURST = int(os.environ.get('TETROHASH_RATE_PLAYER_READ_BURST', 30))
+# Keys remembered per limiter (about 150 bytes each); the least recently seen go first
+RATE_MAX_KEYS = int(os.environ.get('TETROHASH_RATE_MAX_KEYS', 250000))
+# Write requests running at once in this process, and how many more may wait briefly
+WRITE_CONCURRENCY = int(os.environ.get('TETROHASH_WRITE_CONCURRENCY', 4))
+WRITE_QUEUE = int(os.environ.get('TETROHASH_WRITE_QUEUE', 8))
+WRITE_QUEUE_TIMEOUT = float(os.environ.get('TETROHASH_WRITE_QUEUE_TIMEOUT', 0.25))
+# Proxies in front of the app (Railway, a load balancer) whose X-Forwarded-For is trusted
+PROXY_HOPS = int(os.environ.get('TETROHASH_PROXY_HOPS', 0))
+
+
+class Overloaded(Exception):
+    """Raised when every write slot is busy and the wait queue is full or timed out"""
+
+
+def client_key(ip: Optional[str]) -> str:
+    """Rate-limit key for an address: IPv6 clients are grouped by their /64"""
+    if not ip or ':' not in ip:
+        return ip or ''
+    try:
+        address = ipaddress.IPv6Address(ip)
+    except ValueError:
+        return ip
+    if address.ipv4_mapped:
+        return str(address.ipv4_mapped)
+    return f'{ipaddress.IPv6Address(int(address) >> 64 << 64)}/64'
+
+
+def retry_after(seconds: float) -> str:
+    """A Retry-After header value (whole seconds, at least 1)"""
+    return str(max(1, math.ceil(seconds)))
+
+
+class RateLimiter:
+    """Token buckets for many keys in bounded memory.
+
+    Uses GCRA, the token bucket stored as a single number: the time its
+    bucket will next be full (the "theoretical arrival time"). Admitting
+    a request pushes it forward by 1/rate, and a request is refused while
+    that would put it more than burst/rate ahead of now. So each key costs
+    one float in an LRU dict rather than a bucket object. Past `max_keys`
+    the least recently seen key is evicted. That is harmless when its time
+    is in the past (a full bucket), but an evicted key that is still
+    throttled starts again with a full budget. A key's time is never more
+    than burst/rate seconds past its last request, so this takes max_keys
+    other keys arriving within that window.
+    """
+
+    __slots__ = ('interval', 'window', 'max_keys', '_tats', '_lock',
+                 'admitted', 'limited', 'evictions')
+
+    def __init__(self, rate: float, burst: int, max_keys: int = RATE_MAX_KEYS):
+        self.interval = 1.0 / rate
+        self.window = self.interval * max(1, burst)
+        self.max_keys = max(1, max_keys)
+        self._tats: 'OrderedDict[Hashable, float]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.admitted = 0
+        self.limited = 0
+        self.evictions = 0
+
+    def hit(self, key: Hashable, now: Optional[float] = None) -> float:
+        """Spend one token: 0.0 if admitted, else seconds until one is available"""
+        if now is None:
+            now = time.monotonic()
+        with self._lock:
+            tat = self._tats.get(key)
+            new_tat = (tat if tat is not None and tat > now else now) + self.interval
+            wait = new_tat - now - self.window
+            if wait > 0:
+                self._tats.move_to_end(key)
+                self.limited += 1
+                return wait
+            self._tats[key] = new_tat
+            self._tats.move_to_end(key)
+            if len(self._tats) > self.max_keys:
+                self._tats.popitem(last=False)
+                self.evictions += 1
+            self.admitted += 1
+            return 0.0
+
+    def __len__(self) -> int:
+        return len(self._tats)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            return {'rate_per_second': round(1.0 / self.interval, 3),
+                    'burst': round(self.window / self.interval), 'keys': len(self._tats),
+                    'max_keys': self.max_keys, 'admitted': self.admitted,
+                    'limited': self.limited, 'evictions': self.evictions}
+
+
+class WriteGate:
+    """At most `concurrency` write requests at once in this process.
+
+    Up to `queue` more wait at most `timeout` seconds for a slot; anything
+    beyond that is refused at once with Overloaded, so a flood of writes
+    queues briefly instead of piling up on SQLite's writer lock.
+    """
+
+    def __init__(self, concurrency: int = WRITE_CONCURRENCY, queue: int = WRITE_QUEUE,
+                 timeout: float = WRITE_QUEUE_TIMEOUT):
+        self.concurrency = max(1, concurrency)
+        self.queue = max(0, queue)
+        self.timeout = timeout
+        self._slots = threading.Semaphore(self.concurrency)
+        self._lock = threading.Lock()
+        self._waiting = 0
+        self._stats = {'admitted': 0, 'queued': 0, 'rejected': 0}
+
+    def acquire(self) -> None:
+        """Take a write slot, waiting briefly in the queue if need be (or raise Overloaded)"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                if self._waiting >= self.queue:
+                    self._stats['rejected'] += 1
+                    raise Overloaded(f'Too many concurrent writes ({self._waiting} waiting)')
+                self._waiting += 1
+                self._stats['queued'] += 1
+            try:
+                acquired = self._slots.acquire(timeout=self.timeout)
+            finally:
+                with self._lock:
+                    self._waiting -= 1
+            if not acquired:
+                with self._lock:
+                    self._stats['rejected'] += 1
+                raise Overloaded(f'No write slot free after {self.timeout}s')
+        with self._lock:
+            self._stats['admitted'] += 1
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {**self._stats, 'concurrency': self.concurrency,
+                    'queue': self.queue, 'waiting': self._waiting}
+
+
+class Admission:
+    """Separate read and write budgets per client IP, plus reads per player"""
+
+    def __init__(self, max_keys: int = RATE_MAX_KEYS):
+        self.ip_read = RateLimiter(READ_RATE, READ_BURST, max_keys)
+        self.ip_write = RateLimiter(WRITE_RATE, WRITE_BURST, max_keys)
+        self.player_read = RateLimiter(PLAYER_READ_RATE, PLAYER_READ_BURST, max_keys)
+        self.writes = WriteGate()
+
+    def check(self, write: bool, ip: Optional[str], player_id: object = None) -> float:
+        """0.0 if the request is within budget, else seconds to wait before retrying.
+
+        `player_id` is the player a read is about, taken from the URL; it is
+        ignored for writes.
+        """
+        now = time.monotonic()
+        wait = (self.ip_write if write else self.ip_read).hit(client_key(ip), now)
+        if wait or write or player_id is None:
+            return wait
+        try:
+            player_key = int(player_id)
+        except (TypeError, ValueError):  # the view rejects it
+            return 0.0
+        return self.player_read.hit(player_key, now)
+
+    def stats(self) -> Dict[str, object]:
+        """Limiter and write gate counters for /api/health"""
+        return {'ip_read': self.ip_read.stats(), 'ip_write': self.ip_write.stats(),
+                'player_read': self.player_read.stats(),
+                'write_gate': self.writes.stats()}
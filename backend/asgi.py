@@ -0,0 +1,524 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock ASGI server
+asyncio entry point for the core API routes, backed by async_db
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+import admission
+import games
+import ingest
+import puzzle_tokens
+import server  # shared state: pools, ranking index, caches, puzzle pool, token signer
+import stats
+from async_db import AsyncDatabase, WriteQueueFull
+from puzzle_pool import claim_solution, create_puzzle
+from puzzle_tokens import InvalidToken, TokenExpired
+
+db = AsyncDatabase(server.db_pool)
+
+Result = Tuple[int, Any]  # (status, JSON payload), optionally plus a header dict
+
+
+class BadRequest(ValueError):
+    """Raised for a body that is not a JSON object"""
+
+
+class Request:
+    """The parts of an ASGI HTTP request the handlers look at"""
+
+    __slots__ = ('method', 'path', 'query_string', 'query', 'headers', 'body', 'client')
+
+    def __init__(self, scope: dict, body: bytes):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.query_string = scope['query_string']
+        self.query = {key: values[0] for key, values in
+                      parse_qs(self.query_string.decode('latin-1')).items()}
+        self.headers = {name.decode('latin-1'): value.decode('latin-1')
+                        for name, value in scope['headers']}
+        self.body = body
+        self.client = scope['client'][0] if scope.get('client') else None
+
+    def json(self) -> Dict[str, Any]:
+        """The body as a JSON object (BadRequest if it is not one)"""
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            raise BadRequest('Expected a JSON object')
+        return data
+
+    def int_arg(self, name: str, default: int) -> int:
+        try:
+            return int(self.query[name])
+        except (KeyError, ValueError):
+            return default
+
+
+# ---------------------------------------------------------------- write jobs
+# Each runs on the single writer thread inside its own savepoint (async_db.py)
+
+def _record_game(conn: sqlite3.Connection, data: Dict[str, Any]) -> int:
+    game_id = games.record_game(conn, data, server.rankings)
+    server.invalidate_games([data])
+    return game_id
+
+
+def _claim_solution(conn: sqlite3.Connection, puzzle_id: int, player_id: int,
+                    sats_reward: int) -> bool:
+    claimed = claim_solution(conn, puzzle_id, player_id, sats_reward)
+    if claimed:
+        server.invalidate_after_commit('stats', f'player:{player_id}')
+    return claimed
+
+
+def _record_token_solve(conn: sqlite3.Connection, puzzle: puzzle_tokens.PuzzleToken,
+                        player_id: int) -> bool:
+    claimed = puzzle_tokens.record_solve(conn, puzzle, player_id)
+    if claimed:
+        server.invalidate_after_commit('stats', f'player:{player_id}')
+    return claimed
+
+
+_catch_up: Optional[asyncio.Future] = None
+
+
+async def caught_up_rankings():
+    """The ranking index, after any due catch-up has run off the event loop"""
+    global _catch_up
+    if server.rankings.stale():
+        # Concurrent readers share one catch-up instead of each starting their own
+        if _catch_up is None or _catch_up.done():
+            _catch_up = asyncio.get_running_loop().run_in_executor(None, server.rankings.sync)
+        await asyncio.shield(_catch_up)
+    return server.rankings
+
+
+# ------------------------------------------------------------------ handlers
+
+async def health_check(request: Request) -> Result:
+    return 200, {
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'version': '3.0.0',
+        'server': 'asgi',
+        'game_modes': server.GAME_MODES,
+        'async_db': db.stats(),
+        'db_pool': server.db_pool.stats(),
+        'response_cache': server.response_cache.stats(),
+        'admission': {'enabled': server.app.config['RATE_LIMIT'],
+                      **server.admission_control.stats()},
+        'puzzle_pool': {**server.puzzle_pool.stats(),
+                        'solved_cache': server.solved_puzzles.stats()},
+        'puzzle_tokens': {'enabled': server.app.config['PUZZLE_TOKENS'],
+                          **server.used_tokens.stats()}
+    }
+
+
+async def register_player(request: Request) -> Result:
+    data = request.json()
+    username = data.get('username')
+    wallet_address = data.get('wallet_address', '')
+
+    if not username:
+        return 400, {'error': 'Username is required'}
+
+    try:
+        player_id = await db.write(server.create_player, username, wallet_address)
+    except sqlite3.IntegrityError:
+        return 409, {'error': 'Username already exists'}
+
+    return 201, {
+        'player_id': player_id,
+        'username': username,
+        'wallet_address': wallet_address,
+        'total_sats': 0,
+        'games_played': 0,
+        'high_score': 0
+    }
+
+
+async def get_player(request: Request, player_id: str) -> Result:
+    player = await db.fetchone('''
+        SELECT id, username, wallet_address, total_sats, games_played, high_score, created_at
+        FROM players WHERE id = ?
+    ''', (int(player_id),))
+
+    if not player:
+        return 404, {'error': 'Player not found'}
+
+    return 200, {
+        'player_id': player[0],
+        'username': player[1],
+        'wallet_address': player[2],
+        'total_sats': player[3],
+        'games_played': player[4],
+        'high_score': player[5],
+        'created_at': player[6]
+    }
+
+
+async def submit_game(request: Request) -> Result:
+    data = request.json()
+
+    error = games.validate(data)
+    if error:
+        return 400, {'error': error}
+
+    if server.app.config['ASYNC_SUBMIT']:
+        try:
+            entry_id, depth = await asyncio.get_running_loop().run_in_executor(
+                None, server.ingest_queue.enqueue, data)
+        except ingest.QueueFull as e:
+            return 503, {'error': str(e)}, {'Retry-After': '1'}
+        return 202, {
+            'message': 'Game queued',
+            'queue_entry': entry_id,
+            'queue_depth': depth,
+            'sats_earned': data['sats_earned']
+        }
+
+    await db.write(_record_game, data)
+
+    return 200, {
+        'message': 'Game submitted successfully',
+        'sats_earned': data['sats_earned'],
+        'new_total_sats': data.get('total_sats', 0) + data['sats_earned']
+    }
+
+
+async def get_leaderboard(request: Request, game_mode: str) -> Result:
+    if game_mode not in server.GAME_MODES:
+        return 400, {'error': 'Invalid game mode'}
+
+    limit = min(max(request.int_arg('limit', 100), 1), 100)
+    rankings = await caught_up_rankings()
+
+    return 200, {
+        'game_mode': game_mode,
+        'leaderboard': rankings.board(game_mode).top(limit)
+    }
+
+
+async def get_player_rank(request: Request, game_mode: str, player_id: str) -> Result:
+    if game_mode not in server.GAME_MODES:
+        return 400, {'error': 'Invalid game mode'}
+
+    rankings = await caught_up_rankings()
+    entry = rankings.board(game_mode).rank_of(int(player_id))
+    if not entry:
+        return 404, {'error': 'Player not ranked'}
+
+    return 200, {'game_mode': game_mode, **entry}
+
+
+async def get_players_around_rank(request: Request, game_mode: str, rank: str) -> Result:
+    if game_mode not in server.GAME_MODES:
+        return 400, {'error': 'Invalid game mode'}
+
+    radius = min(max(request.int_arg('radius', 5), 0), 50)
+    board = (await caught_up_rankings()).board(game_mode)
+
+    return 200, {
+        'game_mode': game_mode,
+        'rank': int(rank),
+        'total_ranked': len(board),
+        'leaderboard': board.around(max(int(rank), 1), radius)
+    }
+
+
+async def generate_puzzle(request: Request) -> Result:
+    data = request.json()
+    difficulty = data.get('difficulty', 1)
+
+    if server.app.config['PUZZLE_TOKENS']:
+        if not isinstance(difficulty, int) or not 0 <= difficulty <= 255:
+            return 400, {'error': 'Invalid difficulty'}
+        puzzle_hash = hashlib.sha256(server.generate_preimage(difficulty).encode()).hexdigest()
+        token, puzzle = server.token_signer.issue(puzzle_hash, difficulty,
+                                                  server.puzzle_reward(difficulty))
+        return 201, {
+            'puzzle_token': token,
+            'puzzle_hash': puzzle.puzzle_hash,
+            'difficulty': puzzle.difficulty,
+            'sats_reward': puzzle.sats_reward,
+            'expires_at': puzzle.expires_at
+        }
+
+    # Pre-generated puzzles are one UPDATE; unpooled difficulties also insert via the writer
+    puzzle = await db.write(server.puzzle_pool.take, difficulty) or await db.write(
+        create_puzzle, difficulty, server.generate_preimage, server.puzzle_reward(difficulty))
+
+    return 201, {
+        'puzzle_id': puzzle.puzzle_id,
+        'puzzle_hash': puzzle.puzzle_hash,
+        'difficulty': difficulty,
+        'sats_reward': puzzle.sats_reward
+    }
+
+
+async def solve_puzzle(request: Request) -> Result:
+    data = request.json()
+    if data.get('puzzle_token'):
+        return await solve_token_puzzle(data)
+
+    puzzle_id = data.get('puzzle_id')
+    preimage = data.get('preimage')
+    player_id = data.get('player_id')
+
+    if not all([puzzle_id, preimage, player_id]):
+        return 400, {'error': 'Missing required fields'}
+
+    # Reject non-scalar ids before they reach the cache or the query
+    if isinstance(puzzle_id, bool) or not isinstance(puzzle_id, int):
+        return 400, {'error': 'Invalid puzzle_id'}
+    if not isinstance(preimage, str):
+        return 400, {'error': 'Invalid preimage'}
+
+    if puzzle_id in server.solved_puzzles:
+        return 409, {'error': 'Puzzle already solved'}
+
+    # Verify on a reader; the writer's claim re-checks atomically
+    puzzle = await db.fetchone('''
+        SELECT puzzle_hash, sats_reward, solved_by
+        FROM bitcoin_puzzles WHERE id = ? AND issued_at IS NOT NULL
+    ''', (puzzle_id,))
+
+    if not puzzle:
+        return 404, {'error': 'Puzzle not found'}
+
+    if puzzle[2]:
+        server.solved_puzzles.add(puzzle_id)
+        return 409, {'error': 'Puzzle already solved'}
+
+    if hashlib.sha256(preimage.encode()).hexdigest() != puzzle[0]:
+        return 400, {'error': 'Invalid preimage'}
+
+    claimed = await db.write(_claim_solution, puzzle_id, player_id, puzzle[1])
+    server.solved_puzzles.add(puzzle_id)
+    if not claimed:
+        return 409, {'error': 'Puzzle already solved'}
+
+    return 200, {
+        'message': 'Puzzle solved successfully!',
+        'sats_reward': puzzle[1],
+        'preimage': preimage
+    }
+
+
+async def solve_token_puzzle(data: Dict[str, Any]) -> Result:
+    preimage = data.get('preimage')
+    player_id = data.get('player_id')
+
+    if not all([preimage, player_id]):
+        return 400, {'error': 'Missing required fields'}
+
+    if not isinstance(preimage, str):
+        return 400, {'error': 'Invalid preimage'}
+
+    try:
+        puzzle = server.token_signer.verify(data['puzzle_token'])
+    except TokenExpired as e:
+        return 410, {'error': str(e)}
+    except InvalidToken as e:
+        return 400, {'error': str(e)}
+
+    # Wrong guesses must not burn the token, so check the preimage first
+    if hashlib.sha256(preimage.encode()).hexdigest() != puzzle.puzzle_hash:
+        return 400, {'error': 'Invalid preimage'}
+
+    if not server.used_tokens.claim(puzzle.token_id):
+        return 409, {'error': 'Puzzle already solved'}
+
+    try:
+        claimed = await db.write(_record_token_solve, puzzle, player_id)
+    except BaseException:
+        server.used_tokens.release(puzzle.token_id)
+        raise
+
+    if not claimed:
+        return 409, {'error': 'Puzzle already solved'}
+
+    return 200, {
+        'message': 'Puzzle solved successfully!',
+        'sats_reward': puzzle.sats_reward,
+        'preimage': preimage
+    }
+
+
+async def get_global_stats(request: Request) -> Result:
+    counters = dict.fromkeys(stats.COUNTERS, 0)
+    counters.update(await db.fetchall(stats.READ_SQL))
+
+    return 200, {
+        'total_players': counters['total_players'],
+        'total_games': counters['total_games'],
+        'total_sats_earned': counters['total_sats_earned'],
+        'puzzles_solved': counters['puzzles_solved'],
+        'timestamp': datetime.now().isoformat()
+    }
+
+
+Handler = Callable[..., Awaitable[Result]]
+
+# (method, path pattern, handler, response cache tag templates or None)
+ROUTES: List[Tuple[str, 're.Pattern', Handler, Optional[Tuple[str, ...]]]] = [
+    (method, re.compile(pattern + '$'), handler, tags) for method, pattern, handler, tags in [
+        ('GET', r'/api/health', health_check, None),
+        ('POST', r'/api/player/register', register_player, None),
+        ('GET', r'/api/player/(?P<player_id>\d+)', get_player, ('player:{player_id}',)),
+        ('POST', r'/api/game/submit', submit_game, None),
+        ('GET', r'/api/leaderboard/(?P<game_mode>[^/]+)', get_leaderboard,
+         ('leaderboard:{game_mode}',)),
+        ('GET', r'/api/leaderboard/(?P<game_mode>[^/]+)/player/(?P<player_id>\d+)',
+         get_player_rank, ('leaderboard:{game_mode}',)),
+        ('GET', r'/api/leaderboard/(?P<game_mode>[^/]+)/around/(?P<rank>\d+)',
+         get_players_around_rank, ('leaderboard:{game_mode}',)),
+        ('POST', r'/api/bitcoin/puzzle/generate', generate_puzzle, None),
+        ('POST', r'/api/bitcoin/puzzle/solve', solve_puzzle, None),
+        ('GET', r'/api/stats/global', get_global_stats, ('stats',)),
+    ]
+]
+
+
+def admit(request: Request, params: Dict[str, str]) -> float:
+    """server.admit_request's rate limits; the writer queue bounds concurrent writes"""
+    write = request.method not in ('GET', 'HEAD', 'OPTIONS')
+    return server.admission_control.check(write, request.client, params.get('player_id'))
+
+
+def _if_none_match(header: Optional[str], etag: str) -> bool:
+    if not header:
+        return False
+    return any(candidate.strip().removeprefix('W/').strip('"') in (etag, '*')
+               for candidate in header.split(','))
+
+
+async def cached(request: Request, handler: Handler, params: Dict[str, str],
+                 tag_templates: Tuple[str, ...]) -> Tuple[int, bytes, Dict[str, str]]:
+    """server.cached_response for the ASGI routes: same cache, tags and ETags"""
+    cache = server.response_cache
+    key = (request.path, request.query_string)
+    entry = cache.get(key)
+    if entry is None:
+        tags = tuple(template.format(**params) for template in tag_templates)
+        generation = cache.generation()
+        status, body, headers = _encode(await handler(request, **params))
+        if status != 200:
+            return status, body, headers
+        entry = cache.put(key, body, 'application/json', tags, generation)
+
+    headers = {'ETag': f'"{entry.etag}"', 'Cache-Control': 'no-cache'}
+    if _if_none_match(request.headers.get('if-none-match'), entry.etag):
+        cache.count_not_modified()
+        return 304, b'', headers
+    return 200, entry.body, headers
+
+
+def _encode(result: tuple) -> Tuple[int, bytes, Dict[str, str]]:
+    status, payload = result[0], result[1]
+    headers = result[2] if len(result) > 2 else {}
+    return status, json.dumps(payload).encode(), headers
+
+
+async def dispatch(request: Request) -> Tuple[int, bytes, Dict[str, str]]:
+    allowed = []
+    for method, pattern, handler, tags in ROUTES:
+        match = pattern.match(request.path)
+        if match is None:
+            continue
+        if method != request.method:
+            allowed.append(method)
+            continue
+        params = match.groupdict()
+        if server.app.config['RATE_LIMIT'] and handler is not health_check:
+            wait = admit(request, params)
+            if wait:
+                return _encode((429, {'error': 'Too many requests', 'retry_after': round(wait, 3)},
+                                {'Retry-After': admission.retry_after(wait)}))
+        try:
+            if tags and server.response_cache.enabled:
+                return await cached(request, handler, params, tags)
+            return _encode(await handler(request, **params))
+        except BadRequest as e:
+            return _encode((400, {'error': str(e)}))
+        except WriteQueueFull as e:
+            return _encode((503, {'error': str(e)}, {'Retry-After': '1'}))
+        except Exception as e:
+            return _encode((500, {'error': str(e)}))
+
+    if request.method == 'OPTIONS' and allowed:  # CORS preflight
+        return 200, b'', {
+            'Access-Control-Allow-Methods': ', '.join(allowed + ['OPTIONS']),
+            'Access-Control-Allow-Headers': request.headers.get(
+                'access-control-request-headers', '*'),
+        }
+    if allowed:
+        return _encode((405, {'error': 'Method not allowed'}))
+    return _encode((404, {'error': 'Not found'}))
+
+
+async def _lifespan(receive, send) -> None:
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                # The schema, ranking index and puzzle pool were set up on import (server.init_db)
+                await db.open()
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await db.close()
+            server.puzzle_pool.stop()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send) -> None:
+    """The ASGI application (uvicorn asgi:app)"""
+    if scope['type'] == 'lifespan':
+        return await _lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+
+    body = b''
+    while True:
+        message = await receive()
+        body += message.get('body', b'')
+        if not message.get('more_body'):
+            break
+
+    status, payload, headers = await dispatch(Request(scope, body))
+    response_headers = [
+        (b'content-type', b'application/json'),
+        (b'content-length', str(len(payload)).encode()),
+        (b'access-control-allow-origin', b'*'),
+    ]
+    response_headers.extend((name.lower().encode(), value.encode())
+                            for name, value in headers.items())
+    await send({'type': 'http.response.start', 'status': status, 'headers': response_headers})
+    await send({'type': 'http.response.body', 'body': payload})
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    port = int(os.environ.get('PORT', 5000))
+    host = '0.0.0.0' if os.environ.get('PORT') else '127.0.0.1'
+    print(f"🌐 ASGI server will be available at: http://localhost:{port}")
+    print(f"📊 API Documentation: http://localhost:{port}/api/health")
+    uvicorn.run(app, host=host, port=port, access_log=False,
+                backlog=int(os.environ.get('TETROHASH_ASGI_BACKLOG', 2048)))
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock async database layer
+Concurrent aiosqlite readers and one serialized writer task for the ASGI server
+"""
+
+import asyncio
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Optional, Sequence, Tuple
+
+import aiosqlite
+
+from db import BUSY_TIMEOUT_MS, CACHE_SIZE_KIB, MMAP_SIZE, ConnectionPool
+
+ASYNC_READERS = int(os.environ.get('TETROHASH_ASYNC_READERS', 4))
+# Writes that queue up while a batch commits go out together in the next one
+ASYNC_WRITE_BATCH = int(os.environ.get('TETROHASH_ASYNC_WRITE_BATCH', 64))
+ASYNC_WRITE_QUEUE = int(os.environ.get('TETROHASH_ASYNC_WRITE_QUEUE', 10000))
+
+
+class WriteQueueFull(Exception):
+    """Raised when the writer is this far behind; the caller should shed load"""
+
+
+class AsyncDatabase:
+    """SQLite for an asyncio server: many readers, one request writer.
+
+    Reads run on a small pool of aiosqlite connections, each with its own
+    thread, so up to `readers` queries proceed at once and the event loop
+    never blocks on disk. WAL lets them run alongside the writer.
+
+    Writes are plain synchronous functions taking a connection, the same
+    helpers the Flask routes call (games.record_game, claim_solution...).
+    write() queues one and awaits its result. A single writer task drains
+    the queue and runs each batch on one dedicated thread inside one
+    ConnectionPool transaction, with a savepoint per job: a failing job is
+    rolled back alone and gets its exception, the rest commit together.
+    This is the only writer for requests, so BEGIN IMMEDIATE never queues
+    behind another request. It is not the only writer in the process:
+    server's background threads (the puzzle pool refill and, with
+    ASYNC_SUBMIT, the ingest drain) write through the same synchronous
+    pool, and BEGIN IMMEDIATE waits for them (up to busy_timeout) as it
+    would for another process. pool.after_commit callbacks (ranking
+    index, response cache) fire exactly as they do under Flask.
+    """
+
+    def __init__(self, pool: ConnectionPool, readers: int = ASYNC_READERS,
+                 write_batch: int = ASYNC_WRITE_BATCH, write_queue: int = ASYNC_WRITE_QUEUE):
+        self.pool = pool
+        self.readers = max(1, readers)
+        self.write_batch = max(1, write_batch)
+        self.write_queue = write_queue
+        self._readers: Optional[asyncio.Queue] = None
+        self._reader_conns: List[aiosqlite.Connection] = []
+        self._writes: Optional[asyncio.Queue] = None
+        self._writer_task: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._stats = {'reads': 0, 'writes': 0, 'write_batches': 0,
+                       'write_errors': 0, 'rejected_writes': 0}
+
+    async def open(self) -> 'AsyncDatabase':
+        """Open the reader connections and start the writer (inside the running loop)"""
+        self._readers = asyncio.Queue()
+        for _ in range(self.readers):
+            conn = await aiosqlite.connect(self.pool.db_file, isolation_level=None)
+            await conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+            await conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+            await conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+            await conn.execute('PRAGMA query_only=ON')
+            self._reader_conns.append(conn)
+            self._readers.put_nowait(conn)
+
+        self._writes = asyncio.Queue(maxsize=self.write_queue)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='async-db-writer')
+        self._writer_task = asyncio.get_running_loop().create_task(self._writer())
+        return self
+
+    async def close(self) -> None:
+        """Finish queued writes, then close everything"""
+        if self._writer_task is not None:
+            await self._writes.put(None)
+            await self._writer_task
+            self._writer_task = None
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        for conn in self._reader_conns:
+            await conn.close()
+        self._reader_conns = []
+
+    async def _read(self, sql: str, params: Sequence[Any], one: bool):
+        conn = await self._readers.get()
+        try:
+            async with conn.execute(sql, params) as cursor:
+                rows = await (cursor.fetchone() if one else cursor.fetchall())
+        finally:
+            self._readers.put_nowait(conn)
+        self._stats['reads'] += 1
+        return rows
+
+    async def fetchone(self, sql: str, params: Sequence[Any] = ()) -> Optional[tuple]:
+        return await self._read(sql, params, one=True)
+
+    async def fetchall(self, sql: str, params: Sequence[Any] = ()) -> List[tuple]:
+        return await self._read(sql, params, one=False)
+
+    async def write(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """Run fn(conn, *args) on the writer inside a transaction and return its result"""
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._writes.put_nowait((fn, args, future))
+        except asyncio.QueueFull:
+            self._stats['rejected_writes'] += 1
+            raise WriteQueueFull(f'Write queue is full ({self.write_queue} pending)') from None
+        return await future
+
+    async def _writer(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            job = await self._writes.get()
+            if job is None:
+                break
+            batch = [job]
+            while len(batch) < self.write_batch and not self._writes.empty():
+                job = self._writes.get_nowait()
+                if job is None:
+                    stopping = True
+                    break
+                batch.append(job)
+
+            try:
+                outcomes = await loop.run_in_executor(self._executor, self._apply, batch)
+            except Exception as e:  # BEGIN or COMMIT itself failed: nothing was written
+                outcomes = [(False, e)] * len(batch)
+            self._stats['write_batches'] += 1
+            for (_, _, future), (ok, value) in zip(batch, outcomes):
+                self._stats['writes' if ok else 'write_errors'] += 1
+                if future.done():  # the request was cancelled meanwhile
+                    continue
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+
+    def _apply(self, batch: List[Tuple[Callable[..., Any], tuple, asyncio.Future]]) -> List[tuple]:
+        """One transaction for the whole batch, one savepoint per job (writer thread)"""
+        outcomes = []
+        with self.pool.transaction() as conn:
+            for fn, args, _ in batch:
+                try:
+                    with self.pool.savepoint('async_write'):
+                        outcomes.append((True, fn(conn, *args)))
+                except Exception as e:
+                    outcomes.append((False, e))
+        return outcomes
+
+    def stats(self) -> dict:
+        """Reader/writer counters for /api/health"""
+        return {
+            **self._stats,
+            'readers': self.readers,
+            'idle_readers': self._readers.qsize() if self._readers else 0,
+            'write_queue_depth': self._writes.qsize() if self._writes else 0,
+            'write_queue_max': self.write_queue,
+            'write_batch': self.write_batch,
+        }
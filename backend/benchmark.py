@@ -0,0 +1,470 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock backend benchmarks
+Offline measurements for database and hashing hot paths
+"""
+
+import argparse
+import os
+import random
+import sqlite3
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import leaderboard
+import migrations
+from db import get_pool, reset_pool
+from games import GAME_MODES
+
+
+def timed(fn: Callable[[], object], repeat: int = 5) -> float:
+    """Best-of-N wall time in milliseconds"""
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best * 1000
+
+
+def seed_database(conn: sqlite3.Connection, games: int, players: int = 10000,
+                  puzzles: int = 100000, solved_ratio: float = 0.05) -> None:
+    """Fill a fresh database with synthetic players, games and puzzles"""
+    rng = random.Random(42)
+    conn.execute('BEGIN')
+    conn.executemany(
+        'INSERT INTO players (username, wallet_address) VALUES (?, ?)',
+        ((f'player{i}', '') for i in range(players))
+    )
+    conn.executemany('''
+        INSERT INTO games (player_id, game_mode, score, lines_cleared, level_reached, sats_earned)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (
+        (rng.randint(1, players), rng.choice(GAME_MODES), rng.randint(0, 1000000),
+         rng.randint(0, 200), rng.randint(1, 15), rng.randint(0, 50))
+        for _ in range(games)
+    ))
+    conn.executemany('''
+        INSERT INTO bitcoin_puzzles (puzzle_hash, preimage, difficulty, solved_by)
+        VALUES (?, ?, ?, ?)
+    ''', (
+        (f'{i:064x}', f'P{i}', 1,
+         rng.randint(1, players) if rng.random() < solved_ratio else None)
+        for i in range(puzzles)
+    ))
+    conn.execute('COMMIT')
+
+
+INDEX_QUERIES: Dict[str, tuple] = {
+    'leaderboard rebuild (games by mode/score)': ('''
+        SELECT player_id, score FROM games
+        WHERE game_mode = ?
+        ORDER BY score DESC, id ASC
+        LIMIT 100
+    ''', ('normal',)),
+    'leaderboard join': ('''
+        SELECT p.username, l.score, l.rank, l.updated_at
+        FROM leaderboards l
+        JOIN players p ON l.player_id = p.id
+        WHERE l.game_mode = ?
+        ORDER BY l.rank
+        LIMIT 100
+    ''', ('normal',)),
+    'leaderboard last place': ('''
+        SELECT COUNT(*), MIN(score) FROM leaderboards WHERE game_mode = ?
+    ''', ('normal',)),
+    'solved puzzle count': ('''
+        SELECT COUNT(*) FROM bitcoin_puzzles WHERE solved_by IS NOT NULL
+    ''', ()),
+}
+
+
+def report_queries(conn: sqlite3.Connection, label: str) -> Dict[str, float]:
+    """Print the plan and best timing of each INDEX_QUERIES entry"""
+    print(f"\n=== {label} ===")
+    timings = {}
+    for name, (sql, params) in INDEX_QUERIES.items():
+        plan = [row[3] for row in conn.execute('EXPLAIN QUERY PLAN ' + sql, params)]
+        timings[name] = timed(lambda: conn.execute(sql, params).fetchall())
+        print(f"\n{name}: {timings[name]:.3f} ms")
+        for step in plan:
+            print(f"   {step}")
+    return timings
+
+
+def bench_indexes(args) -> None:
+    """Query plans and timings before and after the index migration"""
+    with tempfile.TemporaryDirectory() as workdir:
+        db_file = os.path.join(workdir, 'bench.db')
+        pool = get_pool(db_file)
+        migrations.migrate(pool, target=2)
+
+        with pool.connection() as conn:
+            print(f"🌱 Seeding {args.games:,} games...")
+            started = time.perf_counter()
+            seed_database(conn, args.games)
+            print(f"   done in {time.perf_counter() - started:.1f}s")
+            with pool.transaction() as txn:
+                for mode in GAME_MODES:
+                    leaderboard.rebuild(txn, mode)
+            before = report_queries(conn, 'schema v2 (no secondary indexes)')
+
+        started = time.perf_counter()
+        migrations.migrate(pool)
+        print(f"\n🔧 Index migration took {time.perf_counter() - started:.1f}s")
+
+        with pool.connection() as conn:
+            after = report_queries(conn, f'schema v{migrations.LATEST_VERSION}')
+
+        print("\n=== Summary ===")
+        for name in INDEX_QUERIES:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            print(f"{name:<45} {before[name]:>10.3f} ms -> {after[name]:>8.3f} ms  ({speedup:,.0f}x)")
+        reset_pool(db_file)
+
+
+def _game_records(count: int, players: int, seed: int = 7) -> List[dict]:
+    rng = random.Random(seed)
+    return [{
+        'player_id': rng.randint(1, players),
+        'game_mode': rng.choice(GAME_MODES),
+        'score': rng.randint(0, 1000000),
+        'lines_cleared': rng.randint(0, 200),
+        'level_reached': rng.randint(1, 15),
+        'sats_earned': rng.randint(0, 50),
+    } for _ in range(count)]
+
+
+def bench_submit(args) -> None:
+    """Game submission throughput: single POSTs versus the batch endpoint"""
+    with tempfile.TemporaryDirectory() as workdir:
+        # server reads DB_FILE at import time; the working directory stays put
+        os.environ['TETROHASH_DB_FILE'] = os.path.join(workdir, 'tetrohash.db')
+        import server
+        server.app.config['RATE_LIMIT'] = False
+        server.init_db()
+        client = server.app.test_client()
+        with server.db_pool.connection() as conn:
+            seed_database(conn, args.games, players=1000, puzzles=0)
+
+        count = args.count or 5000
+        records = _game_records(count, players=1000)
+
+        started = time.perf_counter()
+        for record in records:
+            client.post('/api/game/submit', json=record)
+        single = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for offset in range(0, len(records), args.batch_size):
+            client.post('/api/game/submit/batch',
+                        json={'games': records[offset:offset + args.batch_size]})
+        batch = time.perf_counter() - started
+
+        print(f"\n=== {count:,} submissions on top of {args.games:,} games ===")
+        print(f"single  /api/game/submit        {count / single:>10,.0f} games/s")
+        print(f"batch   /api/game/submit/batch  {count / batch:>10,.0f} games/s "
+              f"(batches of {args.batch_size}, {single / batch:.1f}x)")
+        reset_pool(server.DB_FILE)
+
+
+def bench_verify(args) -> None:
+    """Per-call execute_script versus batch verification of preimage candidates"""
+    import hashlib
+    from bitcoin_logic import BitcoinScript
+
+    count = args.count or 500000
+    candidates = [f'CANDIDATE{i:08d}' for i in range(count)]
+    target = hashlib.sha256(candidates[-1].encode()).hexdigest()
+    processes = args.processes or os.cpu_count() or 1
+
+    started = time.perf_counter()
+    per_call = [c for c in candidates if BitcoinScript.execute_script(c, target)]
+    per_call_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    batch = [c for c, _ in BitcoinScript.verify_batch(candidates, target)]
+    batch_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    fanned = [c for c, _ in BitcoinScript.verify_batch(iter(candidates), target, processes=processes)]
+    fanned_s = time.perf_counter() - started
+
+    assert per_call == batch == fanned == [candidates[-1]]
+    print(f"\n=== {count:,} candidates, 1 target ===")
+    print(f"execute_script per call        {count / per_call_s:>12,.0f} candidates/s")
+    print(f"verify_batch                   {count / batch_s:>12,.0f} candidates/s ({per_call_s / batch_s:.1f}x)")
+    print(f"verify_batch, {processes:>2} processes    {count / fanned_s:>12,.0f} candidates/s ({per_call_s / fanned_s:.1f}x)")
+
+
+def bench_pow(args) -> None:
+    """Server-side verification throughput for submitted (template, data, nonce) triples"""
+    import proof_of_work
+
+    count = args.count or 100000
+    signer = proof_of_work.TemplateSigner(secret='bench')
+    bits = signer.bits
+    # Solve a slice honestly, then pad with random nonces (almost all invalid);
+    # verification costs the same either way
+    solved = min(count, 2000)
+    submissions = []
+    started = time.perf_counter()
+    for i in range(solved):
+        token, template = signer.issue()
+        data = f'block {i}'.encode()
+        header = proof_of_work.BlockHeader.for_data(data, template.prev_hash, template.bits,
+                                                    template.timestamp)
+        submissions.append((token, data, proof_of_work.mine(header).nonce))
+    mining_s = time.perf_counter() - started
+    rng = random.Random(42)
+    submissions += [(signer.issue()[0], f'block {i}'.encode(), rng.getrandbits(32))
+                    for i in range(solved, count)]
+
+    # What /api/pow/submit does per request: check the signature, then the work
+    started = time.perf_counter()
+    valid = sum(proof_of_work.verify_submission(signer.verify(token), data, nonce) is not None
+                for token, data, nonce in submissions)
+    verify_s = time.perf_counter() - started
+
+    assert valid >= solved
+    print(f"\n=== {count:,} submissions at bits {bits:#010x} "
+          f"(~{proof_of_work.expected_hashes(bits):,.0f} hashes each) ===")
+    print(f"mining {solved:,} blocks            {solved / mining_s:>12,.0f} blocks/s")
+    print(f"verify template + submission   {count / verify_s:>12,.0f} submissions/s "
+          f"({valid:,} valid, {verify_s / count * 1e6:.2f} us each)")
+
+
+def bench_wallet(args) -> None:
+    """Rewrite-per-call wallet.txt versus the group-committed wallet journal"""
+    from reward import Wallet
+
+    count = args.count or 100000
+    with tempfile.TemporaryDirectory() as workdir:
+        legacy = Wallet(os.path.join(workdir, 'legacy.txt'), journaled=False)
+        started = time.perf_counter()
+        for _ in range(count):
+            legacy.add_sats(1)
+        legacy_s = time.perf_counter() - started
+
+        path = os.path.join(workdir, 'journal.txt')
+        wallet = Wallet(path, journaled=True)
+        started = time.perf_counter()
+        for _ in range(count):
+            wallet.add_sats(1)
+        wallet.flush()
+        journal_s = time.perf_counter() - started
+        journal_stats = wallet.journal.stats()
+
+        # Simulated crash: a torn half-line at the tail is dropped on recovery
+        wallet.close()
+        with open(wallet.journal.journal_path, 'ab') as f:
+            f.write(b'999999 +100')
+        recovered = Wallet(path, journaled=True)
+        assert legacy.get_balance() == wallet.get_balance() == recovered.get_balance() == count
+        recovered.close()
+
+    print(f"\n=== {count:,} credits of 1 sat ===")
+    print(f"rewrite wallet.txt per call    {count / legacy_s:>12,.0f} credits/s (no fsync, not atomic)")
+    print(f"journal, group commit          {count / journal_s:>12,.0f} credits/s "
+          f"({legacy_s / journal_s:.1f}x, {journal_stats['fsyncs']:,} fsyncs, "
+          f"{journal_stats['compactions']} compactions)")
+    print(f"recovered after torn write     {recovered.get_balance():>12,} sats")
+
+
+ASGI_MIX = (('submit', 25), ('leaderboard', 35), ('stats', 20), ('player', 20))
+
+
+def _asgi_requests(count: int, players: int, seed: int = 11) -> List[tuple]:
+    """(method, path, body) for the asgi benchmark, mixed as in ASGI_MIX"""
+    rng = random.Random(seed)
+    kinds = rng.choices([kind for kind, _ in ASGI_MIX], [weight for _, weight in ASGI_MIX], k=count)
+    records = iter(_game_records(count, players, seed=seed))
+    requests = []
+    for kind in kinds:
+        if kind == 'submit':
+            requests.append(('POST', '/api/game/submit', next(records)))
+        elif kind == 'leaderboard':
+            requests.append(('GET', f'/api/leaderboard/{rng.choice(GAME_MODES)}', None))
+        elif kind == 'stats':
+            requests.append(('GET', '/api/stats/global', None))
+        else:
+            requests.append(('GET', f'/api/player/{rng.randint(1, players)}', None))
+    return requests
+
+
+async def _drive(port: int, requests: List[tuple], connections: int):
+    """Send requests over `connections` concurrent HTTP/1.1 connections (keep-alive
+    when the server allows it); returns (latencies, errors, elapsed seconds)"""
+    import asyncio
+    import json
+
+    pending = iter(requests)
+    latencies: List[float] = []
+    errors = 0
+
+    async def exchange(streams, raw: bytes):
+        if streams is None:
+            streams = await asyncio.open_connection('127.0.0.1', port)
+        reader, writer = streams
+        writer.write(raw)
+        head = await reader.readuntil(b'\r\n\r\n')
+        length, close = 0, False
+        for line in head.split(b'\r\n')[1:]:
+            name, _, value = line.partition(b':')
+            name = name.strip().lower()
+            if name == b'content-length':
+                length = int(value)
+            elif name == b'connection':
+                close = value.strip().lower() == b'close'
+        await reader.readexactly(length)
+        if close:
+            writer.close()
+            streams = None
+        return int(head[9:12]), streams
+
+    async def connection():
+        nonlocal errors
+        streams = None
+        for method, path, body in pending:  # shared: each request is sent once
+            payload = json.dumps(body).encode() if body is not None else b''
+            raw = (f'{method} {path} HTTP/1.1\r\nHost: 127.0.0.1\r\n'
+                   f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'
+                   ).encode() + payload
+            started = time.perf_counter()
+            try:
+                status, streams = await asyncio.wait_for(exchange(streams, raw), 60)
+            except (OSError, ValueError, asyncio.IncompleteReadError, asyncio.TimeoutError):
+                errors += 1
+                if streams is not None:
+                    streams[1].close()
+                streams = None
+                continue
+            latencies.append(time.perf_counter() - started)
+            if status >= 500:
+                errors += 1
+        if streams is not None:
+            streams[1].close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(connection() for _ in range(connections)))
+    return latencies, errors, time.perf_counter() - started
+
+
+def bench_asgi(args) -> None:
+    """The Flask app under gunicorn sync workers versus asgi.py under uvicorn"""
+    import asyncio
+    import importlib.util
+    import resource
+    import shutil
+    import socket
+    import subprocess
+    import sys
+    import urllib.request
+
+    import loadtest
+
+    count = args.count or 20000
+    processes = args.processes or 2  # as in the Procfile
+    connections = args.connections
+    # Client and servers each hold a socket per connection
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft < connections * 2 + 256:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (min(hard, connections * 2 + 256), hard))
+
+    if importlib.util.find_spec('gunicorn'):
+        flask_label = f'Flask, gunicorn sync x{processes}'
+        flask_cmd = ['-m', 'gunicorn', '--workers', str(processes), '--backlog', '2048',
+                     '--log-level', 'warning', '--bind', '127.0.0.1:{port}', 'server:app']
+    else:
+        flask_label = 'Flask, werkzeug threaded'
+        flask_cmd = ['-c', 'import server; server.init_db(); '
+                     'server.app.run(host="127.0.0.1", port={port}, threaded=True)']
+    servers = [
+        (flask_label, flask_cmd),
+        (f'ASGI, uvicorn x{processes}',
+         ['-m', 'uvicorn', '--workers', str(processes), '--backlog', '2048', '--no-access-log',
+          '--log-level', 'warning', '--host', '127.0.0.1', '--port', '{port}', 'asgi:app']),
+    ]
+    requests = _asgi_requests(count, loadtest.SEED_PLAYERS)
+    backend_dir = os.path.dirname(os.path.abspath(__file__))
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        seed_dir = os.path.join(workdir, 'seed')
+        os.makedirs(seed_dir)
+        seeded = loadtest.prepare_database(seed_dir, args.games)
+        for label, command in servers:
+            # Every server starts from the same copy of the seeded database
+            data_dir = os.path.join(workdir, str(len(results)))
+            os.makedirs(data_dir)
+            shutil.copy(seeded, os.path.join(data_dir, loadtest.DB_NAME))
+            with socket.socket() as probe:
+                probe.bind(('127.0.0.1', 0))
+                port = probe.getsockname()[1]
+            process = subprocess.Popen(
+                [sys.executable] + [part.replace('{port}', str(port)) for part in command],
+                # One client address for every connection: measure the servers, not the limiter
+                cwd=data_dir,
+                env={**os.environ, 'PYTHONPATH': backend_dir, 'TETROHASH_RATE_LIMIT': '0'},
+                stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            try:
+                deadline = time.monotonic() + loadtest.SERVER_START_TIMEOUT
+                while True:
+                    try:
+                        urllib.request.urlopen(f'http://127.0.0.1:{port}/api/health', timeout=1)
+                        break
+                    except OSError:
+                        if process.poll() is not None or time.monotonic() > deadline:
+                            raise SystemExit(f'❌ {label} did not start')
+                        time.sleep(0.2)
+                asyncio.run(_drive(port, requests[:500], 50))  # warm every worker
+                latencies, errors, elapsed = asyncio.run(_drive(port, requests, connections))
+                results[label] = loadtest.summarize(latencies, errors, elapsed)
+            finally:
+                process.terminate()
+                process.wait(timeout=30)
+
+    print(f"\n=== {count:,} requests over {connections:,} connections "
+          f"({', '.join(f'{kind} {weight}%' for kind, weight in ASGI_MIX)}) ===")
+    print(f"{'server':<30}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}"
+          f"{'max ms':>10}{'errors':>8}")
+    for label, summary in results.items():
+        print(f"{label:<30}{summary['requests_per_second']:>10,.0f}{summary['mean_ms']:>10.1f}"
+              f"{summary['p50_ms']:>10.1f}"
+              f"{summary['p95_ms']:>10.1f}{summary['p99_ms']:>10.1f}{summary['max_ms']:>10.1f}"
+              f"{summary['errors']:>8}")
+
+
+BENCHMARKS = {
+    'indexes': (bench_indexes, 'query plans/timings before and after schema indexes'),
+    'submit': (bench_submit, 'single versus batch game submission throughput'),
+    'verify': (bench_verify, 'per-call versus batch preimage verification'),
+    'pow': (bench_pow, 'proof-of-work submission verification throughput'),
+    'wallet': (bench_wallet, 'rewrite-per-call wallet file versus journaled wallet'),
+    'asgi': (bench_asgi, 'Flask/gunicorn versus the ASGI server at 1k concurrent connections'),
+}
+
+
+def main(argv: List[str] = None):
+    """Run a named benchmark"""
+    parser = argparse.ArgumentParser(description='TetroHashUnlock backend benchmarks')
+    parser.add_argument('benchmark', choices=sorted(BENCHMARKS),
+                        help='; '.join(f'{name}: {doc}' for name, (_, doc) in sorted(BENCHMARKS.items())))
+    parser.add_argument('--games', type=int, default=1000000,
+                        help='synthetic game rows to seed (default 1,000,000)')
+    parser.add_argument('--count', type=int, default=None,
+                        help='operations to time (default depends on the benchmark)')
+    parser.add_argument('--processes', type=int, default=None,
+                        help='worker processes for parallel benchmarks (default: CPU count)')
+    parser.add_argument('--connections', type=int, default=1000,
+                        help='concurrent client connections for the asgi benchmark (default 1000)')
+    parser.add_argument('--batch-size', type=int, default=100,
+                        help='games per batch request (default 100)')
+    args = parser.parse_args(argv)
+    BENCHMARKS[args.benchmark][0](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -4,7 +4,14 @@
 
 import hashlib
 import random
-from typing import Optional, Dict, Any
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Optional, Dict, Any, Iterable, Iterator, List, Set, Tuple, Union
+
+# Candidates per worker task when verify_batch fans out across processes
+BATCH_CHUNK_SIZE = 20000
+# Tetromino preimages BitcoinPuzzle.generate_puzzle() picks from
+TETROMINO_PREIMAGES = ['TJLO', 'SQUARE', 'TEE', 'ELL', 'JAY', 'ESS', 'ZED']
 
 class BitcoinPuzzle:
     """Handles Bitcoin Script-style SHA256 puzzles"""
@@ -17,8 +24,7 @@ class BitcoinPuzzle:
     def generate_puzzle(self) -> Dict[str, Any]:
         """Generate a new SHA256 puzzle with target hash"""
         # Select a random tetromino preimage
-        preimages = ['TJLO', 'SQUARE', 'TEE', 'ELL', 'JAY', 'ESS', 'ZED']
-        self.current_preimage = random.choice(preimages)
+        self.current_preimage = random.choice(TETROMINO_PREIMAGES)
         
         # Create the target hash
         self.target_hash = self.sha256_hash(self.current_preimage)
@@ -86,6 +92,14 @@ class BitcoinPuzzle:
             'hash_length': len(self.target_hash) if self.target_hash else 0
         }
     
+    def verify_batch(self, candidates: Iterable[str],
+                     processes: Optional[int] = None) -> Iterator[str]:
+        """Stream the candidates that solve the active puzzle"""
+        if not self.puzzle_active or not self.target_hash:
+            return iter(())
+        return (preimage for preimage, _ in
+                BitcoinScript.verify_batch(candidates, self.target_hash, processes))
+    
     def reset_puzzle(self):
         """Reset the current puzzle"""
         self.target_hash = None
@@ -122,6 +136,67 @@ class BitcoinScript:
         # Step 3: OP_VERIFY to validate
         return BitcoinScript.op_verify(hashes_equal)
 
+    @staticmethod
+    def verify_batch(candidates: Iterable[str], target_hashes, processes: Optional[int] = None,
+                     chunk_size: int = BATCH_CHUNK_SIZE) -> Iterator[Tuple[str, str]]:
+        """<candidate> OP_SHA256 <any target> OP_EQUAL over many candidates at once.
+
+        Digests are compared as raw bytes against a precomputed set, so there
+        is no hex encoding per candidate. Matches are yielded as
+        (candidate, target_hash_hex) while the input is still being read.
+        With processes > 1, chunks are spread over a process pool with a
+        bounded number in flight, so memory stays flat for huge inputs.
+        """
+        targets = _digest_set(target_hashes)
+
+        if not processes or processes <= 1:
+            sha256 = hashlib.sha256
+            for candidate in candidates:
+                digest = sha256(candidate.encode('utf-8')).digest()
+                if digest in targets:
+                    yield candidate, digest.hex()
+            return
+
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            chunks = _chunks(candidates, chunk_size)
+            in_flight = [executor.submit(_match_chunk, chunk, targets)
+                         for chunk in islice(chunks, processes * 2)]
+            while in_flight:
+                matches = in_flight.pop(0).result()
+                for chunk in islice(chunks, 1):
+                    in_flight.append(executor.submit(_match_chunk, chunk, targets))
+                for candidate, digest in matches:
+                    yield candidate, digest.hex()
+
+
+def _digest_set(target_hashes: Union[str, bytes, Iterable[Union[str, bytes]]]) -> Set[bytes]:
+    """Normalize one or more hex/raw target hashes to a set of 32-byte digests"""
+    if isinstance(target_hashes, (str, bytes)):
+        target_hashes = [target_hashes]
+    return {bytes.fromhex(h) if isinstance(h, str) else bytes(h) for h in target_hashes}
+
+
+def _match_chunk(chunk: List[str], targets: Set[bytes]) -> List[Tuple[str, bytes]]:
+    """Hash a chunk of candidates and keep the ones whose digest is a target"""
+    sha256 = hashlib.sha256
+    matches = []
+    for candidate in chunk:
+        digest = sha256(candidate.encode('utf-8')).digest()
+        if digest in targets:
+            matches.append((candidate, digest))
+    return matches
+
+
+def _chunks(candidates: Iterable[str], size: int) -> Iterator[List[str]]:
+    """Split an iterable into lists of at most `size` items, lazily"""
+    iterator = iter(candidates)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
 def main():
     """Test the Bitcoin logic"""
     puzzle = BitcoinPuzzle()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock response cache
+Bounded LRU/TTL cache of serialized responses with tag-based invalidation
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, NamedTuple, Optional, Tuple
+
+CACHE_MAX_ENTRIES = int(os.environ.get('TETROHASH_CACHE_MAX_ENTRIES', 4096))
+# Bounds staleness from other gunicorn workers' writes, which this worker never sees
+CACHE_TTL = float(os.environ.get('TETROHASH_CACHE_TTL', 2.0))
+# Recently invalidated tags remembered for in-flight reads; older ones share one floor
+CACHE_MAX_TAGS = int(os.environ.get('TETROHASH_CACHE_MAX_TAGS', 16384))
+
+
+class CachedResponse(NamedTuple):
+    body: bytes
+    etag: str
+    mimetype: str
+    expires: float
+    tags: Tuple[str, ...]
+
+
+class ResponseCache:
+    """Thread-safe LRU of response bodies, expired by TTL or by tag.
+
+    Each entry carries tags such as 'leaderboard:normal' or 'player:7'.
+    A write invalidates exactly the tags it affects. Invalidations are
+    numbered, and a read that overlapped one touching its tags never stores
+    what it read. Only the last `max_tags` invalidated tags keep their own
+    number; older ones fall back to a shared floor, which at worst skips
+    storing a response that was in fact fresh.
+    """
+
+    def __init__(self, max_entries: int = CACHE_MAX_ENTRIES, ttl: float = CACHE_TTL,
+                 max_tags: int = CACHE_MAX_TAGS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_tags = max(1, max_tags)
+        self._entries: 'OrderedDict[Hashable, CachedResponse]' = OrderedDict()
+        self._by_tag: Dict[str, set] = {}
+        self._generation = 0
+        self._invalidated: 'OrderedDict[str, int]' = OrderedDict()
+        self._floor = 0
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0, 'expirations': 0,
+                       'invalidations': 0, 'not_modified': 0}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 and self.ttl > 0
+
+    def get(self, key: Hashable) -> Optional[CachedResponse]:
+        """Fresh entry for a key, or None (counted as a miss)"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires <= time.monotonic():
+                self._remove(key)
+                self._stats['expirations'] += 1
+                entry = None
+            if entry is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return entry
+
+    def generation(self) -> int:
+        """Invalidation counter, taken before computing a response"""
+        with self._lock:
+            return self._generation
+
+    def put(self, key: Hashable, body: bytes, mimetype: str, tags: Tuple[str, ...],
+            generation: int) -> CachedResponse:
+        """Store a response unless one of its tags was invalidated meanwhile"""
+        entry = CachedResponse(
+            body=body,
+            etag=hashlib.blake2b(body, digest_size=16).hexdigest(),
+            mimetype=mimetype,
+            expires=time.monotonic() + self.ttl,
+            tags=tags,
+        )
+        with self._lock:
+            if any(self._invalidated.get(tag, self._floor) > generation for tag in tags):
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for tag in tags:
+                self._by_tag.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self._stats['evictions'] += 1
+        return entry
+
+    def _remove(self, key: Hashable) -> None:
+        """Drop an entry and its tag links (lock held)"""
+        entry = self._entries.pop(key)
+        for tag in entry.tags:
+            keys = self._by_tag.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_tag[tag]
+
+    def invalidate(self, *tags: str) -> int:
+        """Evict every entry carrying any of the tags; returns how many"""
+        removed = 0
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                self._invalidated[tag] = self._generation
+                self._invalidated.move_to_end(tag)
+                for key in list(self._by_tag.get(tag, ())):
+                    self._remove(key)
+                    removed += 1
+            while len(self._invalidated) > self.max_tags:
+                _, self._floor = self._invalidated.popitem(last=False)
+            self._stats['invalidations'] += removed
+        return removed
+
+    def count_not_modified(self) -> None:
+        with self._lock:
+            self._stats['not_modified'] += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._by_tag.clear()
+
+    def stats(self) -> Dict[str, object]:
+        """Cache counters for /api/health"""
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['entries'] = len(self._entries)
+            snapshot['invalidated_tags'] = len(self._invalidated)
+        snapshot['max_entries'] = self.max_entries
+        snapshot['ttl_seconds'] = self.ttl
+        lookups = snapshot['hits'] + snapshot['misses']
+        snapshot['hit_ratio'] = round(snapshot['hits'] / lookups, 4) if lookups else 0.0
+        return snapshot
@@ -0,0 +1,282 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock SQLite connection layer
+Pooled, WAL-mode connections with context-managed transactions
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from metrics import TracedConnection
+
+# Pool tuning (overridable from the environment for deployment)
+POOL_SIZE = int(os.environ.get('TETROHASH_DB_POOL_SIZE', 8))
+POOL_TIMEOUT = float(os.environ.get('TETROHASH_DB_POOL_TIMEOUT', 10.0))
+BUSY_TIMEOUT_MS = int(os.environ.get('TETROHASH_DB_BUSY_TIMEOUT_MS', 5000))
+CACHE_SIZE_KIB = int(os.environ.get('TETROHASH_DB_CACHE_SIZE_KIB', 16384))
+MMAP_SIZE = int(os.environ.get('TETROHASH_DB_MMAP_SIZE', 256 * 1024 * 1024))
+SYNCHRONOUS = os.environ.get('TETROHASH_DB_SYNCHRONOUS', 'NORMAL')
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection becomes available in time"""
+
+
+class ConnectionPool:
+    """Bounded pool of SQLite connections opened in WAL mode.
+
+    Connections are handed out one caller at a time and returned to an
+    idle stack afterwards, so the connect + PRAGMA cost is paid once per
+    connection instead of once per request. The pool is fork-aware: a
+    gunicorn worker forked from a parent that already opened connections
+    discards the inherited ones and starts fresh.
+    """
+
+    def __init__(self, db_file: str, max_size: int = POOL_SIZE,
+                 timeout: float = POOL_TIMEOUT):
+        self.db_file = db_file
+        self.max_size = max(1, max_size)
+        self.timeout = timeout
+        self._idle: List[sqlite3.Connection] = []
+        self._size = 0
+        self._pid = os.getpid()
+        self._cond = threading.Condition(threading.Lock())
+        self._local = threading.local()
+        self._stats = {
+            'connections_opened': 0,
+            'connections_closed': 0,
+            'checkouts': 0,
+            'waits': 0,
+            'wait_time_ms': 0.0,
+            'transactions': 0,
+            'rollbacks': 0,
+        }
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        """Bump a stats counter"""
+        with self._cond:
+            self._stats[key] += amount
+
+    def _open(self) -> sqlite3.Connection:
+        """Open and tune a new connection"""
+        conn = sqlite3.connect(
+            self.db_file,
+            timeout=BUSY_TIMEOUT_MS / 1000.0,
+            isolation_level=None,  # transactions are explicit, see transaction()
+            check_same_thread=False,
+            factory=TracedConnection,  # times statements in sampled requests (metrics.py)
+        )
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(f'PRAGMA synchronous={SYNCHRONOUS}')
+        conn.execute(f'PRAGMA busy_timeout={BUSY_TIMEOUT_MS}')
+        conn.execute(f'PRAGMA cache_size=-{CACHE_SIZE_KIB}')
+        conn.execute(f'PRAGMA mmap_size={MMAP_SIZE}')
+        conn.execute('PRAGMA temp_store=MEMORY')
+        self._stats['connections_opened'] += 1
+        return conn
+
+    def _check_fork(self) -> None:
+        """Drop connections inherited across a fork (caller holds the lock)"""
+        pid = os.getpid()
+        if pid != self._pid:
+            self._idle = []
+            self._size = 0
+            self._pid = pid
+            self._local = threading.local()
+
+    def acquire(self) -> sqlite3.Connection:
+        """Check a connection out of the pool, opening one if allowed"""
+        started = time.perf_counter()
+        waited = False
+        with self._cond:
+            self._check_fork()
+            while True:
+                if self._idle:
+                    conn = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    try:
+                        conn = self._open()
+                    except Exception:
+                        self._size -= 1
+                        self._cond.notify()
+                        raise
+                    break
+                waited = True
+                remaining = self.timeout - (time.perf_counter() - started)
+                if remaining <= 0 or not self._cond.wait(remaining):
+                    if not self._idle and self._size >= self.max_size:
+                        raise PoolTimeout(
+                            f'No database connection available after {self.timeout}s'
+                        )
+            self._stats['checkouts'] += 1
+            if waited:
+                self._stats['waits'] += 1
+                self._stats['wait_time_ms'] += (time.perf_counter() - started) * 1000
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        """Return a connection to the pool"""
+        if conn.in_transaction:
+            # A caller bailed out mid-transaction; never hand that state on
+            try:
+                conn.rollback()
+                self._count('rollbacks')
+            except sqlite3.Error:
+                self.discard(conn)
+                return
+        with self._cond:
+            if os.getpid() != self._pid:
+                return
+            self._idle.append(conn)
+            self._cond.notify()
+
+    def discard(self, conn: sqlite3.Connection) -> None:
+        """Close a broken connection instead of returning it"""
+        try:
+            conn.close()
+        except sqlite3.Error:
+            pass
+        with self._cond:
+            self._size -= 1
+            self._stats['connections_closed'] += 1
+            self._cond.notify()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        """Borrow a connection in autocommit mode (reads, single statements).
+
+        Nested use on the same thread reuses the connection already held,
+        so helpers can be called from inside a transaction() block.
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+
+        conn = self.acquire()
+        self._local.conn = conn
+        try:
+            yield conn
+        finally:
+            self._local.conn = None
+            self.release(conn)
+
+    @contextmanager
+    def transaction(self, immediate: bool = True) -> Iterator[sqlite3.Connection]:
+        """Run a block inside one transaction; commit on success, roll back on error.
+
+        BEGIN IMMEDIATE takes the writer lock up front, so concurrent writers
+        queue on busy_timeout instead of failing a lock upgrade mid-transaction
+        with 'database is locked'. Nested calls join the outer transaction.
+        """
+        with self.connection() as conn:
+            if conn.in_transaction:
+                yield conn
+                return
+
+            conn.execute('BEGIN IMMEDIATE' if immediate else 'BEGIN')
+            self._local.after_commit = []
+            try:
+                yield conn
+            except BaseException:
+                self._local.after_commit = None
+                if conn.in_transaction:
+                    conn.rollback()
+                self._count('rollbacks')
+                raise
+            else:
+                callbacks, self._local.after_commit = self._local.after_commit, None
+                conn.commit()
+                self._count('transactions')
+                for callback in callbacks:
+                    callback()
+
+    @contextmanager
+    def savepoint(self, name: str = 'nested') -> Iterator[sqlite3.Connection]:
+        """Partial rollback scope inside the current thread's transaction.
+
+        On error the savepoint's writes are undone and so are any
+        after_commit callbacks registered within it, then the error is
+        re-raised for the caller to handle.
+        """
+        with self.connection() as conn:
+            pending = getattr(self._local, 'after_commit', None)
+            mark = len(pending) if pending is not None else 0
+            conn.execute(f'SAVEPOINT {name}')
+            try:
+                yield conn
+            except BaseException:
+                conn.execute(f'ROLLBACK TO {name}')
+                conn.execute(f'RELEASE {name}')
+                if pending is not None:
+                    del pending[mark:]
+                raise
+            else:
+                conn.execute(f'RELEASE {name}')
+
+    def after_commit(self, callback: Callable[[], None]) -> None:
+        """Run a callback once the current thread's transaction commits.
+
+        Used to update in-process state (indexes, caches) only for writes
+        that actually became durable. Outside a transaction it runs at once.
+        """
+        pending = getattr(self._local, 'after_commit', None)
+        if pending is None:
+            callback()
+        else:
+            pending.append(callback)
+
+    def close_all(self) -> None:
+        """Close every idle connection (used at shutdown and in tests)"""
+        with self._cond:
+            for conn in self._idle:
+                try:
+                    conn.close()
+                except sqlite3.Error:
+                    pass
+                self._stats['connections_closed'] += 1
+            self._size -= len(self._idle)
+            self._idle = []
+
+    def stats(self) -> Dict[str, object]:
+        """Snapshot of pool counters for /api/health"""
+        with self._cond:
+            snapshot = dict(self._stats)
+            snapshot['wait_time_ms'] = round(snapshot['wait_time_ms'], 3)
+            snapshot['size'] = self._size
+            snapshot['idle'] = len(self._idle)
+            snapshot['in_use'] = self._size - len(self._idle)
+            snapshot['max_size'] = self.max_size
+            snapshot['journal_mode'] = 'wal'
+            snapshot['synchronous'] = SYNCHRONOUS.lower()
+        return snapshot
+
+
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(db_file: str) -> ConnectionPool:
+    """Return the process-wide pool for a database file"""
+    with _pools_lock:
+        pool = _pools.get(db_file)
+        if pool is None:
+            pool = ConnectionPool(db_file)
+            _pools[db_file] = pool
+        return pool
+
+
+def reset_pool(db_file: Optional[str] = None) -> None:
+    """Close and forget pooled connections (all files if none is given)"""
+    with _pools_lock:
+        keys = [db_file] if db_file else list(_pools)
+        for key in keys:
+            pool = _pools.pop(key, None)
+            if pool is not None:
+                pool.close_all()
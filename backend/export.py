@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock bulk export
+Streams tables as NDJSON or CSV from a consistent WAL snapshot, optionally gzipped
+"""
+
+import argparse
+import csv
+import io
+import json
+import os
+import pathlib
+import sqlite3
+import sys
+import zlib
+from typing import Iterator, List, Optional
+
+from db import BUSY_TIMEOUT_MS
+
+# Bearer token for /api/export (the route is disabled while this is unset)
+EXPORT_TOKEN = os.environ.get('TETROHASH_EXPORT_TOKEN', '')
+EXPORT_CHUNK_ROWS = int(os.environ.get('TETROHASH_EXPORT_CHUNK_ROWS', 1000))
+GZIP_LEVEL = int(os.environ.get('TETROHASH_EXPORT_GZIP_LEVEL', 6))
+
+# Exportable tables and the timestamp column `since` filters on
+EXPORT_TABLES = {
+    'games': 'created_at',
+    'players': 'created_at',
+    'bitcoin_puzzles': 'created_at',
+    'leaderboards': 'updated_at',
+}
+# Columns exported as an expression instead: unsolved preimages are puzzle answers
+REDACTED_COLUMNS = {
+    'bitcoin_puzzles': {'preimage': 'CASE WHEN solved_by IS NOT NULL THEN preimage END'},
+}
+FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+class ExportError(ValueError):
+    """Raised for an unknown table or format"""
+
+
+class Export:
+    """One table export, read from a single snapshot of the database.
+
+    open() starts a read transaction on a dedicated read-only connection,
+    so the export sees the table exactly as it was at that moment while
+    games keep being written (WAL readers never block writers, and the
+    request pool keeps all of its connections). Rows are pulled from the
+    cursor `chunk_rows` at a time, encoded, optionally gzipped and yielded,
+    so memory stays flat however large the table is.
+
+    `since_id` exports rows with id > since_id and `since` rows whose
+    timestamp column is >= since. `high_water` is the largest id in the
+    snapshot; passing it back as since_id next time exports only newer rows.
+    """
+
+    def __init__(self, db_file: str, table: str, fmt: str = 'ndjson',
+                 since_id: Optional[int] = None, since: Optional[str] = None,
+                 compress: bool = False, chunk_rows: int = EXPORT_CHUNK_ROWS):
+        if table not in EXPORT_TABLES:
+            raise ExportError(f'Unknown table: {table} (one of {", ".join(EXPORT_TABLES)})')
+        if fmt not in FORMATS:
+            raise ExportError(f'Unknown format: {fmt} (one of {", ".join(FORMATS)})')
+        self.db_file = db_file
+        self.table = table
+        self.fmt = fmt
+        self.since_id = since_id
+        self.since = since
+        self.compress = compress
+        self.chunk_rows = max(1, chunk_rows)
+        self.columns: List[str] = []
+        self.high_water: Optional[int] = None
+        self.rows = 0
+        self._conn: Optional[sqlite3.Connection] = None
+
+    @property
+    def mimetype(self) -> str:
+        return FORMATS[self.fmt]
+
+    def open(self) -> 'Export':
+        """Pin the snapshot and read the column list and high-water id"""
+        uri = pathlib.Path(self.db_file).absolute().as_uri() + '?mode=ro'
+        self._conn = sqlite3.connect(uri, uri=True, isolation_level=None,
+                                     timeout=BUSY_TIMEOUT_MS / 1000.0, check_same_thread=False)
+        # The snapshot is taken by the first read after BEGIN and held until close()
+        self._conn.execute('BEGIN')
+        self.columns = [row[1] for row in self._conn.execute(f'PRAGMA table_info({self.table})')]
+        self.high_water = self._conn.execute(f'SELECT MAX(id) FROM {self.table}').fetchone()[0]
+        return self
+
+    def close(self) -> None:
+        if self._conn is not None:
+            self._conn.rollback()
+            self._conn.close()
+            self._conn = None
+
+    def _chunks(self) -> Iterator[list]:
+        where, params = ['id <= ?'], [self.high_water or 0]
+        if self.since_id is not None:
+            where.append('id > ?')
+            params.append(self.since_id)
+        if self.since is not None:
+            where.append(f'{EXPORT_TABLES[self.table]} >= ?')
+            params.append(self.since)
+        redacted = REDACTED_COLUMNS.get(self.table, {})
+        select = ', '.join(redacted.get(column, column) for column in self.columns)
+        cursor = self._conn.execute(f'''
+            SELECT {select} FROM {self.table}
+            WHERE {' AND '.join(where)} ORDER BY id
+        ''', params)
+        while True:
+            rows = cursor.fetchmany(self.chunk_rows)
+            if not rows:
+                return
+            self.rows += len(rows)
+            yield rows
+
+    def _encoded(self) -> Iterator[bytes]:
+        if self.fmt == 'csv':
+            buffer = io.StringIO()
+            writer = csv.writer(buffer, lineterminator='\n')
+            writer.writerow(self.columns)
+            for rows in self._chunks():
+                writer.writerows(rows)
+                yield buffer.getvalue().encode()
+                buffer.seek(0)
+                buffer.truncate()
+            if buffer.tell():  # header only
+                yield buffer.getvalue().encode()
+        else:
+            for rows in self._chunks():
+                yield ''.join(json.dumps(dict(zip(self.columns, row)), separators=(',', ':')) + '\n'
+                              for row in rows).encode()
+
+    def __iter__(self) -> Iterator[bytes]:
+        """Encoded (and compressed) chunks; closes the snapshot when exhausted"""
+        if self._conn is None:
+            self.open()
+        try:
+            if not self.compress:
+                yield from self._encoded()
+                return
+            # wbits=31: a gzip member, written incrementally
+            gzip = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)
+            for chunk in self._encoded():
+                compressed = gzip.compress(chunk)
+                if compressed:
+                    yield compressed
+            yield gzip.flush()
+        finally:
+            self.close()
+
+
+def main():
+    """Export a table to a file or stdout"""
+    parser = argparse.ArgumentParser(description='Stream a TetroHashUnlock table as NDJSON or CSV')
+    parser.add_argument('table', choices=sorted(EXPORT_TABLES))
+    parser.add_argument('--db', default='tetrohash.db')
+    parser.add_argument('--format', choices=sorted(FORMATS), default='ndjson')
+    parser.add_argument('--since-id', type=int, help='only rows with a larger id')
+    parser.add_argument('--since', help='only rows stamped at or after this time (YYYY-MM-DD[ HH:MM:SS])')
+    parser.add_argument('--gzip', action='store_true', help='gzip the output')
+    parser.add_argument('--output', '-o', help='output file (default: stdout)')
+    args = parser.parse_args()
+
+    export = Export(args.db, args.table, args.format, args.since_id, args.since, args.gzip).open()
+    out = open(args.output, 'wb') if args.output else sys.stdout.buffer
+    try:
+        for chunk in export:
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+    # Status goes to stderr so stdout stays a clean export
+    print(f"✅ Exported {export.rows} {args.table} rows "
+          f"(next incremental run: --since-id {export.high_water or args.since_id or 0})",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
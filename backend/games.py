@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock game recording
+Validation and the write path shared by single and batch game submission
+"""
+
+import base64
+import sqlite3
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import leaderboard
+import sats_ledger
+import stats
+from leaderboard import LeaderboardIndex
+
+GAME_MODES = ['normal', 'puzzle', 'ai-battle', 'learning']
+REQUIRED_FIELDS = ['player_id', 'game_mode', 'score', 'lines_cleared', 'level_reached', 'sats_earned']
+INTEGER_FIELDS = ['player_id', 'score', 'lines_cleared', 'level_reached', 'sats_earned']
+
+INSERT_GAME_SQL = '''
+    INSERT INTO games (player_id, game_mode, score, lines_cleared, level_reached, sats_earned, duration_seconds, ai_enabled)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+'''
+
+HISTORY_FIELDS = ('game_id', 'game_mode', 'score', 'lines_cleared', 'level_reached',
+                  'sats_earned', 'duration_seconds', 'ai_enabled', 'created_at')
+
+Cursor = Tuple[str, int]  # (created_at, id) of the last game on the previous page
+
+
+def validate(data: Any) -> Optional[str]:
+    """Return an error message for a malformed game record, else None"""
+    if not isinstance(data, dict):
+        return 'Game record must be an object'
+    for field in REQUIRED_FIELDS:
+        if field not in data:
+            return f'Missing required field: {field}'
+    for field in INTEGER_FIELDS:
+        if not isinstance(data[field], int) or isinstance(data[field], bool):
+            return f'Field must be an integer: {field}'
+    if data['game_mode'] not in GAME_MODES:
+        return 'Invalid game mode'
+    return None
+
+
+def _row(data: Dict[str, Any]) -> tuple:
+    return (
+        data['player_id'],
+        data['game_mode'],
+        data['score'],
+        data['lines_cleared'],
+        data['level_reached'],
+        data['sats_earned'],
+        data.get('duration_seconds', 0),
+        data.get('ai_enabled', False)
+    )
+
+
+def record_game(conn: sqlite3.Connection, data: Dict[str, Any],
+                rankings: LeaderboardIndex) -> int:
+    """Store one validated game inside the caller's transaction"""
+    # Insert game record
+    cursor = conn.execute(INSERT_GAME_SQL, _row(data))
+    game_id = cursor.lastrowid
+
+    # Update player stats (the ledger maintains total_sats)
+    conn.execute('''
+        UPDATE players
+        SET games_played = games_played + 1,
+            high_score = MAX(high_score, ?)
+        WHERE id = ?
+    ''', (data['score'], data['player_id']))
+    sats_ledger.credit_player(conn, data['player_id'], data['sats_earned'], 'game_reward',
+                              f'game:{game_id}')
+
+    stats.bump(conn, total_games=1, total_sats_earned=data['sats_earned'])
+
+    # Update leaderboard and ranking index
+    leaderboard.record_score(conn, data['game_mode'], data['player_id'], data['score'])
+    rankings.record(conn, data['game_mode'], data['player_id'], data['score'], game_id)
+    return game_id
+
+
+def record_games(conn: sqlite3.Connection, games: List[Dict[str, Any]],
+                 rankings: LeaderboardIndex) -> List[int]:
+    """Store many validated games inside the caller's transaction.
+
+    One executemany for the inserts, one UPDATE per distinct player, one
+    ledger batch, one counter bump, and at most one leaderboard refresh per
+    game mode.
+    Returns the new game ids in input order.
+    """
+    if not games:
+        return []
+
+    conn.executemany(INSERT_GAME_SQL, [_row(data) for data in games])
+    # The writer lock is held, so AUTOINCREMENT handed out a contiguous range
+    last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+    game_ids = list(range(last_id - len(games) + 1, last_id + 1))
+
+    # Fold per-player stats into a single UPDATE each
+    totals: Dict[int, List[int]] = {}
+    for data in games:
+        played, high = totals.get(data['player_id'], (0, 0))
+        totals[data['player_id']] = [played + 1, max(high, data['score'])]
+    conn.executemany('''
+        UPDATE players
+        SET games_played = games_played + ?,
+            high_score = MAX(high_score, ?)
+        WHERE id = ?
+    ''', [(played, high, player_id) for player_id, (played, high) in totals.items()])
+    sats_ledger.post_many(conn, [
+        sats_ledger.reward('game_reward', data['player_id'], data['sats_earned'], f'game:{game_id}')
+        for game_id, data in zip(game_ids, games)
+    ])
+
+    stats.bump(conn, total_games=len(games),
+               total_sats_earned=sum(data['sats_earned'] for data in games))
+
+    # Best game per (mode, player); earliest id wins a tie, as in the index
+    best: Dict[tuple, tuple] = {}
+    for game_id, data in zip(game_ids, games):
+        key = (data['game_mode'], data['player_id'])
+        if key not in best or data['score'] > best[key][0]:
+            best[key] = (data['score'], game_id)
+
+    for mode in {data['game_mode'] for data in games}:
+        top_score = max(score for (m, _), (score, _) in best.items() if m == mode)
+        if _places(conn, mode, top_score):
+            leaderboard.rebuild(conn, mode)
+
+    for (mode, player_id), (score, game_id) in best.items():
+        rankings.record(conn, mode, player_id, score, game_id)
+    return game_ids
+
+
+def _places(conn: sqlite3.Connection, game_mode: str, score: int) -> bool:
+    """Whether a score would enter the cached leaderboard"""
+    entries, lowest = conn.execute('''
+        SELECT COUNT(*), MIN(score) FROM leaderboards WHERE game_mode = ?
+    ''', (game_mode,)).fetchone()
+    return entries < leaderboard.LEADERBOARD_SIZE or score > lowest
+
+
+def encode_cursor(created_at: str, game_id: int) -> str:
+    """Opaque page cursor for the game after which the next page starts"""
+    return base64.urlsafe_b64encode(f'{created_at}|{game_id}'.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token: str) -> Cursor:
+    """Inverse of encode_cursor; raises ValueError for anything it did not produce"""
+    raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)).decode()
+    created_at, game_id = raw.rsplit('|', 1)
+    return created_at, int(game_id)
+
+
+def history(conn: sqlite3.Connection, player_id: int, game_mode: Optional[str] = None,
+            limit: int = 50, after: Optional[Cursor] = None) -> Iterator[tuple]:
+    """A player's games, newest first, as a lazy cursor over HISTORY_FIELDS rows.
+
+    Keyset pagination: each page seeks straight to `after` in the
+    (player_id, [game_mode,] created_at, id) index and reads `limit` rows,
+    so page 1000 costs the same as page 1. Rows are yielded as SQLite
+    produces them and are never collected into a list.
+    """
+    where, params = ['player_id = ?'], [player_id]
+    if game_mode is not None:
+        where.append('game_mode = ?')
+        params.append(game_mode)
+    if after is not None:
+        # created_at has one-second resolution; id breaks ties
+        where.append('(created_at, id) < (?, ?)')
+        params.extend(after)
+    return conn.execute(f'''
+        SELECT {', '.join(('id',) + HISTORY_FIELDS[1:])} FROM games
+        WHERE {' AND '.join(where)}
+        ORDER BY created_at DESC, id DESC
+        LIMIT ?
+    ''', (*params, limit))
@@ -0,0 +1,240 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock write-behind ingestion
+Durable local queue for game submissions, drained by a background writer
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Tuple
+
+from db import ConnectionPool, get_pool
+
+ASYNC_SUBMIT = os.environ.get('TETROHASH_ASYNC_SUBMIT', '0') == '1'
+QUEUE_FILE = os.environ.get('TETROHASH_QUEUE_FILE', 'tetrohash_queue.db')
+QUEUE_MAX_DEPTH = int(os.environ.get('TETROHASH_QUEUE_MAX_DEPTH', 10000))
+QUEUE_BATCH_SIZE = int(os.environ.get('TETROHASH_QUEUE_BATCH_SIZE', 500))
+# Group-commit window: how long the writer waits for more entries after a wake-up
+QUEUE_COMMIT_INTERVAL = float(os.environ.get('TETROHASH_QUEUE_COMMIT_INTERVAL', 0.05))
+
+Writer = Callable[[sqlite3.Connection, List[Dict[str, Any]]], Any]
+
+
+class QueueFull(Exception):
+    """Raised when the queue is at its configured depth (back-pressure)"""
+
+
+class IngestQueue:
+    """Append-only SQLite journal of accepted-but-unwritten game records.
+
+    Request handlers append to a separate queue database, so they never
+    wait on the main database's writer lock. A writer thread drains
+    entries in batches and hands each batch to `writer` inside one main
+    database transaction. That transaction also advances a per-queue
+    watermark in `ingest_state`. Every entry is therefore applied exactly
+    once, even if the process dies between the commit and the queue
+    cleanup. On startup, anything above the watermark is replayed.
+    """
+
+    def __init__(self, pool: ConnectionPool, writer: Writer,
+                 queue_file: str = QUEUE_FILE, max_depth: int = QUEUE_MAX_DEPTH,
+                 batch_size: int = QUEUE_BATCH_SIZE,
+                 commit_interval: float = QUEUE_COMMIT_INTERVAL):
+        self.pool = pool
+        self.writer = writer
+        self.queue_pool = get_pool(queue_file)
+        self.max_depth = max_depth
+        self.batch_size = batch_size
+        self.commit_interval = commit_interval
+        self.queue_id = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._drain_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._thread = None
+        self._stats = {'enqueued': 0, 'rejected_full': 0, 'drained': 0,
+                       'batches': 0, 'failed': 0, 'last_batch_ms': 0.0}
+
+    def open(self) -> None:
+        """Create the queue journal and learn its identity"""
+        with self.queue_pool.transaction() as qconn:
+            qconn.execute('''
+                CREATE TABLE IF NOT EXISTS pending_games (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    payload TEXT NOT NULL,
+                    enqueued_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            qconn.execute('''
+                CREATE TABLE IF NOT EXISTS failed_games (
+                    id INTEGER PRIMARY KEY,
+                    payload TEXT NOT NULL,
+                    error TEXT NOT NULL,
+                    failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            qconn.execute('''
+                CREATE TABLE IF NOT EXISTS queue_meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL
+                )
+            ''')
+            # A recreated queue file restarts its ids, so watermarks are per file
+            qconn.execute("INSERT OR IGNORE INTO queue_meta (key, value) VALUES ('queue_id', ?)",
+                          (uuid.uuid4().hex,))
+            self.queue_id = qconn.execute(
+                "SELECT value FROM queue_meta WHERE key = 'queue_id'").fetchone()[0]
+
+    def _ensure_open(self) -> None:
+        if self.queue_id is None:
+            self.open()
+
+    def enqueue(self, record: Dict[str, Any]) -> Tuple[int, int]:
+        """Durably append a validated record; returns (entry id, queue depth)"""
+        self._ensure_open()
+        payload = json.dumps(record, separators=(',', ':'))
+        with self.queue_pool.transaction() as qconn:
+            depth = qconn.execute('SELECT COUNT(*) FROM pending_games').fetchone()[0]
+            if depth >= self.max_depth:
+                self._count('rejected_full')
+                raise QueueFull(f'Ingestion queue is full ({depth} pending)')
+            entry_id = qconn.execute('INSERT INTO pending_games (payload) VALUES (?)',
+                                     (payload,)).lastrowid
+        self._count('enqueued')
+        self._wake.set()
+        return entry_id, depth + 1
+
+    def depth(self) -> int:
+        """Entries accepted but not yet cleaned up after a drain"""
+        if self.queue_id is None:
+            return 0
+        with self.queue_pool.connection() as qconn:
+            return qconn.execute('SELECT COUNT(*) FROM pending_games').fetchone()[0]
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def drain_once(self) -> int:
+        """Write one batch past the watermark; returns how many entries were applied"""
+        with self.queue_pool.connection() as qconn:
+            if not qconn.execute('SELECT 1 FROM pending_games LIMIT 1').fetchone():
+                return 0  # don't take the main writer lock for an empty queue
+
+        started = time.perf_counter()
+        with self.pool.transaction() as conn:
+            row = conn.execute('SELECT last_id FROM ingest_state WHERE queue_id = ?',
+                               (self.queue_id,)).fetchone()
+            last_id = row[0] if row else 0
+            with self.queue_pool.connection() as qconn:
+                entries = qconn.execute('''
+                    SELECT id, payload FROM pending_games
+                    WHERE id > ? ORDER BY id LIMIT ?
+                ''', (last_id, self.batch_size)).fetchall()
+
+            if entries:
+                applied = self._apply(conn, entries)
+                last_id = entries[-1][0]
+                conn.execute('''
+                    INSERT INTO ingest_state (queue_id, last_id) VALUES (?, ?)
+                    ON CONFLICT (queue_id) DO UPDATE
+                    SET last_id = excluded.last_id, updated_at = CURRENT_TIMESTAMP
+                ''', (self.queue_id, last_id))
+
+        # Safe to lose: anything at or below the watermark is skipped on replay
+        with self.queue_pool.transaction() as qconn:
+            qconn.execute('DELETE FROM pending_games WHERE id <= ?', (last_id,))
+
+        if entries:
+            self._count('drained', applied)
+            self._count('batches')
+            with self._stats_lock:
+                self._stats['last_batch_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return len(entries)
+
+    def _apply(self, conn: sqlite3.Connection, entries: List[tuple]) -> int:
+        """Hand a batch to the writer, isolating records that make it fail"""
+        records = [json.loads(payload) for _, payload in entries]
+        try:
+            with self.pool.savepoint('ingest_batch'):
+                self.writer(conn, records)
+            return len(records)
+        except Exception:
+            pass
+
+        # Retry one by one so a single poison record cannot block the queue
+        applied = 0
+        for (entry_id, payload), record in zip(entries, records):
+            try:
+                with self.pool.savepoint('ingest_record'):
+                    self.writer(conn, [record])
+                applied += 1
+            except Exception as e:
+                with self.queue_pool.transaction() as qconn:
+                    qconn.execute('''
+                        INSERT OR REPLACE INTO failed_games (id, payload, error)
+                        VALUES (?, ?, ?)
+                    ''', (entry_id, payload, str(e)))
+                self._count('failed')
+        return applied
+
+    def drain(self, timeout: float = 30.0) -> int:
+        """Synchronously write everything queued so far (flush)"""
+        self._ensure_open()
+        deadline = time.monotonic() + timeout
+        total = 0
+        with self._drain_lock:
+            while time.monotonic() < deadline:
+                written = self.drain_once()
+                if not written:
+                    break
+                total += written
+        return total
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(timeout=1.0)
+            if self._stop.is_set():
+                break
+            self._wake.clear()
+            # Let a burst accumulate so it lands in one group commit
+            time.sleep(self.commit_interval)
+            try:
+                self.drain()
+            except Exception as e:
+                print(f"⚠️  Ingestion writer error: {e}")
+                time.sleep(1.0)
+
+    def start(self) -> None:
+        """Replay anything left from a previous run, then start the writer thread"""
+        self._ensure_open()
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='ingest-writer', daemon=True)
+        self._thread.start()
+        self._wake.set()
+
+    def stop(self, drain: bool = True) -> None:
+        """Stop the writer thread, optionally flushing what is queued"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        if drain:
+            self.drain()
+
+    def stats(self) -> Dict[str, object]:
+        """Queue counters for /api/game/queue"""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot['depth'] = self.depth()
+        snapshot['max_depth'] = self.max_depth
+        snapshot['batch_size'] = self.batch_size
+        snapshot['writer_running'] = bool(self._thread and self._thread.is_alive())
+        return snapshot
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock leaderboard maintenance
+Keeps the cached `leaderboards` table in sync with `games` incrementally
+and serves per-player rankings from an in-memory index
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from sortedcontainers import SortedList
+
+from db import ConnectionPool
+
+LEADERBOARD_SIZE = 100
+# How stale another worker's submits may be before a reader catches up
+SYNC_INTERVAL = float(os.environ.get('TETROHASH_LEADERBOARD_SYNC_SECONDS', 1.0))
+
+
+def record_score(conn: sqlite3.Connection, game_mode: str, player_id: int,
+                 score: int) -> Optional[int]:
+    """Place a freshly submitted score on the cached leaderboard.
+
+    Runs on the caller's connection and inside the caller's transaction.
+    Only the leaderboard rows are read (never `games`), so the cost is
+    bounded by LEADERBOARD_SIZE no matter how many games exist. A score
+    that does not beat the current last place touches nothing; otherwise
+    only the ranks at or below the new entry shift down by one.
+
+    Ties keep the earlier game ahead, matching a rebuild ordered by
+    score DESC, id ASC. Returns the new rank, or None if it did not place.
+    """
+    cursor = conn.cursor()
+
+    cursor.execute('''
+        SELECT COUNT(*), MIN(score) FROM leaderboards WHERE game_mode = ?
+    ''', (game_mode,))
+    entries, lowest = cursor.fetchone()
+    if entries >= LEADERBOARD_SIZE and score <= lowest:
+        return None
+
+    cursor.execute('''
+        SELECT COUNT(*) FROM leaderboards WHERE game_mode = ? AND score >= ?
+    ''', (game_mode, score))
+    rank = cursor.fetchone()[0] + 1
+
+    # Shift everything at or below the new rank, drop whoever falls off
+    cursor.execute('''
+        UPDATE leaderboards SET rank = rank + 1
+        WHERE game_mode = ? AND rank >= ?
+    ''', (game_mode, rank))
+    cursor.execute('''
+        DELETE FROM leaderboards WHERE game_mode = ? AND rank > ?
+    ''', (game_mode, LEADERBOARD_SIZE))
+    cursor.execute('''
+        INSERT INTO leaderboards (game_mode, player_id, score, rank)
+        VALUES (?, ?, ?, ?)
+    ''', (game_mode, player_id, score, rank))
+    return rank
+
+
+def rebuild(conn: sqlite3.Connection, game_mode: str) -> int:
+    """Recompute a mode's leaderboard from `games` (repair / backfill only)"""
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM leaderboards WHERE game_mode = ?', (game_mode,))
+    cursor.execute('''
+        INSERT INTO leaderboards (game_mode, player_id, score, rank)
+        SELECT game_mode, player_id, score,
+               ROW_NUMBER() OVER (ORDER BY score DESC, id ASC)
+        FROM games
+        WHERE game_mode = ?
+        ORDER BY score DESC, id ASC
+        LIMIT ?
+    ''', (game_mode, LEADERBOARD_SIZE))
+    return cursor.rowcount
+
+
+class RankedLeaderboard:
+    """In-memory ranking of each player's best score for one game mode.
+
+    Entries are kept in a SortedList keyed by (-score, game_id), so higher
+    scores come first and an equal score reached earlier (lower game id)
+    ranks ahead. Top-N, rank-of-player and around-rank lookups are all
+    O(log n) plus the size of the slice returned.
+    """
+
+    def __init__(self, game_mode: str):
+        self.game_mode = game_mode
+        self._entries = SortedList()
+        self._players: Dict[int, Tuple[int, int, str, str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def upsert(self, player_id: int, username: str, score: int, game_id: int,
+               achieved_at: str) -> bool:
+        """Record a player's score if it beats their current best"""
+        key = (-score, game_id, player_id)
+        current = self._players.get(player_id)
+        if current is not None:
+            current_key = (-current[0], current[1], player_id)
+            if current_key <= key:
+                return False
+            self._entries.remove(current_key)
+        self._entries.add(key)
+        self._players[player_id] = (score, game_id, username, achieved_at)
+        return True
+
+    def _entry(self, rank: int, key: Tuple[int, int, int]) -> Dict[str, object]:
+        score, _, username, achieved_at = self._players[key[2]]
+        return {
+            'rank': rank,
+            'player_id': key[2],
+            'username': username,
+            'score': score,
+            'updated_at': achieved_at
+        }
+
+    def top(self, limit: int) -> List[Dict[str, object]]:
+        """Best `limit` players, highest first"""
+        return [self._entry(rank, key)
+                for rank, key in enumerate(self._entries[:limit], 1)]
+
+    def rank_of(self, player_id: int) -> Optional[Dict[str, object]]:
+        """A player's current rank, or None if they have no score"""
+        current = self._players.get(player_id)
+        if current is None:
+            return None
+        key = (-current[0], current[1], player_id)
+        return self._entry(self._entries.index(key) + 1, key)
+
+    def around(self, rank: int, radius: int) -> List[Dict[str, object]]:
+        """Players ranked within `radius` places of `rank`"""
+        start = max(rank - 1 - radius, 0)
+        return [self._entry(start + offset + 1, key)
+                for offset, key in enumerate(self._entries[start:rank + radius])]
+
+
+class LeaderboardIndex:
+    """Per-mode RankedLeaderboards backed by the `player_best_scores` table.
+
+    Writes go through to SQLite inside the caller's transaction and reach
+    memory only after commit. Other gunicorn workers' writes are picked up
+    by an incremental catch-up on `game_id` at most every `sync_interval`
+    seconds, so reads otherwise never touch the database. Restarting loads
+    one row per player and mode instead of aggregating `games`.
+    """
+
+    def __init__(self, pool: ConnectionPool, game_modes: Iterable[str],
+                 sync_interval: float = SYNC_INTERVAL):
+        self.pool = pool
+        self.sync_interval = sync_interval
+        self.boards = {mode: RankedLeaderboard(mode) for mode in game_modes}
+        self._usernames: Dict[int, str] = {}
+        self._watermark = 0
+        self._last_sync = 0.0
+        self._lock = threading.RLock()
+
+    def load(self) -> None:
+        """Rebuild every board from the persisted best scores"""
+        with self._lock:
+            for mode in self.boards:
+                self.boards[mode] = RankedLeaderboard(mode)
+            self._usernames = {}
+            self._watermark = 0
+            self._sync()
+
+    def _sync(self) -> None:
+        """Apply best-score rows committed since the last sync (lock held)"""
+        with self.pool.connection() as conn:
+            rows = conn.execute('''
+                SELECT b.game_mode, b.player_id, p.username, b.score, b.game_id, b.achieved_at
+                FROM player_best_scores b
+                JOIN players p ON b.player_id = p.id
+                WHERE b.game_id > ?
+                ORDER BY b.game_id
+            ''', (self._watermark,)).fetchall()
+        for mode, player_id, username, score, game_id, achieved_at in rows:
+            self._apply(mode, player_id, username, score, game_id, achieved_at)
+            self._watermark = max(self._watermark, game_id)
+        self._last_sync = time.monotonic()
+
+    def _apply(self, mode: str, player_id: int, username: str, score: int,
+               game_id: int, achieved_at: str) -> None:
+        board = self.boards.get(mode)
+        if board is None:  # only the configured modes are ranked
+            return
+        self._usernames[player_id] = username
+        board.upsert(player_id, username, score, game_id, achieved_at)
+
+    def stale(self) -> bool:
+        """Whether the next board() call will catch up from SQLite first"""
+        return time.monotonic() - self._last_sync >= self.sync_interval
+
+    def sync(self) -> None:
+        """Catch up with other workers now (lets async callers do it off the event loop)"""
+        with self._lock:
+            self._sync()
+
+    def board(self, game_mode: str) -> RankedLeaderboard:
+        """The board for a mode, caught up with other workers if stale"""
+        with self._lock:
+            if self.stale():
+                self._sync()
+            return self.boards[game_mode]
+
+    def record(self, conn: sqlite3.Connection, game_mode: str, player_id: int,
+               score: int, game_id: int) -> None:
+        """Write a submitted score through to SQLite, then to memory on commit"""
+        if game_mode not in self.boards:
+            return
+        username = self._usernames.get(player_id)
+        if username is None:
+            row = conn.execute('SELECT username FROM players WHERE id = ?',
+                               (player_id,)).fetchone()
+            if row is None:
+                return
+            username = row[0]
+
+        achieved_at = datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')
+        cursor = conn.execute('''
+            INSERT INTO player_best_scores (game_mode, player_id, score, game_id, achieved_at)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (game_mode, player_id) DO UPDATE
+            SET score = excluded.score,
+                game_id = excluded.game_id,
+                achieved_at = excluded.achieved_at
+            WHERE excluded.score > player_best_scores.score
+        ''', (game_mode, player_id, score, game_id, achieved_at))
+        if cursor.rowcount == 0:
+            return
+
+        def apply():
+            with self._lock:
+                self._apply(game_mode, player_id, username, score, game_id, achieved_at)
+
+        self.pool.after_commit(apply)
+
+
+def backfill_best_scores(conn: sqlite3.Connection) -> int:
+    """Populate `player_best_scores` from `games` (one-off, for old databases)"""
+    cursor = conn.execute('''
+        INSERT OR IGNORE INTO player_best_scores (game_mode, player_id, score, game_id, achieved_at)
+        SELECT game_mode, player_id, score, id, created_at
+        FROM (
+            SELECT id, game_mode, player_id, score, created_at,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY game_mode, player_id ORDER BY score DESC, id ASC
+                   ) AS position
+            FROM games
+            WHERE player_id IS NOT NULL
+        )
+        WHERE position = 1
+    ''')
+    return cursor.rowcount
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock API load test
+Concurrent latency and throughput per endpoint, in-process or over real HTTP
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+
+import migrations
+from benchmark import GAME_MODES, _game_records, seed_database
+from db import get_pool, reset_pool
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_NAME = 'tetrohash.db'  # server.DB_FILE (TETROHASH_DB_FILE) inside the data directory
+DATASETS = {'10k': 10_000, '1m': 1_000_000, '10m': 10_000_000}
+SEED_PLAYERS = 10000
+SERVER_START_TIMEOUT = 30.0
+
+# Endpoint scenarios, run one after another in this order. Solves use the
+# puzzles created by the generate scenario, so generate must run first.
+SCENARIOS = ['submit', 'leaderboard', 'stats', 'puzzle_generate', 'puzzle_solve']
+
+Request = Tuple[str, str, Optional[dict]]  # (method, path, json body)
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, float]:
+    """Latency percentiles (ms) and throughput for one scenario"""
+    ordered = sorted(latencies)
+    ms = lambda seconds: round(seconds * 1000, 3)
+    return {
+        'requests': len(ordered),
+        'errors': errors,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(ordered) / elapsed, 1) if elapsed else 0.0,
+        'mean_ms': ms(sum(ordered) / len(ordered)) if ordered else 0.0,
+        'p50_ms': ms(percentile(ordered, 50)),
+        'p95_ms': ms(percentile(ordered, 95)),
+        'p99_ms': ms(percentile(ordered, 99)),
+        'max_ms': ms(ordered[-1]) if ordered else 0.0,
+    }
+
+
+def prepare_database(data_dir: str, games: int) -> str:
+    """Seed data_dir/tetrohash.db with `games` synthetic games, reusing an earlier seed"""
+    db_file = os.path.join(data_dir, DB_NAME)
+    marker = os.path.join(data_dir, 'seeded.json')
+    if os.path.exists(db_file):
+        seeded = None
+        if os.path.exists(marker):
+            with open(marker) as f:
+                seeded = json.load(f).get('games')
+        if seeded != games:
+            raise SystemExit(f"❌ {db_file} was not seeded with {games:,} games; "
+                             f"use another --data-dir")
+        print(f"♻️  Reusing {db_file} (seeded with {games:,} games)")
+        migrations.migrate(get_pool(db_file))
+        reset_pool(db_file)
+        return db_file
+
+    # Seed the bare schema, then migrate: the later migrations backfill best
+    # scores, counters and ledger balances, and build indexes once at the end
+    print(f"🌱 Seeding {games:,} games into {db_file}...")
+    started = time.perf_counter()
+    pool = get_pool(db_file)
+    migrations.migrate(pool, target=1)
+    with pool.connection() as conn:
+        seed_database(conn, games, players=SEED_PLAYERS, puzzles=10000)
+    migrations.migrate(pool)
+    reset_pool(db_file)
+    with open(marker, 'w') as f:
+        json.dump({'games': games}, f)
+    print(f"   done in {time.perf_counter() - started:.1f}s")
+    return db_file
+
+
+class InProcessTransport:
+    """Flask test client in this process: the app and database, no network"""
+
+    name = 'inprocess'
+
+    def __init__(self, data_dir: str):
+        # server reads DB_FILE at import time; leave the caller's working directory alone
+        os.environ['TETROHASH_DB_FILE'] = os.path.join(os.path.abspath(data_dir), DB_NAME)
+        import server
+        server.app.config['RATE_LIMIT'] = False  # one client address: measure the app, not the limiter
+        server.init_db()
+        self.server = server
+
+    def client(self) -> Callable[[Request], Tuple[int, Optional[dict]]]:
+        client = self.server.app.test_client()
+
+        def send(request: Request):
+            method, path, body = request
+            response = client.open(path, method=method, json=body)
+            return response.status_code, response.get_json(silent=True)
+        return send
+
+    def close(self) -> None:
+        reset_pool(self.server.DB_FILE)
+
+
+class HTTPTransport:
+    """The API server in a subprocess, driven over keep-alive HTTP connections"""
+
+    name = 'http'
+
+    def __init__(self, data_dir: str):
+        import requests  # only needed for this transport
+        self.requests = requests
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        self.base_url = f'http://127.0.0.1:{port}'
+        self.process = subprocess.Popen(
+            [sys.executable, '-c',
+             'import server; server.init_db(); '
+             f'server.app.run(host="127.0.0.1", port={port}, threaded=True)'],
+            cwd=data_dir,
+            env={**os.environ, 'PYTHONPATH': BACKEND_DIR, 'TETROHASH_RATE_LIMIT': '0',
+                 'TETROHASH_DB_FILE': os.path.join(os.path.abspath(data_dir), DB_NAME)},
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + SERVER_START_TIMEOUT
+        while True:
+            try:
+                requests.get(f'{self.base_url}/api/health', timeout=1)
+                break
+            except requests.ConnectionError:
+                if self.process.poll() is not None or time.monotonic() > deadline:
+                    self.close()
+                    raise SystemExit('❌ API server did not start')
+                time.sleep(0.1)
+
+    def client(self) -> Callable[[Request], Tuple[int, Optional[dict]]]:
+        session = self.requests.Session()
+
+        def send(request: Request):
+            method, path, body = request
+            response = session.request(method, self.base_url + path, json=body, timeout=30)
+            try:
+                return response.status_code, response.json()
+            except ValueError:
+                return response.status_code, None
+        return send
+
+    def close(self) -> None:
+        self.process.terminate()
+        self.process.wait(timeout=10)
+
+
+TRANSPORTS = {'inprocess': InProcessTransport, 'http': HTTPTransport}
+
+
+def build_requests(scenario: str, count: int, players: int,
+                   puzzles: List[Tuple[int, str]]) -> List[Request]:
+    """The requests a scenario sends, generated up front so timing is only I/O"""
+    rng = random.Random(scenario)
+    if scenario == 'submit':
+        return [('POST', '/api/game/submit', record)
+                for record in _game_records(count, players, seed=rng.random())]
+    if scenario == 'leaderboard':
+        return [('GET', f'/api/leaderboard/{rng.choice(GAME_MODES)}', None) for _ in range(count)]
+    if scenario == 'stats':
+        return [('GET', '/api/stats/global', None)] * count
+    if scenario == 'puzzle_generate':
+        return [('POST', '/api/bitcoin/puzzle/generate', {'difficulty': rng.randint(1, 5)})
+                for _ in range(count)]
+    if scenario == 'puzzle_solve':
+        return [('POST', '/api/bitcoin/puzzle/solve',
+                 {'puzzle_id': puzzle_id, 'preimage': preimage,
+                  'player_id': rng.randint(1, players)})
+                for puzzle_id, preimage in puzzles]
+    raise ValueError(f'Unknown scenario: {scenario}')
+
+
+def run_scenario(transport, requests: List[Request], workers: int) -> Tuple[Dict, List[dict]]:
+    """Send `requests` from `workers` threads at once; returns the summary and 2xx bodies"""
+    latencies: List[float] = []
+    bodies: List[dict] = []
+    errors = [0]
+    lock = threading.Lock()
+    next_index = iter(range(len(requests)))
+    clients = [transport.client() for _ in range(workers)]
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(send):
+        mine, ok, failed = [], [], 0
+        barrier.wait()
+        for index in next_index:  # shared iterator: the GIL hands out each index once
+            started = time.perf_counter()
+            status, body = send(requests[index])
+            mine.append(time.perf_counter() - started)
+            if 200 <= status < 300:
+                ok.append(body)
+            else:
+                failed += 1
+        with lock:
+            latencies.extend(mine)
+            bodies.extend(ok)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=worker, args=(send,)) for send in clients]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return summarize(latencies, errors[0], time.perf_counter() - started), bodies
+
+
+def puzzle_preimages(db_file: str, bodies: List[dict]) -> List[Tuple[int, str]]:
+    """Answers for the generated puzzles, read straight from the database"""
+    puzzle_ids = [body['puzzle_id'] for body in bodies if body and 'puzzle_id' in body]
+    answers = {}
+    with get_pool(db_file).connection() as conn:
+        for offset in range(0, len(puzzle_ids), 500):
+            chunk = puzzle_ids[offset:offset + 500]
+            answers.update(conn.execute(
+                f'SELECT id, preimage FROM bitcoin_puzzles WHERE id IN ({",".join("?" * len(chunk))})',
+                chunk))
+    return [(puzzle_id, answers[puzzle_id]) for puzzle_id in puzzle_ids if puzzle_id in answers]
+
+
+def compare(results: Dict, baseline_file: str) -> None:
+    """Print the change in p50/p99 and throughput against an earlier results file"""
+    with open(baseline_file) as f:
+        baseline = json.load(f)['endpoints']
+    print(f"\n=== Change against {baseline_file} ===")
+    for name, now in results['endpoints'].items():
+        before = baseline.get(name)
+        if not before:
+            continue
+        delta = lambda key: (now[key] - before[key]) / before[key] * 100 if before[key] else 0.0
+        print(f"{name:<16} p50 {delta('p50_ms'):+7.1f}%   p99 {delta('p99_ms'):+7.1f}%   "
+              f"req/s {delta('requests_per_second'):+7.1f}%")
+
+
+def main(argv: List[str] = None):
+    """Seed a dataset, load every endpoint and write the results as JSON"""
+    parser = argparse.ArgumentParser(description='TetroHashUnlock API load test')
+    parser.add_argument('--transport', choices=sorted(TRANSPORTS), default='inprocess',
+                        help='Flask test client in-process, or real HTTP to a server subprocess')
+    parser.add_argument('--dataset', choices=list(DATASETS), default='10k',
+                        help='synthetic games seeded before the run (default 10k)')
+    parser.add_argument('--workers', type=int, default=8, help='concurrent clients (default 8)')
+    parser.add_argument('--requests', type=int, default=2000,
+                        help='requests per endpoint (default 2000)')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS),
+                        help=f'comma-separated subset of {",".join(SCENARIOS)}')
+    parser.add_argument('--data-dir', help='keep (and reuse) the seeded database here')
+    parser.add_argument('--output', default='loadtest-results.json', help='results file')
+    parser.add_argument('--baseline', help='earlier results file to compare against')
+    args = parser.parse_args(argv)
+
+    scenarios = [name for name in SCENARIOS if name in args.scenarios.split(',')]
+    output = os.path.abspath(args.output)
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = None
+    if args.data_dir:
+        data_dir = os.path.abspath(args.data_dir)
+        os.makedirs(data_dir, exist_ok=True)
+    else:
+        workdir = tempfile.TemporaryDirectory(prefix='tetrohash-load-')
+        data_dir = workdir.name
+
+    games = DATASETS[args.dataset]
+    db_file = prepare_database(data_dir, games)
+    transport = TRANSPORTS[args.transport](data_dir)
+
+    results = {
+        'meta': {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'transport': transport.name,
+            'dataset': args.dataset,
+            'games': games,
+            'workers': args.workers,
+            'requests_per_endpoint': args.requests,
+            'python': platform.python_version(),
+            'cpus': os.cpu_count(),
+        },
+        'endpoints': {},
+    }
+    print(f"\n=== {transport.name}, {args.workers} workers, {games:,} games ===")
+    puzzles: List[Tuple[int, str]] = []
+    try:
+        for name in scenarios:
+            if name == 'puzzle_solve' and not puzzles:
+                print(f"{name:<16} skipped (needs puzzle_generate in the same run)")
+                continue
+            requests = build_requests(name, args.requests, SEED_PLAYERS, puzzles)
+            summary, bodies = run_scenario(transport, requests, args.workers)
+            if name == 'puzzle_generate':
+                puzzles = puzzle_preimages(db_file, bodies)
+            results['endpoints'][name] = summary
+            print(f"{name:<16} {summary['requests_per_second']:>9,.0f} req/s   "
+                  f"p50 {summary['p50_ms']:>8.2f} ms   p95 {summary['p95_ms']:>8.2f} ms   "
+                  f"p99 {summary['p99_ms']:>8.2f} ms   errors {summary['errors']}")
+    finally:
+        transport.close()
+        reset_pool(db_file)
+        if workdir:
+            workdir.cleanup()
+
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"\n📄 Results written to {output}")
+    if baseline:
+        compare(results, baseline)
+
+
+if __name__ == "__main__":
+    main()
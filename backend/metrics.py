@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock request metrics
+Per-route latency histograms, sampled SQL tracing and Prometheus text exposition
+"""
+
+import os
+import random
+import re
+import sqlite3
+import threading
+import time
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.environ.get('TETROHASH_METRICS', '1') == '1'
+# Fraction of requests whose SQL statements are timed one by one
+SQL_SAMPLE_RATE = float(os.environ.get('TETROHASH_METRICS_SQL_SAMPLE_RATE', 0.05))
+# Distinct statements tracked before new ones are folded into 'other'
+MAX_STATEMENTS = int(os.environ.get('TETROHASH_METRICS_MAX_STATEMENTS', 256))
+SERVER_TIMING_STATEMENTS = 3  # slowest statements listed in a sampled Server-Timing header
+# Statement text goes to every sampled client, so it is only listed when debugging
+SERVER_TIMING_SQL = os.environ.get('TETROHASH_METRICS_SERVER_TIMING_SQL', '0') == '1'
+
+# Upper bounds in seconds, Prometheus style (+Inf is implicit)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_local = threading.local()
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and three adds"""
+
+    __slots__ = ('counts', 'total', 'count', 'lock')
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float) -> None:
+        index = bisect_left(BUCKETS, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += seconds
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        with self.lock:
+            return list(self.counts), self.total, self.count
+
+
+class SQLTrace:
+    """Statements run by one sampled request: [sql, seconds, rows] records"""
+
+    __slots__ = ('statements',)
+
+    def __init__(self):
+        self.statements: List[list] = []
+
+    def record(self, sql: str, seconds: float, rows: int) -> list:
+        record = [sql, seconds, max(rows, 0)]
+        self.statements.append(record)
+        return record
+
+
+def current_trace() -> Optional[SQLTrace]:
+    return getattr(_local, 'trace', None)
+
+
+class TracedCursor(sqlite3.Cursor):
+    """Cursor that adds its execute and fetch time and row count to the trace"""
+
+    def __init__(self, *args):
+        super().__init__(*args)
+        self._record = None
+
+    def _timed(self, method, sql, parameters):
+        trace = current_trace()
+        if trace is None:
+            return method(sql, parameters)
+        started = time.perf_counter()
+        try:
+            method(sql, parameters)
+        finally:
+            # rowcount is the DML row count; SELECT rows are counted as fetched
+            self._record = trace.record(sql, time.perf_counter() - started, self.rowcount)
+        return self
+
+    def execute(self, sql, parameters=()):
+        return self._timed(super().execute, sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self._timed(super().executemany, sql, seq_of_parameters)
+
+    def _fetched(self, started: float, rows: int) -> None:
+        if self._record is not None:
+            self._record[1] += time.perf_counter() - started
+            self._record[2] += rows
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._fetched(started, row is not None)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._fetched(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._fetched(started, len(rows))
+        return rows
+
+    def __next__(self):
+        started = time.perf_counter()
+        row = super().__next__()
+        self._fetched(started, 1)
+        return row
+
+
+class TracedConnection(sqlite3.Connection):
+    """Connection factory for the pool (db.py).
+
+    Outside a sampled request this only adds a thread-local lookup per
+    statement and hands out plain cursors. Inside one, every statement,
+    including those run through conn.cursor(), and every commit is timed.
+    """
+
+    def cursor(self, factory=None):
+        if factory is None:
+            factory = TracedCursor if current_trace() is not None else sqlite3.Cursor
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        if current_trace() is None:
+            return super().execute(sql, parameters)
+        return self.cursor(TracedCursor).execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        if current_trace() is None:
+            return super().executemany(sql, seq_of_parameters)
+        return self.cursor(TracedCursor).executemany(sql, seq_of_parameters)
+
+    def commit(self):
+        trace = current_trace()
+        if trace is None:
+            return super().commit()
+        started = time.perf_counter()
+        try:
+            super().commit()
+        finally:
+            trace.record('COMMIT', time.perf_counter() - started, 0)
+
+
+@lru_cache(maxsize=1024)
+def statement_label(sql: str) -> str:
+    """Stable label for a statement: whitespace collapsed, IN lists folded"""
+    label = ' '.join(sql.split())
+    label = re.sub(r'\?(?:\s*,\s*\?)+', '?, ...', label)
+    return label if len(label) <= 120 else label[:117] + '...'
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class RouteStats:
+    """Latency histogram, status counts and sampled SQL time for one route"""
+
+    __slots__ = ('latency', 'statuses', 'sql')
+
+    def __init__(self):
+        self.latency = Histogram()
+        self.statuses: Dict[int, int] = {}  # guarded by latency.lock
+        self.sql = Histogram()
+
+    def observe(self, seconds: float, status: int) -> None:
+        """Latency and status under one lock acquisition (the per-request hot path)"""
+        index = bisect_left(BUCKETS, seconds)
+        latency = self.latency
+        with latency.lock:
+            latency.counts[index] += 1
+            latency.total += seconds
+            latency.count += 1
+            self.statuses[status] = self.statuses.get(status, 0) + 1
+
+
+class RequestMetrics:
+    """Request timings per route, sampled SQL timings per statement.
+
+    middleware() wraps the WSGI app. Every request is timed, which costs
+    two clock reads and a couple of counter updates, and gets a
+    Server-Timing header. A `sample_rate` fraction of requests also time
+    every SQL statement they run. Those are folded into per-statement
+    histograms, and their total time goes into Server-Timing (plus the
+    slowest statements themselves with `timing_statements`, for debugging).
+    render() produces the Prometheus text format.
+    """
+
+    def __init__(self, sample_rate: float = SQL_SAMPLE_RATE, enabled: bool = METRICS_ENABLED,
+                 max_statements: int = MAX_STATEMENTS,
+                 timing_statements: bool = SERVER_TIMING_SQL):
+        self.enabled = enabled
+        self.sample_rate = sample_rate
+        self.max_statements = max_statements
+        self.timing_statements = timing_statements
+        self._lock = threading.Lock()
+        self._routes: Dict[Tuple[str, str], RouteStats] = {}
+        self._statements: Dict[str, Histogram] = {}
+        self._statement_rows: Dict[str, int] = {}
+        self._gauges: List[Tuple[str, str, Callable[[], float]]] = []
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> None:
+        """Expose a value read at scrape time (pool sizes, cache counters, ...)"""
+        self._gauges.append((name, help_text, read))
+
+    def middleware(self, wsgi_app):
+        """Wrap a WSGI app (Flask's app.wsgi_app) with timing and sampled SQL tracing.
+
+        The clock stops when the app starts its response, which for a
+        streamed body is before the body is generated. The route label is
+        the matched Flask rule, read from the request object Werkzeug keeps
+        in the environ, so it costs no context-local lookups.
+        """
+        if not self.enabled:
+            return wsgi_app
+
+        def timed_app(environ, start_response):
+            trace = SQLTrace() if random.random() < self.sample_rate else None
+            _local.trace = trace
+            started = time.perf_counter()
+
+            def timed_start_response(status, headers, exc_info=None):
+                rule = getattr(environ.get('werkzeug.request'), 'url_rule', None)
+                timing = self.record(started, environ.get('REQUEST_METHOD', 'GET'),
+                                     rule.rule if rule is not None else 'unmatched',
+                                     int(status[:3]), trace)
+                headers.append(('Server-Timing', timing))
+                return start_response(status, headers, exc_info)
+
+            try:
+                return wsgi_app(environ, timed_start_response)
+            finally:
+                _local.trace = None
+        return timed_app
+
+    def _route(self, key: Tuple[str, str]) -> RouteStats:
+        stats = self._routes.get(key)
+        if stats is None:
+            with self._lock:
+                stats = self._routes.setdefault(key, RouteStats())
+        return stats
+
+    def _statement(self, label: str) -> Tuple[str, Histogram]:
+        histogram = self._statements.get(label)
+        if histogram is None:
+            with self._lock:
+                if label not in self._statements and len(self._statements) >= self.max_statements:
+                    label = 'other'
+                histogram = self._statements.setdefault(label, Histogram())
+        return label, histogram
+
+    def record(self, started: float, method: str, route: str, status: int,
+               trace: Optional[SQLTrace] = None) -> str:
+        """Record a finished request; returns its Server-Timing header value"""
+        elapsed = time.perf_counter() - started
+        key = (method, route)
+        stats = self._routes.get(key) or self._route(key)
+        stats.observe(elapsed, status)
+        if trace is None:
+            return f'app;dur={elapsed * 1000:.3f}'
+
+        sql_seconds = 0.0
+        for sql, seconds, rows in trace.statements:
+            label, histogram = self._statement(statement_label(sql))
+            histogram.observe(seconds)
+            with self._lock:
+                self._statement_rows[label] = self._statement_rows.get(label, 0) + rows
+            sql_seconds += seconds
+        stats.sql.observe(sql_seconds)
+
+        timing = [f'app;dur={elapsed * 1000:.3f}',
+                  f'sql;dur={sql_seconds * 1000:.3f};desc="{len(trace.statements)} statements"']
+        if not self.timing_statements:
+            return ', '.join(timing)
+        slowest = sorted(trace.statements, key=lambda record: record[1], reverse=True)
+        for rank, (sql, seconds, rows) in enumerate(slowest[:SERVER_TIMING_STATEMENTS], 1):
+            desc = statement_label(sql)[:60].replace('"', "'")
+            timing.append(f'sql{rank};dur={seconds * 1000:.3f};desc="{desc} ({rows} rows)"')
+        return ', '.join(timing)
+
+    @staticmethod
+    def _render_histogram(lines: List[str], name: str, labels: str, histogram: Histogram) -> None:
+        counts, total, count = histogram.snapshot()
+        cumulative = 0
+        for bound, bucket in zip(BUCKETS + (float('inf'),), counts):
+            cumulative += bucket
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append(f'{name}_bucket{{{labels},le="{le}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {count}')
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            routes = sorted(self._routes.items())
+            statements = sorted(self._statements.items())
+            statement_rows = dict(self._statement_rows)
+        labels = {key: f'method="{key[0]}",route="{_escape(key[1])}"' for key, _ in routes}
+
+        lines = ['# HELP tetrohash_http_request_duration_seconds Request latency by route',
+                 '# TYPE tetrohash_http_request_duration_seconds histogram']
+        for key, stats in routes:
+            self._render_histogram(lines, 'tetrohash_http_request_duration_seconds',
+                                   labels[key], stats.latency)
+
+        lines += ['# HELP tetrohash_http_responses_total Responses by route and status',
+                  '# TYPE tetrohash_http_responses_total counter']
+        for key, stats in routes:
+            with stats.latency.lock:
+                statuses = sorted(stats.statuses.items())
+            for status, count in statuses:
+                lines.append(f'tetrohash_http_responses_total{{{labels[key]},status="{status}"}} {count}')
+
+        lines += ['# HELP tetrohash_http_request_sql_seconds SQL time per sampled request',
+                  '# TYPE tetrohash_http_request_sql_seconds histogram']
+        for key, stats in routes:
+            if stats.sql.count:
+                self._render_histogram(lines, 'tetrohash_http_request_sql_seconds',
+                                       labels[key], stats.sql)
+
+        lines += ['# HELP tetrohash_sql_statement_duration_seconds Execute and fetch time per '
+                  'statement (sampled requests)',
+                  '# TYPE tetrohash_sql_statement_duration_seconds histogram']
+        for label, histogram in statements:
+            self._render_histogram(lines, 'tetrohash_sql_statement_duration_seconds',
+                                   f'statement="{_escape(label)}"', histogram)
+
+        lines += ['# HELP tetrohash_sql_statement_rows_total Rows written or fetched per '
+                  'statement (sampled requests)',
+                  '# TYPE tetrohash_sql_statement_rows_total counter']
+        for label, rows in sorted(statement_rows.items()):
+            lines.append(f'tetrohash_sql_statement_rows_total{{statement="{_escape(label)}"}} {rows}')
+
+        for name, help_text, read in self._gauges:
+            lines += [f'# HELP {name} {help_text}', f'# TYPE {name} gauge', f'{name} {read()}']
+
+        lines += ['# HELP tetrohash_metrics_sql_sample_rate Fraction of requests with SQL tracing',
+                  '# TYPE tetrohash_metrics_sql_sample_rate gauge',
+                  f'tetrohash_metrics_sql_sample_rate {self.sample_rate}']
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,379 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock schema migrations
+Versioned, run-once schema upgrades for the SQLite database
+"""
+
+import sqlite3
+import sys
+from typing import Callable, List, Optional, Tuple
+
+from db import ConnectionPool, get_pool
+
+
+def _base_schema(conn: sqlite3.Connection):
+    """Players, games, leaderboards and puzzles (the original init_db schema)"""
+    cursor = conn.cursor()
+
+    # Players table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS players (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            wallet_address TEXT,
+            total_sats INTEGER DEFAULT 0,
+            games_played INTEGER DEFAULT 0,
+            high_score INTEGER DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Games table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS games (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            player_id INTEGER,
+            game_mode TEXT NOT NULL,
+            score INTEGER DEFAULT 0,
+            lines_cleared INTEGER DEFAULT 0,
+            level_reached INTEGER DEFAULT 0,
+            sats_earned INTEGER DEFAULT 0,
+            duration_seconds INTEGER DEFAULT 0,
+            ai_enabled BOOLEAN DEFAULT FALSE,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (player_id) REFERENCES players (id)
+        )
+    ''')
+
+    # Leaderboards table (cached for performance)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS leaderboards (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            game_mode TEXT NOT NULL,
+            player_id INTEGER,
+            score INTEGER NOT NULL,
+            rank INTEGER NOT NULL,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (player_id) REFERENCES players (id)
+        )
+    ''')
+
+    # Bitcoin puzzles table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS bitcoin_puzzles (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            puzzle_hash TEXT UNIQUE NOT NULL,
+            preimage TEXT NOT NULL,
+            difficulty INTEGER DEFAULT 1,
+            sats_reward INTEGER DEFAULT 250,
+            solved_by INTEGER,
+            solved_at TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (solved_by) REFERENCES players (id)
+        )
+    ''')
+
+
+def _player_best_scores(conn: sqlite3.Connection):
+    """Best score per player and mode (persisted side of the ranking index)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS player_best_scores (
+            game_mode TEXT NOT NULL,
+            player_id INTEGER NOT NULL,
+            score INTEGER NOT NULL,
+            game_id INTEGER NOT NULL,
+            achieved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (game_mode, player_id),
+            FOREIGN KEY (player_id) REFERENCES players (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_player_best_scores_game
+        ON player_best_scores (game_id)
+    ''')
+    # Frozen copy of leaderboard.backfill_best_scores() as of this version
+    conn.execute('''
+        INSERT OR IGNORE INTO player_best_scores (game_mode, player_id, score, game_id, achieved_at)
+        SELECT game_mode, player_id, score, id, created_at
+        FROM (
+            SELECT id, game_mode, player_id, score, created_at,
+                   ROW_NUMBER() OVER (
+                       PARTITION BY game_mode, player_id ORDER BY score DESC, id ASC
+                   ) AS position
+            FROM games
+            WHERE player_id IS NOT NULL
+        )
+        WHERE position = 1
+    ''')
+
+
+def _query_indexes(conn: sqlite3.Connection):
+    """Secondary indexes for the leaderboard, stats and puzzle queries"""
+    # Covers leaderboard.rebuild(): seek by mode, read in score order, no table lookups
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_games_mode_score
+        ON games (game_mode, score DESC, id, player_id)
+    ''')
+    # Rank range updates in leaderboard.record_score() and ordered reads
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_leaderboards_mode_rank
+        ON leaderboards (game_mode, rank, score, player_id)
+    ''')
+    # Only solved puzzles are indexed, so the solved count reads a small index
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_puzzles_solved
+        ON bitcoin_puzzles (solved_by)
+        WHERE solved_by IS NOT NULL
+    ''')
+    conn.execute('ANALYZE')
+
+
+def _global_stats(conn: sqlite3.Connection):
+    """Materialized counters for /api/stats/global"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS global_stats (
+            name TEXT PRIMARY KEY,
+            value INTEGER NOT NULL DEFAULT 0
+        ) WITHOUT ROWID
+    ''')
+    # Seeded from the base tables as they were at this version (see stats.RECOMPUTE_SQL)
+    conn.execute('''
+        INSERT OR REPLACE INTO global_stats (name, value)
+        SELECT 'total_players', COUNT(*) FROM players
+        UNION ALL SELECT 'total_games', COUNT(*) FROM games
+        UNION ALL SELECT 'total_sats_earned', COALESCE(SUM(sats_earned), 0) FROM games
+        UNION ALL SELECT 'puzzles_solved', COUNT(*) FROM bitcoin_puzzles WHERE solved_by IS NOT NULL
+    ''')
+
+
+def _ingest_state(conn: sqlite3.Connection):
+    """Drain watermark per write-behind queue file (see ingest.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_state (
+            queue_id TEXT PRIMARY KEY,
+            last_id INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+
+def _puzzle_token_solves(conn: sqlite3.Connection):
+    """Successful solves of stateless puzzle tokens (see puzzle_tokens.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS puzzle_token_solves (
+            token_id TEXT PRIMARY KEY,
+            puzzle_hash TEXT NOT NULL,
+            difficulty INTEGER NOT NULL,
+            sats_reward INTEGER NOT NULL,
+            solved_by INTEGER NOT NULL,
+            solved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (solved_by) REFERENCES players (id)
+        ) WITHOUT ROWID
+    ''')
+    # puzzles_solved counts token solves from here on
+    conn.execute('''
+        INSERT OR REPLACE INTO global_stats (name, value)
+        SELECT 'puzzles_solved',
+               (SELECT COUNT(*) FROM bitcoin_puzzles WHERE solved_by IS NOT NULL)
+             + (SELECT COUNT(*) FROM puzzle_token_solves)
+    ''')
+
+
+def _sats_ledger(conn: sqlite3.Connection):
+    """Double-entry sats ledger, cached balances and daily rollups (see sats_ledger.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            reference TEXT UNIQUE,
+            created_at TIMESTAMP NOT NULL
+        )
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_entries (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            txn_id INTEGER NOT NULL,
+            account TEXT NOT NULL,
+            amount INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            FOREIGN KEY (txn_id) REFERENCES ledger_transactions (id)
+        )
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_ledger_entries_account
+        ON ledger_entries (account, created_at)
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_accounts (
+            account TEXT PRIMARY KEY,
+            balance INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP
+        ) WITHOUT ROWID
+    ''')
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS ledger_daily (
+            account TEXT NOT NULL,
+            day TEXT NOT NULL,
+            kind TEXT NOT NULL,
+            credits INTEGER NOT NULL DEFAULT 0,
+            debits INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (account, day, kind)
+        ) WITHOUT ROWID
+    ''')
+    # Frozen copy of sats_ledger.backfill() as of this version: open every
+    # existing player's account at their current total_sats
+    conn.execute('''
+        INSERT INTO ledger_transactions (kind, reference, created_at)
+        SELECT 'opening_balance', 'opening:' || id, CURRENT_TIMESTAMP
+        FROM players WHERE total_sats != 0 ORDER BY id
+    ''')
+    conn.execute('''
+        INSERT INTO ledger_entries (txn_id, account, amount, created_at)
+        SELECT t.id,
+               CASE side WHEN 0 THEN 'system:opening_balances' ELSE 'player:' || p.id END,
+               CASE side WHEN 0 THEN -p.total_sats ELSE p.total_sats END,
+               t.created_at
+        FROM players p
+        JOIN ledger_transactions t ON t.reference = 'opening:' || p.id
+        CROSS JOIN (SELECT 0 AS side UNION ALL SELECT 1)
+        WHERE p.total_sats != 0
+        ORDER BY t.id, side
+    ''')
+    conn.execute('''
+        INSERT INTO ledger_accounts (account, balance, updated_at)
+        SELECT account, SUM(amount), MAX(created_at) FROM ledger_entries GROUP BY account
+    ''')
+    conn.execute('''
+        INSERT INTO ledger_daily (account, day, kind, credits, debits)
+        SELECT e.account, date(e.created_at), t.kind,
+               SUM(MAX(e.amount, 0)), SUM(MAX(-e.amount, 0))
+        FROM ledger_entries e JOIN ledger_transactions t ON t.id = e.txn_id
+        GROUP BY e.account, date(e.created_at), t.kind
+    ''')
+
+
+def _player_history_indexes(conn: sqlite3.Connection):
+    """Keyset pagination of a player's games (games.history), with and without a mode"""
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_games_player_history
+        ON games (player_id, created_at, id)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_games_player_mode_history
+        ON games (player_id, game_mode, created_at, id)
+    ''')
+    conn.execute('ANALYZE')
+
+
+def _puzzle_issue_state(conn: sqlite3.Connection):
+    """issued_at on puzzles, so the pre-filled pool lives in the table (see puzzle_pool.py)"""
+    conn.execute('ALTER TABLE bitcoin_puzzles ADD COLUMN issued_at TIMESTAMP')
+    # Earlier rows may already be in a client's hands: never hand them out again
+    conn.execute('UPDATE bitcoin_puzzles SET issued_at = created_at')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_puzzles_unissued
+        ON bitcoin_puzzles (difficulty, id)
+        WHERE issued_at IS NULL
+    ''')
+
+
+def _pow_solves(conn: sqlite3.Connection):
+    """Successful solves of signed block templates (see proof_of_work.py)"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS pow_solves (
+            template_id TEXT PRIMARY KEY,
+            block_hash TEXT NOT NULL,
+            bits INTEGER NOT NULL,
+            sats_reward INTEGER NOT NULL,
+            solved_by INTEGER NOT NULL,
+            solved_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (solved_by) REFERENCES players (id)
+        ) WITHOUT ROWID
+    ''')
+
+
+# (version, description, upgrade) - append only, never renumber. Upgrades
+# are frozen SQL: calling a live helper would make an old migration follow
+# whatever schema the current code expects.
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, 'base schema', _base_schema),
+    (2, 'player best scores', _player_best_scores),
+    (3, 'query indexes', _query_indexes),
+    (4, 'global stats counters', _global_stats),
+    (5, 'ingestion queue state', _ingest_state),
+    (6, 'puzzle token solves', _puzzle_token_solves),
+    (7, 'sats ledger', _sats_ledger),
+    (8, 'player game history indexes', _player_history_indexes),
+    (9, 'puzzle issue state', _puzzle_issue_state),
+    (10, 'proof of work solves', _pow_solves),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    """Schema version recorded in the database file header"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def migrate(pool: ConnectionPool, target: Optional[int] = None) -> List[int]:
+    """Apply pending migrations up to `target` (default: latest).
+
+    The version check is a header read, so workers that start after the
+    schema is current return without taking a lock. Pending migrations run
+    in one BEGIN IMMEDIATE transaction; a worker racing another one blocks
+    on the writer lock, re-reads the version and finds nothing left to do.
+    Returns the versions applied by this call.
+    """
+    target = LATEST_VERSION if target is None else target
+
+    with pool.connection() as conn:
+        if current_version(conn) >= target:
+            return []
+
+    applied = []
+    with pool.transaction() as conn:
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS schema_migrations (
+                version INTEGER PRIMARY KEY,
+                description TEXT NOT NULL,
+                applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        ''')
+        version = current_version(conn)
+        for number, description, upgrade in MIGRATIONS:
+            if number <= version or number > target:
+                continue
+            upgrade(conn)
+            conn.execute(
+                'INSERT INTO schema_migrations (version, description) VALUES (?, ?)',
+                (number, description)
+            )
+            applied.append(number)
+            version = number
+        # PRAGMA user_version is transactional and cannot take parameters
+        conn.execute(f'PRAGMA user_version = {int(version)}')
+    return applied
+
+
+def main():
+    """Apply pending migrations to a database file and print the history"""
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'tetrohash.db'
+    pool = get_pool(db_file)
+
+    applied = migrate(pool)
+    if applied:
+        print(f"✅ Applied migrations: {', '.join(map(str, applied))}")
+    else:
+        print("✅ Schema already up to date")
+
+    with pool.connection() as conn:
+        print(f"📦 Schema version: {current_version(conn)}")
+        for version, description, applied_at in conn.execute(
+            'SELECT version, description, applied_at FROM schema_migrations ORDER BY version'
+        ):
+            print(f"   {version:>3}  {applied_at}  {description}")
+
+
+if __name__ == "__main__":
+    main()
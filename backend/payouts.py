@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock Lightning payouts
+Pooled, retrying LNbits client and a persisted payout queue
+"""
+
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+try:
+    import requests
+    from requests.adapters import HTTPAdapter
+except ImportError:  # only needed once payouts are actually sent
+    requests = None
+
+from db import get_pool
+
+PAYOUT_DB_FILE = os.environ.get('TETROHASH_PAYOUT_DB', 'tetrohash_payouts.db')
+PAYOUT_CONCURRENCY = int(os.environ.get('TETROHASH_PAYOUT_CONCURRENCY', 8))
+PAYOUT_TIMEOUT = float(os.environ.get('TETROHASH_PAYOUT_TIMEOUT', 10.0))
+PAYOUT_MAX_ATTEMPTS = int(os.environ.get('TETROHASH_PAYOUT_MAX_ATTEMPTS', 6))
+# Retry n waits about BACKOFF_BASE * 2**n seconds (with jitter), at most BACKOFF_CAP
+PAYOUT_BACKOFF_BASE = float(os.environ.get('TETROHASH_PAYOUT_BACKOFF_BASE', 0.5))
+PAYOUT_BACKOFF_CAP = float(os.environ.get('TETROHASH_PAYOUT_BACKOFF_CAP', 60.0))
+
+# HTTP statuses worth retrying; any other 4xx is a permanent rejection
+RETRYABLE_STATUSES = {408, 425, 429, 500, 502, 503, 504}
+
+PENDING, IN_FLIGHT, PAID, FAILED = 'pending', 'in_flight', 'paid', 'failed'
+
+
+class PaymentResult(NamedTuple):
+    success: bool
+    retryable: bool
+    status_code: Optional[int]
+    response: Optional[Dict[str, Any]]
+    error: Optional[str]
+
+
+class LNbitsClient:
+    """LNbits payments API over one pooled, keep-alive HTTP session.
+
+    `api_url` is the API root (e.g. https://host/api/v1). Every payment
+    carries an idempotency key, sent as `X-Idempotency-Key`, so a retry
+    after an ambiguous failure (a timeout, a dropped connection) is
+    recognizable to the server as the same payment.
+    """
+
+    def __init__(self, api_url: str, api_key: str, timeout: float = PAYOUT_TIMEOUT,
+                 pool_size: int = PAYOUT_CONCURRENCY, session=None):
+        if session is None:
+            if requests is None:
+                raise RuntimeError('Lightning payouts require the requests library')
+            session = requests.Session()
+            # Retries are ours (with idempotency keys); the adapter only pools
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+            session.mount('https://', adapter)
+            session.mount('http://', adapter)
+        session.headers.update({'X-Api-Key': api_key, 'Content-Type': 'application/json'})
+        self.api_url = api_url.rstrip('/')
+        self.timeout = timeout
+        self.session = session
+
+    def pay(self, invoice: str, amount_sats: int, idempotency_key: str) -> PaymentResult:
+        """One payment attempt, classified as success, retryable or permanent"""
+        try:
+            response = self.session.post(
+                f'{self.api_url}/payments',
+                json={'out': True, 'bolt11': invoice, 'amount': amount_sats},
+                headers={'X-Idempotency-Key': idempotency_key},
+                timeout=self.timeout,
+            )
+        except requests.RequestException as e:
+            return PaymentResult(False, True, None, None, f'{type(e).__name__}: {e}')
+
+        if response.status_code in (200, 201):
+            try:
+                body = response.json()
+            except ValueError:
+                body = None
+            return PaymentResult(True, False, response.status_code, body, None)
+        return PaymentResult(False, response.status_code in RETRYABLE_STATUSES,
+                             response.status_code, None,
+                             f'HTTP {response.status_code}: {response.text[:200]}')
+
+    def close(self) -> None:
+        self.session.close()
+
+
+def backoff_delay(attempt: int, base: float = PAYOUT_BACKOFF_BASE,
+                  cap: float = PAYOUT_BACKOFF_CAP) -> float:
+    """Full-jitter exponential backoff before retry number `attempt` (1-based)"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class PayoutEngine:
+    """Persisted queue of Lightning payouts, paid with bounded concurrency.
+
+    enqueue() records a payout under an idempotency key; recording the same
+    key twice is a no-op. run() claims due payouts, sends up to
+    `concurrency` at a time over the client's pooled session, and stores
+    every outcome. Retryable failures are rescheduled with exponential
+    backoff until `max_attempts`. Payouts left in flight by a crash are
+    retried on open(), reusing their key, so the server sees a duplicate
+    rather than a second payment.
+    """
+
+    def __init__(self, client: LNbitsClient, db_file: str = PAYOUT_DB_FILE,
+                 concurrency: int = PAYOUT_CONCURRENCY, max_attempts: int = PAYOUT_MAX_ATTEMPTS,
+                 backoff: Callable[[int], float] = backoff_delay):
+        self.client = client
+        self.pool = get_pool(db_file)
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self._executor = ThreadPoolExecutor(max_workers=concurrency,
+                                            thread_name_prefix='lightning-payout')
+        self._stats_lock = threading.Lock()
+        self._stats = {'attempts': 0, 'paid': 0, 'retries': 0, 'failed': 0}
+        self._opened = False
+
+    def open(self) -> None:
+        """Create the payout table and requeue payouts interrupted mid-flight"""
+        with self.pool.transaction() as conn:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS payouts (
+                    idempotency_key TEXT PRIMARY KEY,
+                    invoice TEXT NOT NULL,
+                    amount_sats INTEGER NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pending',
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    next_attempt_at REAL NOT NULL DEFAULT 0,
+                    last_error TEXT,
+                    response TEXT,
+                    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            ''')
+            conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_payouts_due
+                ON payouts (status, next_attempt_at)
+            ''')
+            conn.execute("UPDATE payouts SET status = ? WHERE status = ?", (PENDING, IN_FLIGHT))
+        self._opened = True
+
+    def _ensure_open(self) -> None:
+        if not self._opened:
+            self.open()
+
+    def enqueue(self, invoice: str, amount_sats: int,
+                idempotency_key: Optional[str] = None) -> str:
+        """Record a payout to send; returns its idempotency key"""
+        self._ensure_open()
+        key = idempotency_key or uuid.uuid4().hex
+        with self.pool.transaction() as conn:
+            conn.execute('''
+                INSERT OR IGNORE INTO payouts (idempotency_key, invoice, amount_sats)
+                VALUES (?, ?, ?)
+            ''', (key, invoice, amount_sats))
+        return key
+
+    def _count(self, key: str, amount: int = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def _claim_due(self, limit: int) -> List[tuple]:
+        """Atomically move due payouts to in_flight"""
+        with self.pool.transaction() as conn:
+            rows = conn.execute('''
+                SELECT idempotency_key, invoice, amount_sats, attempts FROM payouts
+                WHERE status = ? AND next_attempt_at <= ?
+                ORDER BY next_attempt_at LIMIT ?
+            ''', (PENDING, time.time(), limit)).fetchall()
+            conn.executemany(
+                "UPDATE payouts SET status = ?, updated_at = CURRENT_TIMESTAMP "
+                "WHERE idempotency_key = ?",
+                [(IN_FLIGHT, row[0]) for row in rows]
+            )
+        return rows
+
+    def _attempt(self, key: str, invoice: str, amount_sats: int, attempts: int) -> str:
+        """Send one payout attempt and persist its outcome; returns the new status"""
+        result = self.client.pay(invoice, amount_sats, key)
+        attempts += 1
+        self._count('attempts')
+        if result.success:
+            status, next_at = PAID, 0
+            self._count('paid')
+        elif result.retryable and attempts < self.max_attempts:
+            status, next_at = PENDING, time.time() + self.backoff(attempts)
+            self._count('retries')
+        else:
+            status, next_at = FAILED, 0
+            self._count('failed')
+
+        with self.pool.transaction() as conn:
+            conn.execute('''
+                UPDATE payouts
+                SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ?,
+                    response = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE idempotency_key = ?
+            ''', (status, attempts, next_at, result.error,
+                  None if result.response is None else str(result.response), key))
+        return status
+
+    def process_due(self) -> int:
+        """Send every payout due now, `concurrency` at a time; returns how many were tried"""
+        self._ensure_open()
+        tried = 0
+        while True:
+            rows = self._claim_due(self.concurrency * 4)
+            if not rows:
+                return tried
+            # Attempts that fail do so inside _attempt; re-raise anything unexpected
+            for future in [self._executor.submit(self._attempt, *row) for row in rows]:
+                future.result()
+            tried += len(rows)
+
+    def next_due_in(self) -> Optional[float]:
+        """Seconds until the next pending payout is due, or None if none are pending"""
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT MIN(next_attempt_at) FROM payouts WHERE status = ?',
+                               (PENDING,)).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def run(self, timeout: float = 300.0) -> Dict[str, int]:
+        """Work the queue until nothing is pending (or the timeout); returns status counts"""
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            self.process_due()
+            wait = self.next_due_in()
+            if wait is None:
+                break
+            time.sleep(min(wait, max(0.0, deadline - time.monotonic())))
+        return self.counts()
+
+    def status(self, key: str) -> Optional[Dict[str, Any]]:
+        """Persisted state of one payout"""
+        self._ensure_open()
+        with self.pool.connection() as conn:
+            row = conn.execute('''
+                SELECT idempotency_key, amount_sats, status, attempts, last_error, updated_at
+                FROM payouts WHERE idempotency_key = ?
+            ''', (key,)).fetchone()
+        if row is None:
+            return None
+        return dict(zip(('idempotency_key', 'amount_sats', 'status', 'attempts',
+                         'last_error', 'updated_at'), row))
+
+    def counts(self) -> Dict[str, int]:
+        """Number of payouts in each status"""
+        self._ensure_open()
+        with self.pool.connection() as conn:
+            counts = dict.fromkeys((PENDING, IN_FLIGHT, PAID, FAILED), 0)
+            counts.update(conn.execute('SELECT status, COUNT(*) FROM payouts GROUP BY status'))
+        return counts
+
+    def stats(self) -> Dict[str, object]:
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+        snapshot['concurrency'] = self.concurrency
+        snapshot['max_attempts'] = self.max_attempts
+        snapshot['queue'] = self.counts()
+        return snapshot
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=True)
+        self.client.close()
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock proof of work
+Block-header nonce search with compact `bits` targets and retargeting
+"""
+
+import base64
+import hashlib
+import hmac
+import math
+import os
+import sqlite3
+import statistics
+import struct
+import threading
+import time
+from collections import deque
+from functools import lru_cache
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import sats_ledger
+
+# version, prev_hash, merkle_root, timestamp, bits, nonce: 80 bytes, as in Bitcoin
+HEADER = struct.Struct('<I32s32sIII')
+HEADER_VERSION = 1
+# The nonce sits in the last 16 bytes with timestamp and bits; the first 64
+# bytes (one SHA256 block) are fixed for a given template
+MIDSTATE_BYTES = 64
+MAX_NONCE = 0xFFFFFFFF
+
+# Easiest allowed target: every hash passes, i.e. difficulty 1.0
+POW_LIMIT_BITS = 0x2100FFFF
+# Roughly what the frontend asks for with two leading hex zeros (~256 hashes)
+DEFAULT_BITS = int(os.environ.get('TETROHASH_POW_BITS', '0x2000ffff'), 16)
+# Desired mean solve time used by retarget()
+TARGET_SOLVE_SECONDS = float(os.environ.get('TETROHASH_POW_TARGET_SECONDS', 10.0))
+# Bound on one retarget step in either direction (Bitcoin uses 4x)
+MAX_RETARGET_FACTOR = 4.0
+
+PROOF_OF_WORK = os.environ.get('TETROHASH_POW', '0') == '1'
+# Shared by every worker, which must all accept each other's templates
+POW_SECRET = os.environ.get('TETROHASH_POW_SECRET', '')
+POW_TEMPLATE_TTL = int(os.environ.get('TETROHASH_POW_TEMPLATE_TTL', 600))
+POW_REWARD = int(os.environ.get('TETROHASH_POW_REWARD', 100))
+# Solves per retarget step in this worker
+RETARGET_WINDOW = int(os.environ.get('TETROHASH_POW_RETARGET_WINDOW', 32))
+MAX_DATA_BYTES = 1024
+
+# version, prev_hash, timestamp, bits, sats reward, expiry (unix seconds)
+TEMPLATE = struct.Struct('>B32sIIII')
+TEMPLATE_VERSION = 1
+MAC_BYTES = 16
+
+
+@lru_cache(maxsize=256)
+def bits_to_target(bits: int) -> int:
+    """Expand a compact `bits` value (8-bit exponent, 23-bit mantissa) to a target"""
+    exponent = bits >> 24
+    mantissa = bits & 0x007FFFFF
+    if bits & 0x00800000:
+        raise ValueError(f'Negative compact target: {bits:#010x}')
+    if exponent <= 3:
+        target = mantissa >> (8 * (3 - exponent))
+    else:
+        target = mantissa << (8 * (exponent - 3))
+    if not 0 < target < (1 << 256):
+        raise ValueError(f'Compact target out of range: {bits:#010x}')
+    return target
+
+
+def target_to_bits(target: int) -> int:
+    """Compress a target to `bits`, truncating it to 23 bits of mantissa"""
+    if not 0 < target < (1 << 256):
+        raise ValueError('Target must be in (0, 2**256)')
+    size = (target.bit_length() + 7) // 8
+    if size <= 3:
+        mantissa = target << (8 * (3 - size))
+    else:
+        mantissa = target >> (8 * (size - 3))
+    # The top mantissa bit is a sign bit; move up one byte instead of setting it
+    if mantissa & 0x00800000:
+        mantissa >>= 8
+        size += 1
+    return (size << 24) | mantissa
+
+
+POW_LIMIT = bits_to_target(POW_LIMIT_BITS)
+
+
+def difficulty(bits: int) -> float:
+    """How many times harder than the easiest allowed target"""
+    return POW_LIMIT / bits_to_target(bits)
+
+
+def expected_hashes(bits: int) -> float:
+    """Mean number of nonces tried before a hash meets the target"""
+    return (1 << 256) / (bits_to_target(bits) + 1)
+
+
+def bits_for_leading_zeros(hex_zeros: int) -> int:
+    """Target matching the frontend's "hash starts with N zeros" rule"""
+    return target_to_bits((1 << (256 - 4 * hex_zeros)) - 1)
+
+
+def merkle_root(data: bytes) -> bytes:
+    """Commitment to the block payload (a single-leaf tree is its hash)"""
+    return hashlib.sha256(hashlib.sha256(data).digest()).digest()
+
+
+class BlockHeader(NamedTuple):
+    version: int
+    prev_hash: bytes
+    merkle_root: bytes
+    timestamp: int
+    bits: int
+    nonce: int
+
+    @classmethod
+    def for_data(cls, data: bytes, prev_hash: bytes = bytes(32), bits: int = DEFAULT_BITS,
+                 timestamp: Optional[int] = None, nonce: int = 0) -> 'BlockHeader':
+        """Template committing to `data`, ready for a nonce search"""
+        if timestamp is None:
+            timestamp = int(time.time())
+        return cls(HEADER_VERSION, prev_hash, merkle_root(data), timestamp, bits, nonce)
+
+    def serialize(self) -> bytes:
+        return HEADER.pack(*self)
+
+    def hash(self) -> bytes:
+        """Double SHA256 of the serialized header"""
+        return hashlib.sha256(hashlib.sha256(self.serialize()).digest()).digest()
+
+    def hash_hex(self) -> str:
+        """Display form: byte-reversed, so leading zeros mean a small hash"""
+        return self.hash()[::-1].hex()
+
+
+def verify(header: BlockHeader) -> bool:
+    """O(1) check: two SHA256 compressions over 80 bytes and an integer compare"""
+    try:
+        target = bits_to_target(header.bits)
+    except ValueError:
+        return False
+    return int.from_bytes(header.hash(), 'little') <= target
+
+
+class WorkTemplate(NamedTuple):
+    template_id: str  # prev_hash in hex
+    prev_hash: bytes
+    timestamp: int
+    bits: int
+    sats_reward: int
+    expires_at: int
+
+
+class InvalidTemplate(Exception):
+    """Raised for malformed, tampered or foreign block templates"""
+
+
+class TemplateExpired(InvalidTemplate):
+    """Raised for a correctly signed template past its expiry"""
+
+
+def verify_submission(template: WorkTemplate, data: bytes, nonce: int) -> Optional[BlockHeader]:
+    """Verify a submitted (data, nonce) pair against a server-issued template.
+
+    Everything but the payload and nonce comes from the signed template, so
+    a client cannot pick an easier target, or reuse work done for another
+    prev_hash or timestamp. Returns the solved header, or None.
+    """
+    if not 0 <= nonce <= MAX_NONCE:
+        return None
+    header = BlockHeader(HEADER_VERSION, template.prev_hash, merkle_root(data),
+                         template.timestamp, template.bits, nonce)
+    return header if verify(header) else None
+
+
+def record_solve(conn: sqlite3.Connection, template: WorkTemplate, header: BlockHeader,
+                 player_id: int) -> bool:
+    """Store a verified solve inside the caller's transaction; False if already stored"""
+    # The primary key settles races with other workers
+    claimed = conn.execute('''
+        INSERT OR IGNORE INTO pow_solves (template_id, block_hash, bits, sats_reward, solved_by)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (template.template_id, header.hash_hex(), template.bits, template.sats_reward,
+          player_id)).rowcount
+    if claimed:
+        sats_ledger.credit_player(conn, player_id, template.sats_reward, 'puzzle_reward',
+                                  f'pow:{template.template_id}')
+    return bool(claimed)
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+class TemplateSigner:
+    """Issues signed block templates and retargets them from observed solves.
+
+    A template is base64url(payload).base64url(mac), like a puzzle token
+    (puzzle_tokens.py): the payload fixes prev_hash, timestamp, bits and
+    reward, and a truncated HMAC-SHA256 stops clients from editing them.
+    prev_hash is random per template, so work cannot be precomputed or
+    reused. Every `window` solves the `bits` for new templates are
+    retargeted from how long those solves took.
+    """
+
+    def __init__(self, secret: str = POW_SECRET, ttl: int = POW_TEMPLATE_TTL,
+                 bits: int = DEFAULT_BITS, sats_reward: int = POW_REWARD,
+                 window: int = RETARGET_WINDOW):
+        self.ephemeral = not secret
+        self._key = secret.encode() if secret else os.urandom(32)
+        self.ttl = ttl
+        self.bits = bits
+        self.sats_reward = sats_reward
+        self.window = max(1, window)
+        self._solve_times: deque = deque()
+        self._lock = threading.Lock()
+        self.retargets = 0
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()[:MAC_BYTES]
+
+    def issue(self, now: Optional[float] = None) -> Tuple[str, WorkTemplate]:
+        """Sign a new template at the current bits; returns (token string, decoded template)"""
+        timestamp = int(now if now is not None else time.time())
+        with self._lock:
+            bits = self.bits
+        template = WorkTemplate(None, os.urandom(32), timestamp, bits, self.sats_reward,
+                                timestamp + self.ttl)
+        payload = TEMPLATE.pack(TEMPLATE_VERSION, *template[1:])
+        token = f'{_b64encode(payload)}.{_b64encode(self._mac(payload))}'
+        return token, template._replace(template_id=template.prev_hash.hex())
+
+    def verify(self, token: str, now: Optional[float] = None) -> WorkTemplate:
+        """Decode a template, raising InvalidTemplate/TemplateExpired if it is not acceptable"""
+        try:
+            encoded_payload, encoded_mac = token.split('.')
+            payload = _b64decode(encoded_payload)
+            mac = _b64decode(encoded_mac)
+        except (AttributeError, ValueError) as e:
+            raise InvalidTemplate('Malformed block template') from e
+
+        if len(payload) != TEMPLATE.size or not hmac.compare_digest(mac, self._mac(payload)):
+            raise InvalidTemplate('Invalid block template signature')
+        version, prev_hash, timestamp, bits, sats_reward, expires_at = TEMPLATE.unpack(payload)
+        if version != TEMPLATE_VERSION:
+            raise InvalidTemplate(f'Unsupported block template version {version}')
+        if expires_at <= (now if now is not None else time.time()):
+            raise TemplateExpired('Block template expired')
+        return WorkTemplate(prev_hash.hex(), prev_hash, timestamp, bits, sats_reward, expires_at)
+
+    def record_solve_time(self, seconds: float) -> None:
+        """Note how long a solve took; retarget once a window of them is in"""
+        with self._lock:
+            self._solve_times.append(seconds)
+            if len(self._solve_times) < self.window:
+                return
+            self.bits = retarget(self.bits, self._solve_times)
+            self._solve_times.clear()
+            self.retargets += 1
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {'bits': f'{self.bits:#010x}', 'difficulty': round(difficulty(self.bits), 3),
+                    'sats_reward': self.sats_reward, 'ttl_seconds': self.ttl,
+                    'retarget_window': self.window, 'pending_solves': len(self._solve_times),
+                    'retargets': self.retargets}
+
+
+def mine(header: BlockHeader, start_nonce: int = 0,
+         max_nonce: int = MAX_NONCE) -> Optional[BlockHeader]:
+    """Search nonces from start_nonce; returns the solved header or None.
+
+    The first 64 header bytes do not depend on the nonce, so their SHA256
+    state is computed once and copied for each attempt.
+    """
+    target = bits_to_target(header.bits)
+    raw = header.serialize()
+    midstate = hashlib.sha256(raw[:MIDSTATE_BYTES])
+    tail = raw[MIDSTATE_BYTES:-4]
+    sha256 = hashlib.sha256
+    for nonce in range(start_nonce, max_nonce + 1):
+        state = midstate.copy()
+        state.update(tail + nonce.to_bytes(4, 'little'))
+        if int.from_bytes(sha256(state.digest()).digest(), 'little') <= target:
+            return header._replace(nonce=nonce)
+    return None
+
+
+def retarget(bits: int, solve_times: Iterable[float],
+             target_seconds: float = TARGET_SOLVE_SECONDS,
+             max_factor: float = MAX_RETARGET_FACTOR) -> int:
+    """New `bits` so that solves take target_seconds on average.
+
+    Nonce search times are roughly exponential, so a few very lucky or
+    very slow solves would swing a plain mean. The median divided by ln 2
+    estimates the mean and is robust to those outliers. The step is
+    clamped to max_factor either way and never exceeds POW_LIMIT.
+    """
+    times = [t for t in solve_times if t > 0]
+    if not times:
+        return bits
+    observed = statistics.median(times) / math.log(2)
+    factor = min(max(observed / target_seconds, 1 / max_factor), max_factor)
+    target = min(POW_LIMIT, max(1, int(bits_to_target(bits) * factor)))
+    return target_to_bits(target)
+
+
+def main():
+    """Mine and verify one block, then show a retarget step"""
+    header = BlockHeader.for_data(b'TetroHashUnlock demo block')
+    print(f"⛏️  Mining at bits {header.bits:#010x} "
+          f"(difficulty {difficulty(header.bits):,.0f}, ~{expected_hashes(header.bits):,.0f} hashes)...")
+    started = time.perf_counter()
+    solved = mine(header)
+    print(f"✅ Nonce {solved.nonce} in {time.perf_counter() - started:.3f}s: {solved.hash_hex()}")
+    print(f"🔍 Verified: {verify(solved)}, tampered: {verify(solved._replace(timestamp=0))}")
+
+    fast = retarget(header.bits, [2.0, 3.0, 2.5, 40.0], target_seconds=10.0)
+    print(f"🎯 Solves too fast: bits {header.bits:#010x} -> {fast:#010x} "
+          f"(difficulty {difficulty(fast):,.1f})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock puzzle pool
+Per-difficulty reservoir of pre-generated, pre-inserted SHA256 puzzles
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from db import ConnectionPool
+import sats_ledger
+import stats
+
+POOL_DIFFICULTIES = [
+    int(level) for level in
+    os.environ.get('TETROHASH_PUZZLE_POOL_DIFFICULTIES', '1,2,3,4,5').split(',') if level
+]
+POOL_DEPTH = int(os.environ.get('TETROHASH_PUZZLE_POOL_DEPTH', 50))
+# Refill a difficulty once it drops below this fraction of POOL_DEPTH
+POOL_LOW_WATER = float(os.environ.get('TETROHASH_PUZZLE_POOL_LOW_WATER', 0.5))
+# Rate limit for the refill worker: at most this many puzzles per transaction...
+POOL_REFILL_BATCH = int(os.environ.get('TETROHASH_PUZZLE_POOL_REFILL_BATCH', 25))
+# ...and at least this long between refill transactions
+POOL_REFILL_INTERVAL = float(os.environ.get('TETROHASH_PUZZLE_POOL_REFILL_INTERVAL', 0.05))
+MAX_COLLISION_RETRIES = 8
+SOLVED_CACHE_SIZE = int(os.environ.get('TETROHASH_SOLVED_CACHE_SIZE', 100000))
+
+
+class Puzzle(NamedTuple):
+    puzzle_id: int
+    puzzle_hash: str
+    difficulty: int
+    sats_reward: int
+
+
+class PuzzleCollision(Exception):
+    """Raised when no unused preimage was found within the retry budget"""
+
+
+def create_puzzle(conn: sqlite3.Connection, difficulty: int,
+                  generate_preimage: Callable[[int], str], sats_reward: int,
+                  issued: bool = True) -> Puzzle:
+    """Insert one new puzzle, drawing a fresh preimage on hash collisions.
+
+    `issued=False` leaves it in the pool (issued_at NULL) for issue_puzzle().
+    """
+    for _ in range(MAX_COLLISION_RETRIES):
+        preimage = generate_preimage(difficulty)
+        puzzle_hash = hashlib.sha256(preimage.encode()).hexdigest()
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO bitcoin_puzzles
+                (puzzle_hash, preimage, difficulty, sats_reward, issued_at)
+            VALUES (?, ?, ?, ?, CASE WHEN ? THEN CURRENT_TIMESTAMP END)
+        ''', (puzzle_hash, preimage, difficulty, sats_reward, issued))
+        if cursor.rowcount:
+            return Puzzle(cursor.lastrowid, puzzle_hash, difficulty, sats_reward)
+    raise PuzzleCollision(f'No unused preimage after {MAX_COLLISION_RETRIES} attempts')
+
+
+def issue_puzzle(conn: sqlite3.Connection, difficulty: int) -> Optional[Puzzle]:
+    """Mark the oldest pooled puzzle of a difficulty as issued; None if there is none"""
+    # One statement, so two workers can never hand out the same row
+    row = conn.execute('''
+        UPDATE bitcoin_puzzles SET issued_at = CURRENT_TIMESTAMP
+        WHERE id = (
+            SELECT id FROM bitcoin_puzzles
+            WHERE difficulty = ? AND issued_at IS NULL
+            ORDER BY id LIMIT 1
+        )
+        RETURNING id, puzzle_hash, difficulty, sats_reward
+    ''', (difficulty,)).fetchone()
+    return Puzzle(*row) if row else None
+
+
+def pooled_counts(conn: sqlite3.Connection) -> Dict[int, int]:
+    """Unissued puzzles per difficulty"""
+    return dict(conn.execute('''
+        SELECT difficulty, COUNT(*) FROM bitcoin_puzzles
+        WHERE issued_at IS NULL GROUP BY difficulty
+    ''').fetchall())
+
+
+def claim_solution(conn: sqlite3.Connection, puzzle_id: int, player_id: int,
+                   sats_reward: int) -> bool:
+    """Record a verified solve inside the caller's transaction; False if already taken"""
+    # Compare-and-set claim: only one solver can flip solved_by from NULL
+    claimed = conn.execute('''
+        UPDATE bitcoin_puzzles 
+        SET solved_by = ?, solved_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND solved_by IS NULL
+    ''', (player_id, puzzle_id)).rowcount
+    if claimed:
+        sats_ledger.credit_player(conn, player_id, sats_reward, 'puzzle_reward',
+                                  f'puzzle:{puzzle_id}')
+        stats.bump(conn, puzzles_solved=1)
+    return bool(claimed)
+
+
+class PuzzlePool:
+    """Reservoirs of puzzles inserted ahead of time but not yet handed out.
+
+    Pooled rows sit in bitcoin_puzzles with issued_at NULL. A background
+    thread tops each configured difficulty up to `depth` in bulk
+    transactions, so /api/bitcoin/puzzle/generate only runs issue_puzzle(),
+    one indexed UPDATE ... RETURNING, instead of generating and inserting.
+    The reservoir lives in the database, shared by every gunicorn worker
+    and kept across restarts: a worker that exits leaves its unissued rows
+    for the next one rather than orphaning them.
+    """
+
+    def __init__(self, pool: ConnectionPool, generate_preimage: Callable[[int], str],
+                 reward_for: Callable[[int], int], difficulties: List[int] = None,
+                 depth: int = POOL_DEPTH, low_water: float = POOL_LOW_WATER,
+                 refill_batch: int = POOL_REFILL_BATCH,
+                 refill_interval: float = POOL_REFILL_INTERVAL):
+        self.pool = pool
+        self.generate_preimage = generate_preimage
+        self.reward_for = reward_for
+        self.depth = depth
+        self.low_water = max(1, int(depth * low_water))
+        self.refill_batch = refill_batch
+        self.refill_interval = refill_interval
+        # Last known unissued count per difficulty; refill_once() re-reads it
+        self._available: Dict[int, int] = {
+            level: 0 for level in (POOL_DIFFICULTIES if difficulties is None else difficulties)
+        }
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._stats = {'claimed': 0, 'fallbacks': 0, 'generated': 0,
+                       'refills': 0, 'collisions': 0, 'last_refill_ms': 0.0}
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._stats_lock:
+            self._stats[key] += amount
+
+    def take(self, conn: sqlite3.Connection, difficulty: int) -> Optional[Puzzle]:
+        """Issue a pooled puzzle inside the caller's transaction, or None if unpooled or empty"""
+        if difficulty not in self._available:
+            return None
+        puzzle = issue_puzzle(conn, difficulty)
+        with self._stats_lock:
+            if puzzle is None:
+                self._stats['fallbacks'] += 1
+                self._available[difficulty] = 0
+            else:
+                self._stats['claimed'] += 1
+                self._available[difficulty] = max(0, self._available[difficulty] - 1)
+            low = self._available[difficulty] < self.low_water
+        if low:
+            self._wake.set()
+        return puzzle
+
+    def claim(self, difficulty: int) -> Optional[Puzzle]:
+        """Take a ready puzzle, or None if this difficulty is not pooled or is empty"""
+        if difficulty not in self._available:
+            return None
+        with self.pool.transaction() as conn:
+            return self.take(conn, difficulty)
+
+    def create(self, difficulty: int) -> Puzzle:
+        """Synchronous path for unpooled difficulties or an empty reservoir"""
+        with self.pool.transaction() as conn:
+            return create_puzzle(conn, difficulty, self.generate_preimage,
+                                 self.reward_for(difficulty))
+
+    def refill_once(self) -> int:
+        """Insert one batch for the emptiest difficulty below its target"""
+        if not self._available:
+            return 0
+        with self.pool.connection() as conn:
+            counts = pooled_counts(conn)
+        with self._stats_lock:
+            for level in self._available:
+                self._available[level] = counts.get(level, 0)
+        level, available = min(self._available.items(), key=lambda item: item[1])
+        if available >= self.depth:
+            return 0
+
+        wanted = min(self.refill_batch, self.depth - available)
+        reward = self.reward_for(level)
+        started = time.perf_counter()
+        created = 0
+        with self.pool.transaction() as conn:
+            for _ in range(wanted):
+                try:
+                    create_puzzle(conn, level, self.generate_preimage, reward, issued=False)
+                    created += 1
+                except PuzzleCollision:
+                    self._count('collisions')
+        with self._stats_lock:
+            self._available[level] += created
+            self._stats['generated'] += created
+            self._stats['refills'] += 1
+            self._stats['last_refill_ms'] = round((time.perf_counter() - started) * 1000, 3)
+        return created
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.refill_once():
+                    self._stop.wait(self.refill_interval)
+                    continue
+            except Exception as e:
+                print(f"⚠️  Puzzle pool refill error: {e}")
+                self._stop.wait(1.0)
+            self._wake.wait(timeout=5.0)
+            self._wake.clear()
+
+    def start(self) -> None:
+        """Start the refill worker (call once per process, after forking)"""
+        if not self._available or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='puzzle-pool', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+
+    def stats(self) -> Dict[str, object]:
+        """Pool depth and refill counters for /api/health"""
+        with self._stats_lock:
+            snapshot = dict(self._stats)
+            snapshot['depth'] = {str(level): count for level, count in self._available.items()}
+        snapshot['target_depth'] = self.depth
+        snapshot['low_water'] = self.low_water
+        snapshot['refill_batch'] = self.refill_batch
+        snapshot['refill_interval_seconds'] = self.refill_interval
+        snapshot['worker_running'] = bool(self._thread and self._thread.is_alive())
+        return snapshot
+
+
+class SolvedPuzzles:
+    """Bounded negative cache of puzzle ids known to be solved.
+
+    Lets hot duplicate solve attempts be rejected without a database
+    round-trip. Only ever holds ids that are definitely solved (solving is
+    irreversible), so a miss just falls through to the atomic claim.
+    """
+
+    def __init__(self, max_size: int = SOLVED_CACHE_SIZE):
+        self.max_size = max_size
+        self._ids: 'OrderedDict[int, None]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.rejections = 0
+
+    def __contains__(self, puzzle_id: int) -> bool:
+        with self._lock:
+            if puzzle_id in self._ids:
+                self._ids.move_to_end(puzzle_id)
+                self.rejections += 1
+                return True
+            return False
+
+    def add(self, puzzle_id: int) -> None:
+        with self._lock:
+            self._ids[puzzle_id] = None
+            self._ids.move_to_end(puzzle_id)
+            while len(self._ids) > self.max_size:
+                self._ids.popitem(last=False)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'cached_ids': len(self._ids), 'max_size': self.max_size,
+                    'rejections': self.rejections}
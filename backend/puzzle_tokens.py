@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock stateless puzzles
+HMAC-signed puzzle tokens with in-memory replay protection
+"""
+
+import base64
+import hashlib
+import hmac
+import os
+import sqlite3
+import struct
+import threading
+import time
+from typing import Dict, NamedTuple, Optional, Set, Tuple
+
+import sats_ledger
+import stats
+
+PUZZLE_TOKENS = os.environ.get('TETROHASH_PUZZLE_TOKENS', '0') == '1'
+# Shared by every worker; required in token mode (server.check_config)
+PUZZLE_TOKEN_SECRET = os.environ.get('TETROHASH_PUZZLE_SECRET', '')
+PUZZLE_TOKEN_TTL = int(os.environ.get('TETROHASH_PUZZLE_TOKEN_TTL', 600))
+# Used token ids remembered per generation before rotating early
+REPLAY_GENERATION_SIZE = int(os.environ.get('TETROHASH_PUZZLE_REPLAY_SIZE', 100000))
+
+# version, token id, puzzle hash, difficulty, sats reward, expiry (unix seconds)
+PAYLOAD = struct.Struct('>B16s32sBII')
+TOKEN_VERSION = 1
+MAC_BYTES = 16
+
+
+class PuzzleToken(NamedTuple):
+    token_id: str
+    puzzle_hash: str
+    difficulty: int
+    sats_reward: int
+    expires_at: int
+
+
+class InvalidToken(Exception):
+    """Raised for malformed, tampered or foreign tokens"""
+
+
+class TokenExpired(InvalidToken):
+    """Raised for a correctly signed token past its expiry"""
+
+
+def _b64encode(raw: bytes) -> str:
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def _b64decode(text: str) -> bytes:
+    return base64.urlsafe_b64decode(text + '=' * (-len(text) % 4))
+
+
+def record_solve(conn: sqlite3.Connection, puzzle: PuzzleToken, player_id: int) -> bool:
+    """Store a verified token solve inside the caller's transaction; False if already stored"""
+    # The primary key settles races with other workers
+    claimed = conn.execute('''
+        INSERT OR IGNORE INTO puzzle_token_solves
+            (token_id, puzzle_hash, difficulty, sats_reward, solved_by)
+        VALUES (?, ?, ?, ?, ?)
+    ''', (puzzle.token_id, puzzle.puzzle_hash, puzzle.difficulty,
+          puzzle.sats_reward, player_id)).rowcount
+    if claimed:
+        sats_ledger.credit_player(conn, player_id, puzzle.sats_reward, 'puzzle_reward',
+                                  f'token:{puzzle.token_id}')
+        stats.bump(conn, puzzles_solved=1)
+    return bool(claimed)
+
+
+class TokenSigner:
+    """Issues and verifies self-contained puzzle tokens.
+
+    A token is base64url(payload).base64url(mac). The payload carries the
+    puzzle hash, difficulty, reward and expiry, and the MAC is a truncated
+    HMAC-SHA256 over it. Nothing is stored when a puzzle is generated; the
+    preimage itself never leaves the server.
+    """
+
+    def __init__(self, secret: str = PUZZLE_TOKEN_SECRET, ttl: int = PUZZLE_TOKEN_TTL):
+        self.ephemeral = not secret
+        self._key = secret.encode() if secret else os.urandom(32)
+        self.ttl = ttl
+
+    def _mac(self, payload: bytes) -> bytes:
+        return hmac.new(self._key, payload, hashlib.sha256).digest()[:MAC_BYTES]
+
+    def issue(self, puzzle_hash: str, difficulty: int, sats_reward: int,
+              now: Optional[float] = None) -> Tuple[str, PuzzleToken]:
+        """Sign a new puzzle; returns (token string, decoded token)"""
+        expires_at = int(now if now is not None else time.time()) + self.ttl
+        token_id = os.urandom(16)
+        payload = PAYLOAD.pack(TOKEN_VERSION, token_id, bytes.fromhex(puzzle_hash),
+                               difficulty, sats_reward, expires_at)
+        token = f'{_b64encode(payload)}.{_b64encode(self._mac(payload))}'
+        return token, PuzzleToken(token_id.hex(), puzzle_hash, difficulty, sats_reward, expires_at)
+
+    def verify(self, token: str, now: Optional[float] = None) -> PuzzleToken:
+        """Decode a token, raising InvalidToken/TokenExpired if it is not acceptable"""
+        try:
+            encoded_payload, encoded_mac = token.split('.')
+            payload = _b64decode(encoded_payload)
+            mac = _b64decode(encoded_mac)
+        except (AttributeError, ValueError) as e:
+            raise InvalidToken('Malformed puzzle token') from e
+
+        if len(payload) != PAYLOAD.size or not hmac.compare_digest(mac, self._mac(payload)):
+            raise InvalidToken('Invalid puzzle token signature')
+        version, token_id, puzzle_hash, difficulty, sats_reward, expires_at = PAYLOAD.unpack(payload)
+        if version != TOKEN_VERSION:
+            raise InvalidToken(f'Unsupported puzzle token version {version}')
+        if expires_at <= (now if now is not None else time.time()):
+            raise TokenExpired('Puzzle token expired')
+        return PuzzleToken(token_id.hex(), puzzle_hash.hex(), difficulty, sats_reward, expires_at)
+
+
+class UsedTokens:
+    """Rotating two-generation set of token ids already claimed in this worker.
+
+    New ids go into the current generation. Every `ttl` seconds (or when
+    the current generation reaches max_size) the previous generation is
+    dropped and the current one takes its place. Rotating on time alone
+    keeps an id for at least one TTL, by which point its token has expired
+    and is rejected on its own. A burst of more than max_size solves within
+    a TTL rotates early and can forget ids whose tokens are still valid;
+    replays of those fall through to the primary key on
+    puzzle_token_solves, which is the guarantee in every case (and across
+    workers). Memory is bounded by two generations.
+    """
+
+    def __init__(self, ttl: int = PUZZLE_TOKEN_TTL, max_size: int = REPLAY_GENERATION_SIZE):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._current: Set[str] = set()
+        self._previous: Set[str] = set()
+        self._rotated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.rotations = 0
+        self.rejections = 0
+
+    def _maybe_rotate(self) -> None:
+        """Advance a generation when due (lock held)"""
+        if (time.monotonic() - self._rotated_at >= self.ttl
+                or len(self._current) >= self.max_size):
+            self._previous, self._current = self._current, set()
+            self._rotated_at = time.monotonic()
+            self.rotations += 1
+
+    def claim(self, token_id: str) -> bool:
+        """Mark an id used; False if it already was"""
+        with self._lock:
+            self._maybe_rotate()
+            if token_id in self._current or token_id in self._previous:
+                self.rejections += 1
+                return False
+            self._current.add(token_id)
+            return True
+
+    def release(self, token_id: str) -> None:
+        """Forget a claim whose solve could not be recorded"""
+        with self._lock:
+            self._current.discard(token_id)
+            self._previous.discard(token_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {'remembered_ids': len(self._current) + len(self._previous),
+                    'generation_size': self.max_size, 'ttl_seconds': self.ttl,
+                    'rotations': self.rotations, 'rejections': self.rejections}
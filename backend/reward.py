@@ -6,13 +6,29 @@ import os
 import time
 import random
 import threading
+import uuid
 from typing import Optional
 
+import sats_ledger
+from db import get_pool
+from migrations import migrate
+from payouts import LNbitsClient
+from reward_events import AnimationSink, LogSink, MetricsSink, RewardPipeline, WebhookSink
+from wallet_journal import WalletJournal
+
 # Lightning Network Integration Settings
 ENABLE_LIGHTNING = False  # Set to True to enable real Lightning payouts
-LIGHTNING_API_URL = "https://your-lnbits-instance.com/api/v1/payments"
+LIGHTNING_API_URL = "https://your-lnbits-instance.com/api/v1"
 LIGHTNING_API_KEY = "your-api-key-here"
 
+# Journaled wallet storage (set TETROHASH_WALLET_JOURNAL=0 for the plain file)
+WALLET_JOURNAL = os.environ.get('TETROHASH_WALLET_JOURNAL', '1') == '1'
+# Ledger-backed wallet: credit this player's account in the game database instead
+WALLET_PLAYER_ID = os.environ.get('TETROHASH_WALLET_PLAYER_ID')
+WALLET_LEDGER_DB = os.environ.get('TETROHASH_WALLET_LEDGER_DB', 'tetrohash.db')
+# Headless: no animation or prints, for batch processing
+REWARD_HEADLESS = os.environ.get('TETROHASH_REWARD_HEADLESS', '0') == '1'
+
 class CoinAnimation:
     """Handles ASCII coin drop animation"""
     
@@ -61,12 +77,25 @@ class CoinAnimation:
 class Wallet:
     """Manages local SAT wallet"""
     
-    def __init__(self, wallet_file: str = "wallet.txt"):
+    def __init__(self, wallet_file: str = "wallet.txt", journaled: bool = WALLET_JOURNAL,
+                 player_id: Optional[int] = WALLET_PLAYER_ID, ledger_db: str = WALLET_LEDGER_DB):
         self.wallet_file = wallet_file
+        # Ledger: the player's account in the shared sats ledger (same balance as the API)
+        self.player_id = int(player_id) if player_id is not None else None
+        self.ledger = get_pool(ledger_db) if self.player_id is not None else None
+        # Journal: append-only deltas with group commit and crash recovery
+        self.journal = WalletJournal(wallet_file) if journaled and not self.ledger else None
         self.total_sats = self.load_wallet()
         
     def load_wallet(self) -> int:
         """Load total SATs from wallet file"""
+        if self.ledger:
+            migrate(self.ledger)
+            with self.ledger.connection() as conn:
+                return sats_ledger.balance(conn, sats_ledger.player_account(self.player_id))
+        if self.journal:
+            # Raises on a corrupt snapshot rather than reading it as 0
+            return self.journal.start()
         try:
             if os.path.exists(self.wallet_file):
                 with open(self.wallet_file, 'r') as f:
@@ -77,20 +106,50 @@ class Wallet:
     
     def save_wallet(self) -> None:
         """Save total SATs to wallet file"""
+        if self.ledger:
+            # The ledger is append-only: record the difference as an adjustment
+            with self.ledger.transaction() as conn:
+                account = sats_ledger.player_account(self.player_id)
+                delta = self.total_sats - sats_ledger.balance(conn, account)
+                sats_ledger.credit_player(conn, self.player_id, delta, 'adjustment')
+            return
+        if self.journal:
+            self.journal.snapshot(self.total_sats)
+            return
         try:
             with open(self.wallet_file, 'w') as f:
                 f.write(str(self.total_sats))
         except Exception as e:
             print(f"Warning: Could not save wallet: {e}")
     
-    def add_sats(self, amount: int) -> None:
-        """Add SATs to wallet"""
+    def add_sats(self, amount: int, kind: str = 'local_reward',
+                 reference: Optional[str] = None) -> None:
+        """Add SATs to wallet (kind and reference are recorded by the ledger backend)"""
+        if self.ledger:
+            with self.ledger.transaction() as conn:
+                sats_ledger.credit_player(conn, self.player_id, amount, kind, reference)
+                self.total_sats = sats_ledger.balance(
+                    conn, sats_ledger.player_account(self.player_id))
+            return
+        if self.journal:
+            self.total_sats = self.journal.append(amount)
+            return
         self.total_sats += amount
         self.save_wallet()
         
     def get_balance(self) -> int:
         """Get current wallet balance"""
         return self.total_sats
+    
+    def flush(self) -> None:
+        """Wait until every credit so far is on disk"""
+        if self.journal:
+            self.journal.wait_durable()
+    
+    def close(self) -> None:
+        """Commit buffered credits and stop the journal writer"""
+        if self.journal:
+            self.journal.close()
 
 class LightningPayout:
     """Handles Lightning Network payouts"""
@@ -98,69 +157,63 @@ class LightningPayout:
     def __init__(self, api_url: str, api_key: str):
         self.api_url = api_url
         self.api_key = api_key
+        self._client = None
         
-    def send_payment(self, amount_sats: int, invoice: str) -> dict:
-        """Send Lightning payment"""
+    @property
+    def client(self) -> LNbitsClient:
+        """One pooled keep-alive session, created on first use"""
+        if self._client is None:
+            self._client = LNbitsClient(self.api_url, self.api_key)
+        return self._client
+        
+    def send_payment(self, amount_sats: int, invoice: str,
+                     idempotency_key: Optional[str] = None) -> dict:
+        """Send Lightning payment (single attempt; see payouts.PayoutEngine for retries)"""
         try:
-            import requests
-            
-            headers = {
-                'X-Api-Key': self.api_key,
-                'Content-Type': 'application/json'
-            }
-            
-            data = {
-                'out': True,
-                'bolt11': invoice,
-                'amount': amount_sats
-            }
-            
-            response = requests.post(
-                f"{self.api_url}/payments",
-                json=data,
-                headers=headers,
-                timeout=10
-            )
-            
-            if response.status_code == 200:
-                return {
-                    'success': True,
-                    'response': response.json(),
-                    'message': f'✅ Lightning payment of {amount_sats} sats sent!'
-                }
-            else:
-                return {
-                    'success': False,
-                    'error': f'HTTP {response.status_code}: {response.text}',
-                    'message': f'❌ Lightning payment failed'
-                }
-                
-        except ImportError:
+            result = self.client.pay(invoice, amount_sats, idempotency_key or uuid.uuid4().hex)
+        except RuntimeError as e:
             return {
                 'success': False,
-                'error': 'requests library not installed',
+                'error': str(e),
                 'message': '❌ Lightning payment requires requests library'
             }
-        except Exception as e:
+        
+        if result.success:
             return {
-                'success': False,
-                'error': str(e),
-                'message': f'❌ Lightning payment error: {e}'
+                'success': True,
+                'response': result.response,
+                'message': f'✅ Lightning payment of {amount_sats} sats sent!'
             }
+        return {
+            'success': False,
+            'error': result.error,
+            'retryable': result.retryable,
+            'message': f'❌ Lightning payment failed'
+        }
 
 class RewardSystem:
     """Main reward system that handles SAT rewards and payouts"""
     
-    def __init__(self):
-        self.wallet = Wallet()
+    def __init__(self, headless: bool = REWARD_HEADLESS, sinks: Optional[list] = None,
+                 wallet: Optional[Wallet] = None):
+        self.wallet = wallet or Wallet()
         self.coin_animation = CoinAnimation()
+        self.headless = headless
         self.lightning = None
         
+        if sinks is None:
+            sinks = [LogSink(), MetricsSink(), WebhookSink()]
+            if not headless:
+                sinks.insert(0, AnimationSink(self.coin_animation))
+        # Animation, logging and delivery run on sink threads, never the caller's.
+        # Headless batches keep every event: back-pressure instead of drops.
+        self.events = RewardPipeline(sinks, block_when_full=headless)
+        
         if ENABLE_LIGHTNING:
             self.lightning = LightningPayout(LIGHTNING_API_URL, LIGHTNING_API_KEY)
     
     def process_reward(self, reward_amount: int, puzzle_solved: bool = True) -> dict:
-        """Process a reward - show animation and add to wallet"""
+        """Process a reward - add to wallet and publish the event (returns immediately)"""
         if not puzzle_solved:
             return {
                 'success': False,
@@ -168,21 +221,19 @@ class RewardSystem:
                 'amount': 0
             }
         
-        # Add to local wallet
+        # Add to local wallet (journaled; see Wallet.flush() for durability)
         self.wallet.add_sats(reward_amount)
-        
-        # Show coin drop animation
-        self.coin_animation.animate_coin_drop(reward_amount)
-        
-        # Display wallet balance
         balance = self.wallet.get_balance()
-        print(f"\n💰 Total Wallet Balance: {balance} sats")
+        
+        # Coin drop animation and balance display happen on the animation sink
+        event = self.events.publish(reward_amount, balance, source='puzzle')
         
         return {
             'success': True,
             'message': f'Reward of {reward_amount} sats added to wallet',
             'amount': reward_amount,
-            'total_balance': balance
+            'total_balance': balance,
+            'event_id': event.event_id
         }
     
     def send_lightning_payment(self, amount_sats: int, invoice: str) -> dict:
@@ -204,8 +255,9 @@ class RewardSystem:
         
         if result['success']:
             # Deduct from wallet
-            self.wallet.add_sats(-amount_sats)
+            self.wallet.add_sats(-amount_sats, kind='lightning_payout')
             result['total_balance'] = self.wallet.get_balance()
+            self.events.publish(-amount_sats, result['total_balance'], source='lightning')
         
         return result
     
@@ -217,6 +269,11 @@ class RewardSystem:
         """Reset wallet to zero"""
         self.wallet.total_sats = 0
         self.wallet.save_wallet()
+    
+    def close(self) -> None:
+        """Let sinks finish queued events, then commit the wallet"""
+        self.events.close()
+        self.wallet.close()
 
 def main():
     """Test the reward system"""
@@ -237,6 +294,9 @@ def main():
         # This would require a real invoice
         # result = reward_system.send_lightning_payment(100, "lnbc...")
         # print(f"Lightning result: {result}")
+    
+    # Wait for the coin drop animation before exiting
+    reward_system.close()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock reward events
+Fan-out of reward events to pluggable sinks, each on its own worker thread
+"""
+
+import itertools
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, NamedTuple, Optional
+
+# Events buffered per sink before new ones are dropped (or, if blocking, waited on)
+SINK_QUEUE_SIZE = int(os.environ.get('TETROHASH_REWARD_SINK_QUEUE_SIZE', 1000))
+
+_STOP = object()
+
+
+class RewardEvent(NamedTuple):
+    event_id: int
+    amount: int
+    total_balance: int
+    source: str
+    timestamp: float
+
+    def to_dict(self) -> Dict[str, object]:
+        return self._asdict()
+
+
+class Sink:
+    """Consumer of reward events; handle() runs on the sink's own thread"""
+
+    name = 'sink'
+
+    def handle(self, event: RewardEvent) -> None:
+        raise NotImplementedError
+
+    def close(self) -> None:
+        """Called on the worker thread after the last event"""
+
+
+class AnimationSink(Sink):
+    """Terminal coin drop for credits (slow by design, hence off the caller's thread)"""
+
+    name = 'animation'
+
+    def __init__(self, animation):
+        self.animation = animation
+
+    def handle(self, event: RewardEvent) -> None:
+        if event.amount > 0:
+            self.animation.animate_coin_drop(event.amount)
+            print(f"\n💰 Total Wallet Balance: {event.total_balance} sats")
+
+
+class LogSink(Sink):
+    name = 'log'
+
+    def __init__(self, logger: Optional[logging.Logger] = None):
+        self.logger = logger or logging.getLogger('tetrohash.rewards')
+
+    def handle(self, event: RewardEvent) -> None:
+        self.logger.info('reward %d: %+d sats from %s, balance %d',
+                         event.event_id, event.amount, event.source, event.total_balance)
+
+
+class MetricsSink(Sink):
+    """Running totals, readable from any thread"""
+
+    name = 'metrics'
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {'events': 0, 'credited_sats': 0, 'debited_sats': 0,
+                         'largest_credit': 0, 'last_event_lag_ms': 0.0}
+
+    def handle(self, event: RewardEvent) -> None:
+        with self._lock:
+            self._metrics['events'] += 1
+            if event.amount >= 0:
+                self._metrics['credited_sats'] += event.amount
+                self._metrics['largest_credit'] = max(self._metrics['largest_credit'], event.amount)
+            else:
+                self._metrics['debited_sats'] -= event.amount
+            self._metrics['last_event_lag_ms'] = round((time.time() - event.timestamp) * 1000, 3)
+
+    def snapshot(self) -> Dict[str, object]:
+        with self._lock:
+            return dict(self._metrics)
+
+
+class WebhookSink(Sink):
+    """Stand-in for an outbound webhook: serializes each event as the request body.
+
+    `deliver` receives the JSON body. The default keeps the most recent
+    bodies in memory, so tests and batch jobs can inspect what would have
+    been sent.
+    """
+
+    name = 'webhook'
+
+    def __init__(self, deliver: Optional[Callable[[str], None]] = None, keep: int = 1000):
+        self.delivered: Deque[str] = deque(maxlen=keep)
+        self.deliver = deliver or self.delivered.append
+
+    def handle(self, event: RewardEvent) -> None:
+        self.deliver(json.dumps({'type': 'reward', **event.to_dict()}, separators=(',', ':')))
+
+
+class _SinkWorker:
+    """Bounded queue plus the thread that drains it into one sink"""
+
+    def __init__(self, sink: Sink, queue_size: int):
+        self.sink = sink
+        self.queue: 'queue.Queue' = queue.Queue(maxsize=queue_size)
+        self.stats = {'delivered': 0, 'dropped': 0, 'errors': 0}
+        self.lock = threading.Lock()  # publishers on many threads count drops
+        self.thread = threading.Thread(target=self._run, name=f'reward-sink-{sink.name}',
+                                       daemon=True)
+        self.thread.start()
+
+    def offer(self, event: RewardEvent, block: bool) -> bool:
+        try:
+            self.queue.put(event, block=block)
+            return True
+        except queue.Full:
+            with self.lock:
+                self.stats['dropped'] += 1
+            return False
+
+    def _run(self) -> None:
+        while True:
+            event = self.queue.get()
+            if event is _STOP:
+                break
+            try:
+                self.sink.handle(event)
+                self.stats['delivered'] += 1
+            except Exception as e:
+                self.stats['errors'] += 1
+                print(f"⚠️  Reward sink {self.sink.name} error: {e}")
+        self.sink.close()
+
+
+class RewardPipeline:
+    """Publishes reward events to every sink without waiting for any of them.
+
+    publish() only enqueues. A slow sink (such as the terminal animation)
+    delays nothing but its own queue. When that queue is full, its new
+    events are dropped and counted, and the caller is never blocked.
+    Batch jobs that must not lose events set block_when_full. They then
+    wait for queue space instead, which only makes sense with fast sinks.
+    """
+
+    def __init__(self, sinks: List[Sink], queue_size: int = SINK_QUEUE_SIZE,
+                 block_when_full: bool = False):
+        self._ids = itertools.count(1)
+        self.block_when_full = block_when_full
+        self._workers = [_SinkWorker(sink, queue_size) for sink in sinks]
+
+    def publish(self, amount: int, total_balance: int, source: str = 'puzzle') -> RewardEvent:
+        event = RewardEvent(next(self._ids), amount, total_balance, source, time.time())
+        for worker in self._workers:
+            worker.offer(event, self.block_when_full)
+        return event
+
+    def sink(self, name: str) -> Optional[Sink]:
+        return next((w.sink for w in self._workers if w.sink.name == name), None)
+
+    def close(self, timeout: float = 30.0) -> None:
+        """Let every sink finish what is queued, then stop its thread.
+
+        Gives up after `timeout` seconds in total; a sink still busy then is
+        left to its daemon thread with whatever it has not delivered.
+        """
+        deadline = time.monotonic() + timeout
+        for worker in self._workers:
+            if not worker.thread.is_alive():
+                continue
+            try:
+                worker.queue.put(_STOP, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                print(f"⚠️  Reward sink {worker.sink.name} still full at shutdown; "
+                      f"abandoning {worker.queue.qsize()} queued events")
+        for worker in self._workers:
+            worker.thread.join(timeout=max(0.0, deadline - time.monotonic()))
+
+    def stats(self) -> Dict[str, Dict[str, int]]:
+        return {w.sink.name: {**w.stats, 'queued': w.queue.qsize()} for w in self._workers}
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock sats ledger
+Double-entry accounting for every sat credited or debited, with per-day rollups
+"""
+
+import sqlite3
+import sys
+from collections import defaultdict
+from datetime import date, datetime, timedelta, timezone
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from db import get_pool
+
+# Where each kind of movement draws from (or pays into) on the other side
+SYSTEM_ACCOUNTS = {
+    'game_reward': 'system:game_rewards',
+    'puzzle_reward': 'system:puzzle_rewards',
+    'local_reward': 'system:local_rewards',
+    'lightning_payout': 'system:lightning_payouts',
+    'opening_balance': 'system:opening_balances',
+    'adjustment': 'system:adjustments',
+}
+# Kinds that count as "earned" in range queries (opening balances predate the ledger)
+EARNING_KINDS = ('game_reward', 'puzzle_reward', 'local_reward')
+
+Entry = Tuple[str, int]  # (account, signed amount)
+
+
+class Posting(NamedTuple):
+    kind: str
+    entries: Sequence[Entry]
+    reference: Optional[str] = None
+
+
+class UnbalancedPosting(ValueError):
+    """Raised when a posting's entries do not sum to zero"""
+
+
+def player_account(player_id: int) -> str:
+    return f'player:{player_id}'
+
+
+def _player_id(account: str) -> Optional[int]:
+    prefix, _, rest = account.partition(':')
+    return int(rest) if prefix == 'player' and rest.isdigit() else None
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc).replace(microsecond=0, tzinfo=None)
+
+
+def post_many(conn: sqlite3.Connection, postings: Iterable[Posting],
+              at: Optional[datetime] = None) -> List[Optional[int]]:
+    """Append balanced postings inside the caller's transaction.
+
+    Each posting becomes one ledger_transactions row and its entries. The
+    cached balances in ledger_accounts (and players.total_sats for player
+    accounts) and the per-day rollups are updated in the same transaction.
+    Rows are written with executemany, and balance and rollup deltas are
+    folded per account first, so a batch costs a handful of statements.
+    A posting whose reference was already recorded is skipped, which makes
+    retries idempotent. Returns the transaction id per posting (None for
+    skipped ones).
+    """
+    at = at or _now()
+    created_at = at.strftime('%Y-%m-%d %H:%M:%S')
+    day = at.date().isoformat()
+
+    txn_ids: List[Optional[int]] = []
+    entry_rows = []
+    balances: Dict[str, int] = defaultdict(int)
+    rollups: Dict[Tuple[str, str], List[int]] = defaultdict(lambda: [0, 0])
+    for posting in postings:
+        entries = [(account, amount) for account, amount in posting.entries if amount]
+        if sum(amount for _, amount in entries):
+            raise UnbalancedPosting(f'{posting.kind} entries do not sum to zero: {entries}')
+        if not entries:
+            txn_ids.append(None)
+            continue
+        cursor = conn.execute('''
+            INSERT OR IGNORE INTO ledger_transactions (kind, reference, created_at)
+            VALUES (?, ?, ?)
+        ''', (posting.kind, posting.reference, created_at))
+        if not cursor.rowcount:
+            txn_ids.append(None)
+            continue
+        txn_ids.append(cursor.lastrowid)
+        for account, amount in entries:
+            entry_rows.append((cursor.lastrowid, account, amount, created_at))
+            balances[account] += amount
+            rollup = rollups[(account, posting.kind)]
+            rollup[0 if amount > 0 else 1] += abs(amount)
+
+    if not entry_rows:
+        return txn_ids
+
+    conn.executemany('''
+        INSERT INTO ledger_entries (txn_id, account, amount, created_at) VALUES (?, ?, ?, ?)
+    ''', entry_rows)
+    conn.executemany('''
+        INSERT INTO ledger_accounts (account, balance, updated_at) VALUES (?, ?, ?)
+        ON CONFLICT (account) DO UPDATE
+        SET balance = balance + excluded.balance, updated_at = excluded.updated_at
+    ''', [(account, delta, created_at) for account, delta in balances.items()])
+    conn.executemany('''
+        INSERT INTO ledger_daily (account, day, kind, credits, debits) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (account, day, kind) DO UPDATE
+        SET credits = credits + excluded.credits, debits = debits + excluded.debits
+    ''', [(account, day, kind, credits, debits)
+          for (account, kind), (credits, debits) in rollups.items()])
+    # players.total_sats is the API's view of the same balance
+    conn.executemany('UPDATE players SET total_sats = total_sats + ? WHERE id = ?', [
+        (delta, _player_id(account)) for account, delta in balances.items()
+        if _player_id(account) is not None and delta
+    ])
+    return txn_ids
+
+
+def post(conn: sqlite3.Connection, kind: str, entries: Sequence[Entry],
+         reference: Optional[str] = None, at: Optional[datetime] = None) -> Optional[int]:
+    """Append one balanced posting; None if its reference was already posted"""
+    return post_many(conn, [Posting(kind, entries, reference)], at)[0]
+
+
+def reward(kind: str, player_id: int, amount: int, reference: Optional[str] = None) -> Posting:
+    """Posting that moves `amount` from the kind's system account to a player"""
+    return Posting(kind, [(SYSTEM_ACCOUNTS[kind], -amount), (player_account(player_id), amount)],
+                   reference)
+
+
+def credit_player(conn: sqlite3.Connection, player_id: int, amount: int, kind: str,
+                  reference: Optional[str] = None) -> Optional[int]:
+    """Credit (or, with a negative amount, debit) a player against a system account"""
+    return post_many(conn, [reward(kind, player_id, amount, reference)])[0]
+
+
+def balance(conn: sqlite3.Connection, account: str) -> int:
+    """Cached running balance (one primary-key lookup)"""
+    row = conn.execute('SELECT balance FROM ledger_accounts WHERE account = ?',
+                       (account,)).fetchone()
+    return row[0] if row else 0
+
+
+def earned(conn: sqlite3.Connection, account: str, start: date, end: date,
+           kinds: Sequence[str] = EARNING_KINDS) -> Dict[str, object]:
+    """Sats earned (credits of `kinds`) and spent (all debits) over the days
+    [start, end), read from the daily rollups: at most a few rows per day
+    instead of every entry in the range.
+    """
+    placeholders = ','.join('?' * len(kinds))
+    rows = conn.execute(f'''
+        SELECT day, SUM(CASE WHEN kind IN ({placeholders}) THEN credits ELSE 0 END), SUM(debits)
+        FROM ledger_daily
+        WHERE account = ? AND day >= ? AND day < ?
+        GROUP BY day ORDER BY day
+    ''', (*kinds, account, start.isoformat(), end.isoformat())).fetchall()
+    return {
+        'account': account,
+        'from': start.isoformat(),
+        'to': end.isoformat(),
+        'earned': sum(credits for _, credits, _ in rows),
+        'spent': sum(debits for _, _, debits in rows),
+        'days': [{'day': day, 'earned': credits, 'spent': debits} for day, credits, debits in rows],
+    }
+
+
+def history(conn: sqlite3.Connection, account: str, limit: int = 50,
+            before_id: Optional[int] = None) -> List[Dict[str, object]]:
+    """Most recent entries for an account, newest first"""
+    rows = conn.execute('''
+        SELECT e.id, e.txn_id, t.kind, t.reference, e.amount, e.created_at
+        FROM ledger_entries e JOIN ledger_transactions t ON t.id = e.txn_id
+        WHERE e.account = ? AND e.id < ?
+        ORDER BY e.id DESC LIMIT ?
+    ''', (account, before_id if before_id is not None else 2 ** 63 - 1, limit)).fetchall()
+    return [dict(zip(('entry_id', 'txn_id', 'kind', 'reference', 'amount', 'created_at'), row))
+            for row in rows]
+
+
+def backfill(conn: sqlite3.Connection) -> None:
+    """Open every existing player's account at their current total_sats"""
+    at = _now()
+    players = conn.execute(
+        'SELECT id, total_sats FROM players WHERE total_sats != 0').fetchall()
+    if not players:
+        return
+    postings = [reward('opening_balance', player_id, total_sats, f'opening:{player_id}')
+                for player_id, total_sats in players]
+    # Undo the mirror update post_many is about to make
+    conn.executemany('UPDATE players SET total_sats = total_sats - ? WHERE id = ?',
+                     [(total_sats, player_id) for player_id, total_sats in players])
+    post_many(conn, postings, at)
+
+
+def verify(conn: sqlite3.Connection) -> Dict[str, list]:
+    """Audit the ledger; returns the problems found by category (empty if none)"""
+    problems = {
+        'unbalanced_transactions': conn.execute('''
+            SELECT txn_id, SUM(amount) FROM ledger_entries
+            GROUP BY txn_id HAVING SUM(amount) != 0
+        ''').fetchall(),
+        'stale_balances': conn.execute('''
+            SELECT a.account, a.balance, COALESCE(SUM(e.amount), 0) AS actual
+            FROM ledger_accounts a LEFT JOIN ledger_entries e ON e.account = a.account
+            GROUP BY a.account HAVING a.balance != actual
+        ''').fetchall(),
+        'stale_rollups': conn.execute('''
+            SELECT r.account, r.day, r.kind FROM ledger_daily r
+            LEFT JOIN (
+                SELECT e.account, date(e.created_at) AS day, t.kind,
+                       SUM(MAX(e.amount, 0)) AS credits, SUM(MAX(-e.amount, 0)) AS debits
+                FROM ledger_entries e JOIN ledger_transactions t ON t.id = e.txn_id
+                GROUP BY e.account, day, t.kind
+            ) s ON s.account = r.account AND s.day = r.day AND s.kind = r.kind
+            WHERE s.credits IS NULL OR r.credits != s.credits OR r.debits != s.debits
+        ''').fetchall(),
+        'player_mismatches': conn.execute('''
+            SELECT p.id, p.total_sats, COALESCE(a.balance, 0) FROM players p
+            LEFT JOIN ledger_accounts a ON a.account = 'player:' || p.id
+            WHERE p.total_sats != COALESCE(a.balance, 0)
+        ''').fetchall(),
+    }
+    return {name: rows for name, rows in problems.items() if rows}
+
+
+def week_range(today: Optional[date] = None) -> Tuple[date, date]:
+    """[Monday, next Monday) of the week containing `today`"""
+    today = today or _now().date()
+    start = today - timedelta(days=today.weekday())
+    return start, start + timedelta(days=7)
+
+
+def main():
+    """Audit the ledger of a database file"""
+    db_file = sys.argv[1] if len(sys.argv) > 1 else 'tetrohash.db'
+    with get_pool(db_file).connection() as conn:
+        problems = verify(conn)
+    if not problems:
+        print("✅ Sats ledger balances, rollups and player totals all agree")
+        return 0
+    for name, rows in problems.items():
+        print(f"⚠️  {name}: {len(rows)} (first: {rows[0]})")
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
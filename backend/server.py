@@ -4,18 +4,47 @@ TetroHashUnlock API Server
 Provides REST API endpoints for game data, leaderboards, and Bitcoin integration
 """
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
+from werkzeug.middleware.proxy_fix import ProxyFix
 import json
 import os
+from functools import wraps
 import hashlib
+import hmac
 import time
-from datetime import datetime
+from datetime import date, datetime
 import sqlite3
 from typing import Dict, List, Optional
 
+import admission
+from cache import ResponseCache
+from db import get_pool
+import export
+import leaderboard
+from leaderboard import LeaderboardIndex
+from metrics import RequestMetrics
+from migrations import migrate
+import games
+import ingest
+from puzzle_pool import PuzzlePool, SolvedPuzzles, claim_solution
+import proof_of_work
+from proof_of_work import InvalidTemplate, TemplateExpired, TemplateSigner
+import puzzle_tokens
+from puzzle_tokens import InvalidToken, TokenExpired, TokenSigner, UsedTokens
+import sats_ledger
+import static_assets
+import stats
+
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
+app.config['ASYNC_SUBMIT'] = ingest.ASYNC_SUBMIT  # write-behind game submission
+app.config['PUZZLE_TOKENS'] = puzzle_tokens.PUZZLE_TOKENS  # stateless signed puzzles
+app.config['PROOF_OF_WORK'] = proof_of_work.PROOF_OF_WORK  # signed block templates
+app.config['RATE_LIMIT'] = admission.RATE_LIMIT  # per-IP/per-player budgets, write cap
+if admission.PROXY_HOPS:
+    # Client addresses come from X-Forwarded-For set by this many trusted proxies
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=admission.PROXY_HOPS)
 
 ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
 STATIC_FILES = {
@@ -25,94 +54,183 @@ STATIC_FILES = {
     "sound.js",
     "styles.css",
 }
+GAME_MODES = games.GAME_MODES
+MAX_BATCH_SIZE = 1000
+MAX_HISTORY_PAGE = 1000
+HISTORY_CHUNK_ROWS = 100  # games per streamed chunk
+ADMISSION_EXEMPT = {'health_check', 'get_metrics'}  # probes and scrapes are never limited
 
 # Database setup
-DB_FILE = 'tetrohash.db'
+DB_FILE = os.environ.get('TETROHASH_DB_FILE', 'tetrohash.db')
+db_pool = get_pool(DB_FILE)
+rankings = LeaderboardIndex(db_pool, GAME_MODES)
+response_cache = ResponseCache()
+frontend_assets = static_assets.StaticAssets(ROOT_DIR, STATIC_FILES)  # hashed + precompressed
+admission_control = admission.Admission()
+request_metrics = RequestMetrics()
+app.wsgi_app = request_metrics.middleware(app.wsgi_app)  # timing, sampled SQL, Server-Timing
+request_metrics.gauge('tetrohash_db_pool_in_use', 'Pooled connections checked out',
+                      lambda: db_pool.stats()['in_use'])
+request_metrics.gauge('tetrohash_db_pool_waits', 'Checkouts that had to wait (cumulative)',
+                      lambda: db_pool.stats()['waits'])
+request_metrics.gauge('tetrohash_response_cache_hit_ratio', 'Response cache hit ratio',
+                      lambda: response_cache.stats()['hit_ratio'])
+
+def invalidate_after_commit(*tags: str):
+    """Drop cached responses for these tags once the current write commits"""
+    db_pool.after_commit(lambda: response_cache.invalidate(*tags))
+
+def invalidate_games(records: List[Dict]):
+    """Invalidate the stats, leaderboards and players touched by new games"""
+    tags = {'stats'}
+    for record in records:
+        tags.add(f"leaderboard:{record['game_mode']}")
+        tags.add(f"player:{record['player_id']}")
+    invalidate_after_commit(*tags)
+
+def create_player(conn: sqlite3.Connection, username: str, wallet_address: str) -> int:
+    """Insert a player inside the caller's transaction (IntegrityError if the name is taken)"""
+    cursor = conn.execute(
+        'INSERT INTO players (username, wallet_address) VALUES (?, ?)',
+        (username, wallet_address)
+    )
+    stats.bump(conn, total_players=1)
+    invalidate_after_commit('stats')
+    return cursor.lastrowid
+
+def write_queued_games(conn: sqlite3.Connection, records: List[Dict]):
+    """Ingestion queue writer: store a drained batch of games"""
+    games.record_games(conn, records, rankings)
+    invalidate_games(records)
+
+ingest_queue = ingest.IngestQueue(db_pool, write_queued_games)
+# generate_preimage/puzzle_reward are looked up at call time (defined below)
+puzzle_pool = PuzzlePool(db_pool, lambda level: generate_preimage(level),
+                         lambda level: puzzle_reward(level))
+solved_puzzles = SolvedPuzzles()
+token_signer = TokenSigner()
+used_tokens = UsedTokens()
+pow_templates = TemplateSigner()
+used_templates = UsedTokens(ttl=proof_of_work.POW_TEMPLATE_TTL)
+
+def check_config():
+    """Refuse to start with signing keys that other workers would not share"""
+    if app.config['PUZZLE_TOKENS'] and token_signer.ephemeral:
+        raise RuntimeError("TETROHASH_PUZZLE_SECRET must be set when TETROHASH_PUZZLE_TOKENS=1: "
+                           "every worker has to verify the others' puzzle tokens")
+    if app.config['PROOF_OF_WORK'] and pow_templates.ephemeral:
+        raise RuntimeError("TETROHASH_POW_SECRET must be set when TETROHASH_POW=1: "
+                           "every worker has to verify the others' block templates")
 
 def init_db():
-    """Initialize SQLite database with required tables"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Players table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS players (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            wallet_address TEXT,
-            total_sats INTEGER DEFAULT 0,
-            games_played INTEGER DEFAULT 0,
-            high_score INTEGER DEFAULT 0,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-        )
-    ''')
-    
-    # Games table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS games (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            player_id INTEGER,
-            game_mode TEXT NOT NULL,
-            score INTEGER DEFAULT 0,
-            lines_cleared INTEGER DEFAULT 0,
-            level_reached INTEGER DEFAULT 0,
-            sats_earned INTEGER DEFAULT 0,
-            duration_seconds INTEGER DEFAULT 0,
-            ai_enabled BOOLEAN DEFAULT FALSE,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (player_id) REFERENCES players (id)
-        )
-    ''')
-    
-    # Leaderboards table (cached for performance)
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS leaderboards (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            game_mode TEXT NOT NULL,
-            player_id INTEGER,
-            score INTEGER NOT NULL,
-            rank INTEGER NOT NULL,
-            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (player_id) REFERENCES players (id)
-        )
-    ''')
-    
-    # Bitcoin puzzles table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS bitcoin_puzzles (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            puzzle_hash TEXT UNIQUE NOT NULL,
-            preimage TEXT NOT NULL,
-            difficulty INTEGER DEFAULT 1,
-            sats_reward INTEGER DEFAULT 250,
-            solved_by INTEGER,
-            solved_at TIMESTAMP,
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (solved_by) REFERENCES players (id)
-        )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-# Initialize database on startup
-init_db()
+    """Bring the database schema up to date and load the ranking index"""
+    check_config()
+    migrate(db_pool)
+    rankings.load()
+    if not app.config['PUZZLE_TOKENS']:
+        puzzle_pool.start()
+    if app.config['ASYNC_SUBMIT']:
+        # Replays anything a previous process accepted but never wrote
+        ingest_queue.start()
+
+def cached_response(*tag_templates: str):
+    """Serve a read endpoint from response_cache.
+    
+    Tags are formatted with the view's URL arguments, e.g.
+    'leaderboard:{game_mode}'. Only 200 responses are cached. Clients get an
+    ETag and a 304 when their If-None-Match still matches.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(**kwargs):
+            if not response_cache.enabled:
+                return view(**kwargs)
+            
+            key = (request.path, request.query_string)
+            entry = response_cache.get(key)
+            if entry is None:
+                tags = tuple(template.format(**kwargs) for template in tag_templates)
+                generation = response_cache.generation()
+                response = app.make_response(view(**kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.put(key, response.get_data(), response.mimetype,
+                                           tags, generation)
+            
+            if request.if_none_match.contains(entry.etag):
+                response_cache.count_not_modified()
+                response = app.response_class(status=304)
+            else:
+                response = app.response_class(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+@app.before_request
+def admit_request():
+    """Spend the client's read or write budget; cap concurrent writes"""
+    if not app.config['RATE_LIMIT'] or request.endpoint in ADMISSION_EXEMPT:
+        return None
+    
+    write = request.method not in ('GET', 'HEAD', 'OPTIONS')
+    # Only URL ids: a player_id in a body is unauthenticated and never keys a budget
+    player_id = (request.view_args or {}).get('player_id')
+    
+    wait = admission_control.check(write, request.remote_addr, player_id)
+    if wait:
+        return (jsonify({'error': 'Too many requests', 'retry_after': round(wait, 3)}), 429,
+                {'Retry-After': admission.retry_after(wait)})
+    
+    if write:
+        try:
+            admission_control.writes.acquire()
+        except admission.Overloaded as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        g.write_slot = True
+    return None
+
+@app.teardown_request
+def release_write_slot(exc):
+    """Hand the write slot back however the request ended"""
+    if g.pop('write_slot', False):
+        admission_control.writes.release()
 
 @app.route('/')
 def index():
     """Serve the main game page"""
-    return send_from_directory(ROOT_DIR, 'index.html')
+    return serve_asset('index.html')
 
 
 @app.route('/<path:filename>')
 def static_files(filename):
     """Serve frontend assets from the repo root"""
-    if filename not in STATIC_FILES and not (
-        filename.startswith("assets/") and ".." not in filename
-    ):
-        return jsonify({'error': 'Not found'}), 404
+    if filename.startswith("assets/") and ".." not in filename:
+        return send_from_directory(ROOT_DIR, filename)
 
-    return send_from_directory(ROOT_DIR, filename)
+    return serve_asset(filename)
+
+def serve_asset(url_path: str):
+    """A precompressed bundle file; hashed URLs are immutable, the rest revalidate"""
+    if app.debug:
+        frontend_assets.reload_if_changed()
+    asset, hashed = frontend_assets.lookup(url_path)
+    if asset is None:
+        return jsonify({'error': 'Not found'}), 404
+    
+    variant = asset.negotiate(request.accept_encodings)
+    if request.if_none_match.contains(variant.etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(variant.body, mimetype=asset.mimetype)
+        if variant.encoding:
+            response.headers['Content-Encoding'] = variant.encoding
+    response.set_etag(variant.etag)
+    response.headers['Cache-Control'] = (static_assets.IMMUTABLE_CACHE_CONTROL if hashed
+                                         else static_assets.REVALIDATE_CACHE_CONTROL)
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @app.route('/api/health')
 def health_check():
@@ -121,9 +239,22 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'version': '3.0.0',
-        'game_modes': ['normal', 'puzzle', 'ai-battle', 'learning']
+        'game_modes': GAME_MODES,
+        'db_pool': db_pool.stats(),
+        'response_cache': response_cache.stats(),
+        'static_assets': frontend_assets.stats(),
+        'admission': {'enabled': app.config['RATE_LIMIT'], **admission_control.stats()},
+        'puzzle_pool': {**puzzle_pool.stats(), 'solved_cache': solved_puzzles.stats()},
+        'puzzle_tokens': {'enabled': app.config['PUZZLE_TOKENS'], **used_tokens.stats()},
+        'proof_of_work': {'enabled': app.config['PROOF_OF_WORK'], **pow_templates.stats(),
+                          'replay': used_templates.stats()}
     })
 
+@app.route('/api/metrics')
+def get_metrics():
+    """Prometheus scrape endpoint"""
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
 @app.route('/api/player/register', methods=['POST'])
 def register_player():
     """Register a new player"""
@@ -135,17 +266,8 @@ def register_player():
         return jsonify({'error': 'Username is required'}), 400
     
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute(
-            'INSERT INTO players (username, wallet_address) VALUES (?, ?)',
-            (username, wallet_address)
-        )
-        player_id = cursor.lastrowid
-        
-        conn.commit()
-        conn.close()
+        with db_pool.transaction() as conn:
+            player_id = create_player(conn, username, wallet_address)
         
         return jsonify({
             'player_id': player_id,
@@ -162,18 +284,14 @@ def register_player():
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/player/<int:player_id>')
+@cached_response('player:{player_id}')
 def get_player(player_id):
     """Get player information"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, username, wallet_address, total_sats, games_played, high_score, created_at
-        FROM players WHERE id = ?
-    ''', (player_id,))
-    
-    player = cursor.fetchone()
-    conn.close()
+    with db_pool.connection() as conn:
+        player = conn.execute('''
+            SELECT id, username, wallet_address, total_sats, games_played, high_score, created_at
+            FROM players WHERE id = ?
+        ''', (player_id,)).fetchone()
     
     if not player:
         return jsonify({'error': 'Player not found'}), 404
@@ -188,49 +306,107 @@ def get_player(player_id):
         'created_at': player[6]
     })
 
+@app.route('/api/player/<int:player_id>/earnings')
+@cached_response('player:{player_id}')
+def get_player_earnings(player_id):
+    """Sats earned and spent per day over a date range (default: this week)"""
+    week_start, week_end = sats_ledger.week_range()
+    try:
+        start = date.fromisoformat(request.args.get('from', week_start.isoformat()))
+        end = date.fromisoformat(request.args.get('to', week_end.isoformat()))
+    except ValueError:
+        return jsonify({'error': 'Dates must be YYYY-MM-DD'}), 400
+    if end <= start or (end - start).days > 366:
+        return jsonify({'error': 'Range must be 1-366 days'}), 400
+    
+    # Answered from per-day rollups, not by scanning games or ledger entries
+    with db_pool.connection() as conn:
+        account = sats_ledger.player_account(player_id)
+        earnings = sats_ledger.earned(conn, account, start, end)
+        earnings['balance'] = sats_ledger.balance(conn, account)
+    
+    return jsonify({'player_id': player_id, **earnings})
+
+@app.route('/api/player/<int:player_id>/ledger')
+@cached_response('player:{player_id}')
+def get_player_ledger(player_id):
+    """Most recent ledger entries for a player, newest first"""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 500)
+    before = request.args.get('before', type=int)
+    
+    with db_pool.connection() as conn:
+        entries = sats_ledger.history(conn, sats_ledger.player_account(player_id), limit, before)
+    
+    return jsonify({
+        'player_id': player_id,
+        'entries': entries,
+        'next_before': entries[-1]['entry_id'] if len(entries) == limit else None
+    })
+
+@app.route('/api/player/<int:player_id>/games')
+def get_player_games(player_id):
+    """A player's games, newest first, one keyset page at a time (streamed, not cached)"""
+    game_mode = request.args.get('mode')
+    if game_mode is not None and game_mode not in GAME_MODES:
+        return jsonify({'error': 'Invalid game mode'}), 400
+    limit = min(max(request.args.get('limit', 50, type=int), 1), MAX_HISTORY_PAGE)
+    after = None
+    if request.args.get('cursor'):
+        try:
+            after = games.decode_cursor(request.args['cursor'])
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+    
+    with db_pool.connection() as conn:
+        if conn.execute('SELECT 1 FROM players WHERE id = ?', (player_id,)).fetchone() is None:
+            return jsonify({'error': 'Player not found'}), 404
+    
+    def generate():
+        # Rows go out in chunks as SQLite reads them; one extra row tells
+        # whether there is a next page
+        yield json.dumps({'player_id': player_id, 'game_mode': game_mode})[:-1] + ', "games": ['
+        next_cursor, last, chunk = None, None, []
+        with db_pool.connection() as conn:
+            for count, row in enumerate(games.history(conn, player_id, game_mode, limit + 1, after)):
+                if count == limit:
+                    next_cursor = games.encode_cursor(last[-1], last[0])
+                    break
+                game = dict(zip(games.HISTORY_FIELDS, row))
+                game['ai_enabled'] = bool(game['ai_enabled'])
+                chunk.append((', ' if last else '') + json.dumps(game))
+                last = row
+                if len(chunk) == HISTORY_CHUNK_ROWS:
+                    yield ''.join(chunk)
+                    chunk = []
+        yield ''.join(chunk) + '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+    
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
 @app.route('/api/game/submit', methods=['POST'])
 def submit_game():
     """Submit game results"""
     data = request.get_json()
     
-    required_fields = ['player_id', 'game_mode', 'score', 'lines_cleared', 'level_reached', 'sats_earned']
-    for field in required_fields:
-        if field not in data:
-            return jsonify({'error': f'Missing required field: {field}'}), 400
+    error = games.validate(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
+    if app.config['ASYNC_SUBMIT']:
+        try:
+            entry_id, depth = ingest_queue.enqueue(data)
+        except ingest.QueueFull as e:
+            return jsonify({'error': str(e)}), 503, {'Retry-After': '1'}
+        return jsonify({
+            'message': 'Game queued',
+            'queue_entry': entry_id,
+            'queue_depth': depth,
+            'sats_earned': data['sats_earned']
+        }), 202
     
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Insert game record
-        cursor.execute('''
-            INSERT INTO games (player_id, game_mode, score, lines_cleared, level_reached, sats_earned, duration_seconds, ai_enabled)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            data['player_id'],
-            data['game_mode'],
-            data['score'],
-            data['lines_cleared'],
-            data['level_reached'],
-            data['sats_earned'],
-            data.get('duration_seconds', 0),
-            data.get('ai_enabled', False)
-        ))
-        
-        # Update player stats
-        cursor.execute('''
-            UPDATE players 
-            SET total_sats = total_sats + ?,
-                games_played = games_played + 1,
-                high_score = MAX(high_score, ?)
-            WHERE id = ?
-        ''', (data['sats_earned'], data['score'], data['player_id']))
-        
-        # Update leaderboard
-        update_leaderboard(data['game_mode'], data['player_id'], data['score'])
-        
-        conn.commit()
-        conn.close()
+        with db_pool.transaction() as conn:
+            games.record_game(conn, data, rankings)
+            invalidate_games([data])
         
         return jsonify({
             'message': 'Game submitted successfully',
@@ -241,39 +417,110 @@ def submit_game():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/game/submit/batch', methods=['POST'])
+def submit_game_batch():
+    """Submit many game results in one transaction (offline replays)"""
+    data = request.get_json()
+    records = data.get('games') if isinstance(data, dict) else data
+    
+    if not isinstance(records, list) or not records:
+        return jsonify({'error': 'Expected a non-empty list of games'}), 400
+    if len(records) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'Batch too large (max {MAX_BATCH_SIZE} games)'}), 413
+    
+    # Validate everything before touching the database
+    results = []
+    valid = []
+    for index, record in enumerate(records):
+        error = games.validate(record)
+        if error:
+            results.append({'index': index, 'status': 'rejected', 'error': error})
+        else:
+            results.append({'index': index, 'status': 'accepted'})
+            valid.append(record)
+    
+    if not valid:
+        return jsonify({'error': 'No valid games in batch', 'results': results}), 400
+    
+    try:
+        with db_pool.transaction() as conn:
+            game_ids = iter(games.record_games(conn, valid, rankings))
+            invalidate_games(valid)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    for result in results:
+        if result['status'] == 'accepted':
+            result['game_id'] = next(game_ids)
+    
+    return jsonify({
+        'message': 'Batch submitted',
+        'accepted': len(valid),
+        'rejected': len(records) - len(valid),
+        'sats_earned': sum(record['sats_earned'] for record in valid),
+        'results': results
+    }), 200
+
+@app.route('/api/game/queue')
+def get_ingest_queue():
+    """Write-behind queue status"""
+    return jsonify({
+        'enabled': app.config['ASYNC_SUBMIT'],
+        **ingest_queue.stats()
+    })
+
+@app.route('/api/game/queue/drain', methods=['POST'])
+def drain_ingest_queue():
+    """Write every queued game now and report how many were applied"""
+    try:
+        written = ingest_queue.drain()
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+    
+    return jsonify({'drained': written, 'depth': ingest_queue.depth()})
+
 @app.route('/api/leaderboard/<game_mode>')
+@cached_response('leaderboard:{game_mode}')
 def get_leaderboard(game_mode):
-    """Get leaderboard for specific game mode"""
-    valid_modes = ['normal', 'puzzle', 'ai-battle', 'learning']
-    if game_mode not in valid_modes:
+    """Get leaderboard for specific game mode (each player's best score)"""
+    if game_mode not in GAME_MODES:
+        return jsonify({'error': 'Invalid game mode'}), 400
+    
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 100)
+    
+    return jsonify({
+        'game_mode': game_mode,
+        'leaderboard': rankings.board(game_mode).top(limit)
+    })
+
+@app.route('/api/leaderboard/<game_mode>/player/<int:player_id>')
+@cached_response('leaderboard:{game_mode}')
+def get_player_rank(game_mode, player_id):
+    """Get a player's rank in a game mode"""
+    if game_mode not in GAME_MODES:
         return jsonify({'error': 'Invalid game mode'}), 400
     
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+    entry = rankings.board(game_mode).rank_of(player_id)
+    if not entry:
+        return jsonify({'error': 'Player not ranked'}), 404
     
-    cursor.execute('''
-        SELECT p.username, l.score, l.rank, l.updated_at
-        FROM leaderboards l
-        JOIN players p ON l.player_id = p.id
-        WHERE l.game_mode = ?
-        ORDER BY l.rank
-        LIMIT 100
-    ''', (game_mode,))
+    return jsonify({'game_mode': game_mode, **entry})
+
+@app.route('/api/leaderboard/<game_mode>/around/<int:rank>')
+@cached_response('leaderboard:{game_mode}')
+def get_players_around_rank(game_mode, rank):
+    """Get the players ranked just above and below a given rank"""
+    if game_mode not in GAME_MODES:
+        return jsonify({'error': 'Invalid game mode'}), 400
     
-    leaderboard = cursor.fetchall()
-    conn.close()
+    radius = min(max(request.args.get('radius', 5, type=int), 0), 50)
+    board = rankings.board(game_mode)
     
     return jsonify({
         'game_mode': game_mode,
-        'leaderboard': [
-            {
-                'rank': row[2],
-                'username': row[0],
-                'score': row[1],
-                'updated_at': row[3]
-            }
-            for row in leaderboard
-        ]
+        'rank': rank,
+        'total_ranked': len(board),
+        'leaderboard': board.around(max(rank, 1), radius)
     })
 
 @app.route('/api/bitcoin/puzzle/generate', methods=['POST'])
@@ -282,37 +529,46 @@ def generate_puzzle():
     data = request.get_json()
     difficulty = data.get('difficulty', 1)
     
-    # Generate puzzle based on difficulty
-    preimage = generate_preimage(difficulty)
-    puzzle_hash = hashlib.sha256(preimage.encode()).hexdigest()
+    if app.config['PUZZLE_TOKENS']:
+        return generate_token_puzzle(difficulty)
     
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO bitcoin_puzzles (puzzle_hash, preimage, difficulty, sats_reward)
-            VALUES (?, ?, ?, ?)
-        ''', (puzzle_hash, preimage, difficulty, 250 + (difficulty * 100)))
-        
-        puzzle_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        # Pre-generated puzzles are one UPDATE; unpooled difficulties insert inline
+        puzzle = puzzle_pool.claim(difficulty) or puzzle_pool.create(difficulty)
         
         return jsonify({
-            'puzzle_id': puzzle_id,
-            'puzzle_hash': puzzle_hash,
+            'puzzle_id': puzzle.puzzle_id,
+            'puzzle_hash': puzzle.puzzle_hash,
             'difficulty': difficulty,
-            'sats_reward': 250 + (difficulty * 100)
+            'sats_reward': puzzle.sats_reward
         }), 201
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+def generate_token_puzzle(difficulty):
+    """Issue a signed puzzle token; nothing is written to the database"""
+    if not isinstance(difficulty, int) or not 0 <= difficulty <= 255:
+        return jsonify({'error': 'Invalid difficulty'}), 400
+    
+    puzzle_hash = hashlib.sha256(generate_preimage(difficulty).encode()).hexdigest()
+    token, puzzle = token_signer.issue(puzzle_hash, difficulty, puzzle_reward(difficulty))
+    
+    return jsonify({
+        'puzzle_token': token,
+        'puzzle_hash': puzzle.puzzle_hash,
+        'difficulty': puzzle.difficulty,
+        'sats_reward': puzzle.sats_reward,
+        'expires_at': puzzle.expires_at
+    }), 201
+
 @app.route('/api/bitcoin/puzzle/solve', methods=['POST'])
 def solve_puzzle():
     """Solve a Bitcoin puzzle"""
     data = request.get_json()
+    if data.get('puzzle_token'):
+        return solve_token_puzzle(data)
+    
     puzzle_id = data.get('puzzle_id')
     preimage = data.get('preimage')
     player_id = data.get('player_id')
@@ -320,21 +576,29 @@ def solve_puzzle():
     if not all([puzzle_id, preimage, player_id]):
         return jsonify({'error': 'Missing required fields'}), 400
     
+    # Reject non-scalar ids before they reach the cache or the query
+    if isinstance(puzzle_id, bool) or not isinstance(puzzle_id, int):
+        return jsonify({'error': 'Invalid puzzle_id'}), 400
+    if not isinstance(preimage, str):
+        return jsonify({'error': 'Invalid preimage'}), 400
+    
+    # Hot duplicates of an already-solved puzzle never reach the database
+    if puzzle_id in solved_puzzles:
+        return jsonify({'error': 'Puzzle already solved'}), 409
+    
     try:
-        conn = sqlite3.connect(DB_FILE)
-        cursor = conn.cursor()
-        
-        # Get puzzle details
-        cursor.execute('''
-            SELECT puzzle_hash, preimage, sats_reward, solved_by
-            FROM bitcoin_puzzles WHERE id = ?
-        ''', (puzzle_id,))
+        # Verify outside the writer lock; the claim below re-checks atomically
+        with db_pool.connection() as conn:
+            puzzle = conn.execute('''
+                SELECT puzzle_hash, sats_reward, solved_by
+                FROM bitcoin_puzzles WHERE id = ? AND issued_at IS NOT NULL
+            ''', (puzzle_id,)).fetchone()
         
-        puzzle = cursor.fetchone()
         if not puzzle:
             return jsonify({'error': 'Puzzle not found'}), 404
         
-        if puzzle[3]:  # Already solved
+        if puzzle[2]:  # Already solved
+            solved_puzzles.add(puzzle_id)
             return jsonify({'error': 'Puzzle already solved'}), 409
         
         # Verify solution
@@ -342,90 +606,190 @@ def solve_puzzle():
         if provided_hash != puzzle[0]:
             return jsonify({'error': 'Invalid preimage'}), 400
         
-        # Mark as solved and award SATs
-        cursor.execute('''
-            UPDATE bitcoin_puzzles 
-            SET solved_by = ?, solved_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (player_id, puzzle_id))
+        with db_pool.transaction() as conn:
+            claimed = claim_solution(conn, puzzle_id, player_id, puzzle[1])
+            if claimed:
+                invalidate_after_commit('stats', f'player:{player_id}')
         
-        cursor.execute('''
-            UPDATE players 
-            SET total_sats = total_sats + ?
-            WHERE id = ?
-        ''', (puzzle[2], player_id))
-        
-        conn.commit()
-        conn.close()
+        solved_puzzles.add(puzzle_id)
+        if not claimed:
+            return jsonify({'error': 'Puzzle already solved'}), 409
         
         return jsonify({
             'message': 'Puzzle solved successfully!',
-            'sats_reward': puzzle[2],
+            'sats_reward': puzzle[1],
             'preimage': preimage
         }), 200
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
-@app.route('/api/stats/global')
-def get_global_stats():
-    """Get global game statistics"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+def solve_token_puzzle(data):
+    """Verify a signed puzzle token in memory; only a successful solve is stored"""
+    preimage = data.get('preimage')
+    player_id = data.get('player_id')
     
-    # Total players
-    cursor.execute('SELECT COUNT(*) FROM players')
-    total_players = cursor.fetchone()[0]
+    if not all([preimage, player_id]):
+        return jsonify({'error': 'Missing required fields'}), 400
+    
+    if not isinstance(preimage, str):
+        return jsonify({'error': 'Invalid preimage'}), 400
+    
+    try:
+        puzzle = token_signer.verify(data['puzzle_token'])
+    except TokenExpired as e:
+        return jsonify({'error': str(e)}), 410
+    except InvalidToken as e:
+        return jsonify({'error': str(e)}), 400
     
-    # Total games played
-    cursor.execute('SELECT COUNT(*) FROM games')
-    total_games = cursor.fetchone()[0]
+    # Wrong guesses must not burn the token, so check the preimage first
+    if hashlib.sha256(preimage.encode()).hexdigest() != puzzle.puzzle_hash:
+        return jsonify({'error': 'Invalid preimage'}), 400
     
-    # Total SATs earned
-    cursor.execute('SELECT SUM(sats_earned) FROM games')
-    total_sats = cursor.fetchone()[0] or 0
+    if not used_tokens.claim(puzzle.token_id):
+        return jsonify({'error': 'Puzzle already solved'}), 409
+    
+    try:
+        with db_pool.transaction() as conn:
+            claimed = puzzle_tokens.record_solve(conn, puzzle, player_id)
+            if claimed:
+                invalidate_after_commit('stats', f'player:{player_id}')
+    except Exception as e:
+        used_tokens.release(puzzle.token_id)
+        return jsonify({'error': str(e)}), 500
     
-    # Puzzles solved
-    cursor.execute('SELECT COUNT(*) FROM bitcoin_puzzles WHERE solved_by IS NOT NULL')
-    puzzles_solved = cursor.fetchone()[0]
+    if not claimed:
+        return jsonify({'error': 'Puzzle already solved'}), 409
     
-    conn.close()
+    return jsonify({
+        'message': 'Puzzle solved successfully!',
+        'sats_reward': puzzle.sats_reward,
+        'preimage': preimage
+    }), 200
+
+@app.route('/api/pow/template', methods=['POST'])
+def issue_pow_template():
+    """Issue a signed block template to mine; nothing is written to the database"""
+    if not app.config['PROOF_OF_WORK']:
+        return jsonify({'error': 'Proof of work is disabled'}), 404
     
+    token, template = pow_templates.issue()
     return jsonify({
-        'total_players': total_players,
-        'total_games': total_games,
-        'total_sats_earned': total_sats,
-        'puzzles_solved': puzzles_solved,
-        'timestamp': datetime.now().isoformat()
-    })
+        'template': token,
+        'version': proof_of_work.HEADER_VERSION,
+        'prev_hash': template.prev_hash.hex(),
+        'timestamp': template.timestamp,
+        'bits': template.bits,
+        'target': f'{proof_of_work.bits_to_target(template.bits):064x}',
+        'difficulty': proof_of_work.difficulty(template.bits),
+        'sats_reward': template.sats_reward,
+        'expires_at': template.expires_at
+    }), 201
 
-def update_leaderboard(game_mode: str, player_id: int, score: int):
-    """Update leaderboard for a game mode"""
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
+@app.route('/api/pow/submit', methods=['POST'])
+def submit_pow():
+    """Verify a mined (data, nonce) pair against its signed template in O(1) hashes"""
+    if not app.config['PROOF_OF_WORK']:
+        return jsonify({'error': 'Proof of work is disabled'}), 404
+    
+    data = request.get_json()
+    player_id = data.get('player_id')
+    payload = data.get('data')
+    nonce = data.get('nonce')
+    
+    if not data.get('template') or not player_id or not isinstance(payload, str) \
+            or not isinstance(nonce, int):
+        return jsonify({'error': 'Missing required fields'}), 400
+    payload = payload.encode()
+    if len(payload) > proof_of_work.MAX_DATA_BYTES:
+        return jsonify({'error': f'data exceeds {proof_of_work.MAX_DATA_BYTES} bytes'}), 400
     
-    # Get current top scores
-    cursor.execute('''
-        SELECT player_id, score FROM games 
-        WHERE game_mode = ? 
-        ORDER BY score DESC 
-        LIMIT 100
-    ''', (game_mode,))
+    try:
+        template = pow_templates.verify(data['template'])
+    except TemplateExpired as e:
+        return jsonify({'error': str(e)}), 410
+    except InvalidTemplate as e:
+        return jsonify({'error': str(e)}), 400
     
-    scores = cursor.fetchall()
+    # Failed attempts must not burn the template, so check the work first
+    header = proof_of_work.verify_submission(template, payload, nonce)
+    if header is None:
+        return jsonify({'error': 'Hash does not meet the target'}), 400
+    
+    if not used_templates.claim(template.template_id):
+        return jsonify({'error': 'Template already solved'}), 409
+    
+    try:
+        with db_pool.transaction() as conn:
+            claimed = proof_of_work.record_solve(conn, template, header, player_id)
+            if claimed:
+                invalidate_after_commit(f'player:{player_id}')
+    except Exception as e:
+        used_templates.release(template.template_id)
+        return jsonify({'error': str(e)}), 500
     
-    # Clear current leaderboard
-    cursor.execute('DELETE FROM leaderboards WHERE game_mode = ?', (game_mode,))
+    if not claimed:
+        return jsonify({'error': 'Template already solved'}), 409
     
-    # Insert new leaderboard
-    for rank, (pid, s) in enumerate(scores, 1):
-        cursor.execute('''
-            INSERT INTO leaderboards (game_mode, player_id, score, rank)
-            VALUES (?, ?, ?, ?)
-        ''', (game_mode, pid, s, rank))
+    pow_templates.record_solve_time(time.time() - template.timestamp)
+    return jsonify({
+        'message': 'Block solved successfully!',
+        'block_hash': header.hash_hex(),
+        'sats_reward': template.sats_reward
+    }), 200
+
+@app.route('/api/export/<table>')
+def export_table(table):
+    """Stream a whole table (or the rows since a cursor) as NDJSON or CSV"""
+    if not export.EXPORT_TOKEN:
+        return jsonify({'error': 'Export is disabled'}), 404
+    # Bytes, since compare_digest rejects non-ASCII str
+    if not hmac.compare_digest(request.headers.get('Authorization', '').encode(),
+                               f'Bearer {export.EXPORT_TOKEN}'.encode()):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    compress = request.accept_encodings['gzip'] > 0
+    try:
+        job = export.Export(DB_FILE, table, request.args.get('format', 'ndjson'),
+                            request.args.get('since_id', type=int), request.args.get('since'),
+                            compress).open()
+    except export.ExportError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    # The snapshot is released when the last chunk is sent (or the client goes away)
+    response = Response(iter(job), mimetype=job.mimetype)
+    response.headers['X-Export-High-Water'] = str(job.high_water or 0)
+    response.headers['Content-Disposition'] = f'attachment; filename={table}.{job.fmt}'
+    response.headers['Vary'] = 'Accept-Encoding'
+    if compress:
+        response.headers['Content-Encoding'] = 'gzip'
+    return response
+
+@app.route('/api/stats/global')
+@cached_response('stats')
+def get_global_stats():
+    """Get global game statistics"""
+    # Counters are maintained by the write paths; see stats.py
+    with db_pool.connection() as conn:
+        counters = stats.read(conn)
     
-    conn.commit()
-    conn.close()
+    return jsonify({
+        'total_players': counters['total_players'],
+        'total_games': counters['total_games'],
+        'total_sats_earned': counters['total_sats_earned'],
+        'puzzles_solved': counters['puzzles_solved'],
+        'timestamp': datetime.now().isoformat()
+    })
+
+def update_leaderboard(game_mode: str, player_id: int, score: int) -> Optional[int]:
+    """Update leaderboard for a game mode with a newly submitted score"""
+    # Joins the submit_game transaction when called from inside it
+    with db_pool.transaction() as conn:
+        return leaderboard.record_score(conn, game_mode, player_id, score)
+
+def puzzle_reward(difficulty: int) -> int:
+    """SAT reward for solving a puzzle of a given difficulty"""
+    return 250 + (difficulty * 100)
 
 def generate_preimage(difficulty: int) -> str:
     """Generate a preimage string based on difficulty"""
@@ -459,6 +823,7 @@ else:
     # For gunicorn
     print("🎮 TetroHashUnlock API Server ready for gunicorn...")
     print(f"🔍 PORT environment variable: {os.environ.get('PORT', 'NOT SET')}")
+    check_config()  # a misconfigured worker must not boot
     try:
         init_db()
         print("✅ Database initialized for gunicorn")
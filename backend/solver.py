@@ -0,0 +1,341 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock reference puzzle solver
+Offline multi-core brute force over the preimage keyspaces of both puzzle
+generators, used to calibrate difficulty against rewards and solve-time budgets
+"""
+
+import argparse
+import hashlib
+import multiprocessing
+import os
+import random
+import string
+import sys
+import time
+from itertools import product
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple, Union
+
+from bitcoin_logic import BATCH_CHUNK_SIZE, TETROMINO_PREIMAGES, BitcoinScript
+
+# Mirrors server.generate_preimage(): [A-Z0-9], length 5 + difficulty
+PREIMAGE_ALPHABET = string.ascii_uppercase + string.digits
+PREIMAGE_BASE_LENGTH = 5
+# Candidates between cancellation checks inside a worker
+CANCEL_CHECK_EVERY = 1 << 14
+# Minimum seconds between progress callbacks
+PROGRESS_INTERVAL = 0.25
+
+
+class Keyspace(NamedTuple):
+    alphabet: str
+    length: int
+
+    @property
+    def size(self) -> int:
+        return len(self.alphabet) ** self.length
+
+    def prefixes(self, prefix_length: int) -> Iterator[str]:
+        """Every prefix of a given length, in keyspace order"""
+        for chars in product(self.alphabet, repeat=prefix_length):
+            yield ''.join(chars)
+
+
+class WordList(NamedTuple):
+    words: Tuple[str, ...]
+
+    @property
+    def size(self) -> int:
+        return len(self.words)
+
+
+def server_keyspace(difficulty: int) -> Keyspace:
+    """Keyspace of preimages produced by /api/bitcoin/puzzle/generate"""
+    return Keyspace(PREIMAGE_ALPHABET, PREIMAGE_BASE_LENGTH + difficulty)
+
+
+def tetromino_keyspace() -> WordList:
+    """Keyspace of preimages produced by BitcoinPuzzle.generate_puzzle()"""
+    return WordList(tuple(TETROMINO_PREIMAGES))
+
+
+def puzzle_reward(difficulty: int) -> int:
+    """Mirrors server.puzzle_reward()"""
+    return 250 + (difficulty * 100)
+
+
+def tetromino_reward() -> int:
+    """Mean of BitcoinPuzzle.calculate_reward(): randint(250, 1000) + 2 per hex digit"""
+    return (250 + 1000) // 2 + 64 * 2
+
+
+class SolveResult(NamedTuple):
+    matches: Dict[str, str]   # target hash (hex) -> preimage
+    hashes: int
+    seconds: float
+    processes: int
+    cancelled: bool
+
+    @property
+    def hashes_per_second(self) -> float:
+        return self.hashes / self.seconds if self.seconds else 0.0
+
+    @property
+    def hashes_per_second_per_core(self) -> float:
+        return self.hashes_per_second / self.processes
+
+
+# Worker state, installed once per process by _init_worker
+_worker: Dict[str, object] = {}
+
+
+def _init_worker(keyspace: Keyspace, targets: Set[bytes], cancel_event) -> None:
+    _worker['keyspace'] = keyspace
+    _worker['targets'] = targets
+    _worker['cancel'] = cancel_event
+
+
+def _search_prefix(prefix: str) -> Tuple[List[Tuple[str, bytes]], int, bool]:
+    """Enumerate every preimage starting with `prefix`.
+
+    The prefix is hashed once. Every middle segment reuses that state via
+    .copy(), and the last character is one more .copy() + update. So each
+    candidate costs one copy, a one-byte update and a digest, not a hash
+    of the whole string. Returns (matches, hashes tried, cancelled).
+    """
+    keyspace: Keyspace = _worker['keyspace']
+    targets: Set[bytes] = _worker['targets']
+    cancel = _worker['cancel']
+
+    base = hashlib.sha256(prefix.encode())
+    remaining = keyspace.length - len(prefix)
+    if remaining == 0:
+        digest = base.digest()
+        return ([(prefix, digest)] if digest in targets else []), 1, False
+
+    last_chars = [char.encode() for char in keyspace.alphabet]
+    middles = product(keyspace.alphabet.encode(), repeat=remaining - 1)
+    matches = []
+    hashes = 0
+    for middle in middles:
+        state = base.copy()
+        state.update(bytes(middle))
+        for char in last_chars:
+            candidate = state.copy()
+            candidate.update(char)
+            digest = candidate.digest()
+            if digest in targets:
+                matches.append((prefix + bytes(middle).decode() + char.decode(), digest))
+        hashes += len(last_chars)
+        if hashes % CANCEL_CHECK_EVERY < len(last_chars) and cancel.is_set():
+            return matches, hashes, True
+    return matches, hashes, False
+
+
+def _prefix_length(keyspace: Keyspace, processes: int) -> int:
+    """Shortest prefix giving enough chunks to keep every core busy"""
+    wanted = processes * 64
+    length = 0
+    while length < keyspace.length - 1 and len(keyspace.alphabet) ** length < wanted:
+        length += 1
+    return length
+
+
+class Solver:
+    """Partitioned brute-force search over a keyspace on a process pool.
+
+    The keyspace is split by fixed-length prefixes, one task per prefix.
+    Tasks run with imap_unordered, so the progress callback fires as chunks
+    finish. cancel() (or a timeout, or the first match when
+    stop_on_first is set) tells the workers to stop at their next check.
+    """
+
+    def __init__(self, processes: Optional[int] = None,
+                 progress: Optional[Callable[[Dict[str, float]], None]] = None):
+        self.processes = processes or os.cpu_count() or 1
+        self.progress = progress
+        self._cancel = multiprocessing.Event()
+
+    def cancel(self) -> None:
+        self._cancel.set()
+
+    def solve(self, target_hashes: Iterable[str], keyspace: Union[Keyspace, WordList],
+              stop_on_first: bool = True, timeout: Optional[float] = None) -> SolveResult:
+        """Search the keyspace for preimages of one or more hex target hashes"""
+        targets = {bytes.fromhex(h) for h in target_hashes}
+        if isinstance(keyspace, WordList):
+            return self._solve_words(targets, keyspace, stop_on_first, timeout)
+        self._cancel.clear()
+        prefix_length = _prefix_length(keyspace, self.processes)
+        chunk_size = keyspace.size // (len(keyspace.alphabet) ** prefix_length)
+
+        matches: Dict[str, str] = {}
+        hashes = 0
+        cancelled = False
+        started = time.perf_counter()
+        last_report = 0.0
+        with multiprocessing.Pool(self.processes, initializer=_init_worker,
+                                  initargs=(keyspace, targets, self._cancel)) as pool:
+            for found, tried, stopped in pool.imap_unordered(
+                    _search_prefix, keyspace.prefixes(prefix_length)):
+                hashes += tried
+                cancelled = cancelled or stopped
+                for preimage, digest in found:
+                    matches[digest.hex()] = preimage
+
+                elapsed = time.perf_counter() - started
+                if self.progress and elapsed - last_report >= PROGRESS_INTERVAL:
+                    last_report = elapsed
+                    self.progress({
+                        'hashes': hashes,
+                        'fraction': hashes / keyspace.size,
+                        'seconds': elapsed,
+                        'hashes_per_second': hashes / elapsed if elapsed else 0.0,
+                        'chunk_size': chunk_size,
+                    })
+                if len(matches) == len(targets) or (stop_on_first and matches):
+                    self.cancel()
+                    break
+                if timeout is not None and elapsed >= timeout:
+                    self.cancel()
+                    cancelled = True
+                    break
+                if self._cancel.is_set():
+                    cancelled = True
+                    break
+            pool.terminate()
+
+        return SolveResult(matches, hashes, time.perf_counter() - started,
+                           self.processes, cancelled)
+
+    def _solve_words(self, targets: Set[bytes], keyspace: WordList, stop_on_first: bool,
+                     timeout: Optional[float]) -> SolveResult:
+        """Dictionary search: each word is hashed whole, so there is no prefix to share"""
+        self._cancel.clear()
+        matches: Dict[str, str] = {}
+        hashes = 0
+        cancelled = False
+        started = time.perf_counter()
+        # Fanning out only pays once there is more than one chunk to spread
+        processes = self.processes if keyspace.size > BATCH_CHUNK_SIZE else 1
+
+        def words() -> Iterator[str]:
+            nonlocal hashes, cancelled
+            for word in keyspace.words:
+                if hashes % CANCEL_CHECK_EVERY == 0 and (
+                        self._cancel.is_set() or
+                        timeout is not None and time.perf_counter() - started >= timeout):
+                    cancelled = True
+                    return
+                hashes += 1
+                yield word
+
+        for preimage, target in BitcoinScript.verify_batch(words(), targets, processes):
+            matches[target] = preimage
+            if len(matches) == len(targets) or stop_on_first:
+                break
+        return SolveResult(matches, hashes, time.perf_counter() - started,
+                           processes, cancelled)
+
+
+def calibrate(processes: int, sample_seconds: float = 3.0,
+              difficulties: Iterable[int] = range(1, 6)) -> Tuple[List[Dict[str, object]], SolveResult]:
+    """Measure hash rate, then estimate expected solve time per difficulty.
+
+    The last row is BitcoinPuzzle.generate_puzzle()'s tetromino word list,
+    labelled 'words' in place of a difficulty.
+    """
+    keyspace = server_keyspace(1)
+    # A target nobody will hit, so the sample runs for the full time budget
+    result = Solver(processes).solve(['00' * 32], keyspace, timeout=sample_seconds)
+    rate = result.hashes_per_second
+
+    generators = [(difficulty, server_keyspace(difficulty).size, puzzle_reward(difficulty))
+                  for difficulty in difficulties]
+    generators.append(('words', tetromino_keyspace().size, tetromino_reward()))
+    table = []
+    for difficulty, space, reward in generators:
+        expected = space / 2 / rate  # uniform preimage: half the keyspace on average
+        table.append({
+            'difficulty': difficulty,
+            'keyspace': space,
+            'expected_seconds': expected,
+            'worst_seconds': space / rate,
+            'sats_reward': reward,
+            'sats_per_cpu_hour': reward / (expected * processes / 3600),
+        })
+    return table, result
+
+
+def _format_duration(seconds: float) -> str:
+    for unit, size in (('y', 31536000), ('d', 86400), ('h', 3600), ('m', 60)):
+        if seconds >= size:
+            return f'{seconds / size:,.1f}{unit}'
+    return f'{seconds:.2f}s'
+
+
+def main():
+    """Solve a puzzle hash offline, or calibrate difficulty against rewards"""
+    parser = argparse.ArgumentParser(description='TetroHashUnlock offline puzzle solver')
+    parser.add_argument('--hash', action='append', dest='hashes',
+                        help='target SHA256 hash in hex (repeatable)')
+    parser.add_argument('--difficulty', type=int, default=0,
+                        help='server difficulty; keyspace is [A-Z0-9]{5+difficulty}')
+    parser.add_argument('--length', type=int, help='override preimage length')
+    parser.add_argument('--alphabet', default=PREIMAGE_ALPHABET, help='override alphabet')
+    parser.add_argument('--words', action='store_true',
+                        help="search BitcoinPuzzle.generate_puzzle()'s tetromino word list instead")
+    parser.add_argument('--demo', action='store_true', help='solve a freshly generated preimage')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='measure hash rate and print expected solve times per generator')
+    parser.add_argument('--processes', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--timeout', type=float, help='give up after this many seconds')
+    args = parser.parse_args()
+
+    if args.calibrate:
+        print(f"⏱️  Measuring SHA256 rate on {args.processes} core(s)...")
+        table, sample = calibrate(args.processes)
+        print(f"   {sample.hashes_per_second:,.0f} hashes/s total, "
+              f"{sample.hashes_per_second_per_core:,.0f} hashes/s per core\n")
+        print(f"{'diff':>4} {'keyspace':>22} {'expected':>10} {'worst':>10} {'reward':>7} {'sats/cpu-h':>12}")
+        for row in table:
+            print(f"{row['difficulty']:>4} {row['keyspace']:>22,} "
+                  f"{_format_duration(row['expected_seconds']):>10} "
+                  f"{_format_duration(row['worst_seconds']):>10} "
+                  f"{row['sats_reward']:>7} {row['sats_per_cpu_hour']:>12,.4f}")
+        return 0
+
+    if args.words:
+        keyspace = tetromino_keyspace()
+    else:
+        keyspace = Keyspace(args.alphabet, args.length or PREIMAGE_BASE_LENGTH + args.difficulty)
+    hashes = args.hashes or []
+    if args.demo:
+        if args.words:
+            preimage = random.choice(keyspace.words)
+        else:
+            preimage = ''.join(random.choices(keyspace.alphabet, k=keyspace.length))
+        hashes.append(hashlib.sha256(preimage.encode()).hexdigest())
+        print(f"🎲 Demo preimage: {preimage}")
+    if not hashes:
+        parser.error('give --hash, --demo or --calibrate')
+
+    def report(progress):
+        print(f"\r   {progress['fraction'] * 100:6.2f}% of keyspace, "
+              f"{progress['hashes_per_second']:,.0f} hashes/s", end='', flush=True)
+
+    print(f"🔍 Searching {keyspace.size:,} preimages on {args.processes} core(s)...")
+    result = Solver(args.processes, progress=report).solve(hashes, keyspace, timeout=args.timeout)
+    print()
+    for target, preimage in result.matches.items():
+        print(f"✅ {target[:16]}... = {preimage}")
+    if not result.matches:
+        print("❌ Cancelled before a match" if result.cancelled else "❌ No preimage in keyspace")
+    print(f"📊 {result.hashes:,} hashes in {result.seconds:.2f}s: "
+          f"{result.hashes_per_second:,.0f} hashes/s, "
+          f"{result.hashes_per_second_per_core:,.0f} hashes/s per core")
+    return 0 if result.matches else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock static assets
+Content-hashed, precompressed frontend files served from memory
+"""
+
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Files smaller than this gain nothing from compression
+MIN_COMPRESS_BYTES = 256
+COMPRESSIBLE_TYPES = ('application/javascript', 'application/json', 'image/svg+xml')
+INDEX = 'index.html'
+# Hashed URLs never change content, so browsers may keep them for a year
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+# Unhashed URLs (index.html, old links) are revalidated with their ETag each time
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+
+class Variant(NamedTuple):
+    body: bytes
+    etag: str  # strong, unquoted; differs per encoding
+    encoding: Optional[str]  # Content-Encoding, None for identity
+
+
+class Asset:
+    """One file in every encoding worth sending, keyed by Content-Encoding"""
+
+    __slots__ = ('name', 'hashed_name', 'mimetype', 'variants', 'mtime')
+
+    def __init__(self, name: str, body: bytes, mtime: float):
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        stem, ext = os.path.splitext(name)
+        self.name = name
+        self.hashed_name = f'{stem}.{digest[:12]}{ext}'
+        self.mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        self.mtime = mtime
+        self.variants: Dict[Optional[str], Variant] = {None: Variant(body, digest, None)}
+        if len(body) < MIN_COMPRESS_BYTES or not (self.mimetype.startswith('text/')
+                                                  or self.mimetype in COMPRESSIBLE_TYPES):
+            return
+        compressed = {'gzip': gzip.compress(body, GZIP_LEVEL, mtime=0)}
+        if brotli is not None:
+            compressed['br'] = brotli.compress(body, quality=BROTLI_QUALITY)
+        for encoding, data in compressed.items():
+            if len(data) < len(body):
+                self.variants[encoding] = Variant(data, f'{digest}-{encoding}', encoding)
+
+    def negotiate(self, accept_encodings) -> Variant:
+        """Best variant for an Accept-Encoding (anything mapping a coding to its q-value).
+
+        Highest quality wins and ties go to the smallest body; identity is
+        always acceptable.
+        """
+        best = self.variants[None]
+        best_quality = 0.0
+        for encoding, variant in self.variants.items():
+            if encoding is None:
+                continue
+            quality = accept_encodings[encoding]
+            if quality > best_quality or (quality == best_quality and quality > 0
+                                          and len(variant.body) < len(best.body)):
+                best, best_quality = variant, quality
+        return best
+
+
+class StaticAssets:
+    """The frontend bundle, read and compressed once at startup.
+
+    Every file gets a content-hashed name such as `game.1f3a9c0b2d4e.js`.
+    index.html is rewritten to reference those names, so the hashed URLs
+    can be cached as immutable while index.html itself (and the plain
+    names, for old pages) are revalidated against a strong ETag. Every
+    encoding has its own ETag, computed at startup, so a conditional
+    request is answered with 304 without touching the file or the body.
+    """
+
+    def __init__(self, root: str, files: Iterable[str]):
+        self.root = root
+        self.files = sorted(files)
+        self._lock = threading.Lock()
+        self._by_url: Dict[str, Tuple[Asset, bool]] = {}
+        self.load()
+
+    def _read(self, name: str) -> Optional[Tuple[bytes, float]]:
+        path = os.path.join(self.root, name)
+        try:
+            with open(path, 'rb') as f:
+                return f.read(), os.fstat(f.fileno()).st_mtime
+        except FileNotFoundError:  # e.g. a backend-only deployment
+            return None
+
+    def load(self) -> None:
+        """(Re)build every asset, then index.html with the new hashed names"""
+        assets = {}
+        for name in self.files:
+            if name == INDEX:
+                continue
+            content = self._read(name)
+            if content is not None:
+                assets[name] = Asset(name, *content)
+
+        content = self._read(INDEX) if INDEX in self.files else None
+        if content is not None:
+            assets[INDEX] = Asset(INDEX, self.rewrite_index(content[0], assets), content[1])
+
+        by_url = {}
+        for name, asset in assets.items():
+            by_url[name] = (asset, False)
+            if name != INDEX:
+                by_url[asset.hashed_name] = (asset, True)
+        with self._lock:
+            self._by_url = by_url
+
+    @staticmethod
+    def rewrite_index(html: bytes, assets: Dict[str, Asset]) -> bytes:
+        """Point src/href references at hashed names, dropping any ?v= cache-buster"""
+        if not assets:
+            return html
+        names = '|'.join(re.escape(name) for name in sorted(assets, key=len, reverse=True))
+        pattern = re.compile(rf'((?:src|href)=")(\./)?({names})(\?[^"]*)?"'.encode())
+        return pattern.sub(
+            lambda match: match.group(1) + (match.group(2) or b'')
+            + assets[match.group(3).decode()].hashed_name.encode() + b'"',
+            html
+        )
+
+    def lookup(self, url_path: str) -> Tuple[Optional[Asset], bool]:
+        """(asset, is the URL hashed) for a path relative to the site root"""
+        with self._lock:
+            return self._by_url.get(url_path, (None, False))
+
+    def reload_if_changed(self) -> bool:
+        """Rebuild when a file was edited since loading (debug servers only: one stat per file)"""
+        with self._lock:
+            loaded = {asset.name: asset.mtime for asset, _ in self._by_url.values()}
+        for name in self.files:
+            try:
+                mtime = os.stat(os.path.join(self.root, name)).st_mtime
+            except FileNotFoundError:
+                mtime = None
+            if loaded.get(name) != mtime:
+                self.load()
+                return True
+        return False
+
+    def stats(self) -> Dict[str, object]:
+        """Per-file sizes by encoding for /api/health"""
+        with self._lock:
+            assets = {asset.name: asset for asset, _ in self._by_url.values()}
+        return {
+            'brotli': brotli is not None,
+            'files': {name: {'url': asset.hashed_name if name != INDEX else '/',
+                             **{encoding or 'identity': len(variant.body)
+                                for encoding, variant in asset.variants.items()}}
+                      for name, asset in sorted(assets.items())},
+        }
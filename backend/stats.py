@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock global statistics
+Materialized counters behind /api/stats/global, plus drift reconciliation
+"""
+
+import sqlite3
+import sys
+from typing import Dict
+
+from db import ConnectionPool, get_pool
+
+COUNTERS = ('total_players', 'total_games', 'total_sats_earned', 'puzzles_solved')
+READ_SQL = 'SELECT name, value FROM global_stats'
+
+# Ground-truth aggregates, only used to seed and reconcile the counters
+RECOMPUTE_SQL = {
+    'total_players': 'SELECT COUNT(*) FROM players',
+    'total_games': 'SELECT COUNT(*) FROM games',
+    'total_sats_earned': 'SELECT COALESCE(SUM(sats_earned), 0) FROM games',
+    'puzzles_solved': '''
+        SELECT (SELECT COUNT(*) FROM bitcoin_puzzles WHERE solved_by IS NOT NULL)
+             + (SELECT COUNT(*) FROM puzzle_token_solves)
+    ''',
+}
+
+
+def bump(conn: sqlite3.Connection, **deltas: int) -> None:
+    """Adjust counters inside the caller's transaction"""
+    conn.executemany(
+        'UPDATE global_stats SET value = value + ? WHERE name = ?',
+        [(delta, name) for name, delta in deltas.items() if delta]
+    )
+
+
+def read(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Current counter values (a fixed handful of rows, constant time)"""
+    values = dict.fromkeys(COUNTERS, 0)
+    values.update(conn.execute(READ_SQL).fetchall())
+    return values
+
+
+def recompute(conn: sqlite3.Connection) -> Dict[str, int]:
+    """Aggregate every counter from the base tables (full scans)"""
+    return {name: conn.execute(sql).fetchone()[0] for name, sql in RECOMPUTE_SQL.items()}
+
+
+def seed(conn: sqlite3.Connection) -> None:
+    """Create the counter rows from the base tables"""
+    conn.executemany(
+        'INSERT OR REPLACE INTO global_stats (name, value) VALUES (?, ?)',
+        recompute(conn).items()
+    )
+
+
+def reconcile(pool: ConnectionPool, fix: bool = True) -> Dict[str, Dict[str, int]]:
+    """Compare counters with a fresh recompute, optionally correcting drift.
+
+    Runs in a write transaction so no submit lands between the read and
+    the recompute. Returns {counter: {stored, actual, drift}} for every
+    counter whose stored value is wrong.
+    """
+    with pool.transaction() as conn:
+        stored = read(conn)
+        actual = recompute(conn)
+        drift = {
+            name: {'stored': stored[name], 'actual': actual[name],
+                   'drift': stored[name] - actual[name]}
+            for name in COUNTERS if stored[name] != actual[name]
+        }
+        if fix and drift:
+            seed(conn)
+    return drift
+
+
+def main():
+    """Reconcile the global counters of a database file"""
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    db_file = args[0] if args else 'tetrohash.db'
+    fix = '--check' not in sys.argv
+
+    drift = reconcile(get_pool(db_file), fix=fix)
+    if not drift:
+        print("✅ Global stats match the base tables")
+        return 0
+
+    for name, values in drift.items():
+        print(f"⚠️  {name}: stored {values['stored']}, actual {values['actual']} "
+              f"(drift {values['drift']:+d})")
+    print("🔧 Counters corrected" if fix else "ℹ️  Run without --check to correct")
+    return 0 if fix else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Payout engine tests against a local stub LNbits server
+Covers pooling, bounded concurrency, retries, idempotency and recovery
+"""
+
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORKDIR = tempfile.mkdtemp(prefix='tetrohash-payouts-')  # keeps payout databases out of the repo
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from payouts import FAILED, PAID, LNbitsClient, PayoutEngine  # noqa: E402
+from reward import LightningPayout  # noqa: E402
+
+API_KEY = 'stub-admin-key'
+CONCURRENCY = 4
+STUB_LATENCY = 0.02
+
+
+class StubLNbits:
+    """Just enough of POST /api/v1/payments to exercise the client.
+
+    Invoices steer the behaviour: 'lnbc-flaky-N-...' answers 503 to the
+    first N attempts per idempotency key, 'lnbc-down-...' always answers
+    503 and 'lnbc-reject-...' answers 400. Everything else is paid, once
+    per idempotency key.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.attempts = {}
+        self.paid = {}
+        self.duplicates = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.client_ports = set()
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'  # keep-alive, so pooling is observable
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                body = json.loads(self.rfile.read(length) or b'{}')
+                status, payload = stub.handle(self, body)
+                data = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_port}/api/v1'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def handle(self, request, body):
+        if request.path != '/api/v1/payments':
+            return 404, {'detail': 'Not found'}
+        if request.headers.get('X-Api-Key') != API_KEY:
+            return 401, {'detail': 'Invalid API key'}
+        key = request.headers.get('X-Idempotency-Key')
+        invoice = body.get('bolt11', '')
+
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+            self.client_ports.add(request.client_address[1])
+            attempt = self.attempts[key] = self.attempts.get(key, 0) + 1
+        try:
+            time.sleep(STUB_LATENCY)
+            if invoice.startswith('lnbc-reject'):
+                return 400, {'detail': 'Invalid bolt11 invoice'}
+            if invoice.startswith('lnbc-down') or (
+                    invoice.startswith('lnbc-flaky') and attempt <= int(invoice.split('-')[2])):
+                return 503, {'detail': 'Node unavailable'}
+            with self.lock:
+                if key in self.paid:
+                    self.duplicates += 1
+                else:
+                    self.paid[key] = body['amount']
+            return 201, {'payment_hash': key, 'checking_id': key}
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _engine(stub, name, **kwargs):
+    client = LNbitsClient(stub.url, API_KEY, timeout=5, pool_size=CONCURRENCY)
+    return PayoutEngine(client, db_file=os.path.join(WORKDIR, f'{name}.db'),
+                        concurrency=CONCURRENCY, backoff=lambda attempt: 0.0, **kwargs)
+
+
+def test_batch_payouts_with_retries():
+    stub = StubLNbits()
+    engine = _engine(stub, 'batch')
+    keys = []
+    for i in range(40):
+        invoice = f'lnbc-flaky-{i % 3}-{i}' if i % 2 else f'lnbc-ok-{i}'
+        keys.append(engine.enqueue(invoice, 100 + i))
+
+    started = time.perf_counter()
+    counts = engine.run(timeout=30)
+    elapsed = time.perf_counter() - started
+    engine.close()
+    stub.close()
+
+    assert counts[PAID] == 40, counts
+    assert sorted(stub.paid) == sorted(keys), 'every payout should be paid exactly once'
+    assert sum(stub.paid.values()) == sum(100 + i for i in range(40))
+    assert stub.duplicates == 0
+    assert 1 < stub.max_in_flight <= CONCURRENCY, stub.max_in_flight
+    assert len(stub.client_ports) <= CONCURRENCY, 'connections should be pooled'
+    serial = sum(stub.attempts.values()) * STUB_LATENCY
+    assert elapsed < serial, f'{elapsed:.2f}s is no faster than serial ({serial:.2f}s)'
+    flaky = engine.status(keys[5])  # flaky-2: two 503s, then paid
+    assert flaky['status'] == PAID and flaky['attempts'] == 3, flaky
+
+
+def test_permanent_and_exhausted_failures():
+    stub = StubLNbits()
+    engine = _engine(stub, 'failures', max_attempts=3)
+    rejected = engine.enqueue('lnbc-reject-1', 50)
+    down = engine.enqueue('lnbc-down-1', 50)
+    engine.run(timeout=30)
+    engine.close()
+    stub.close()
+
+    assert engine.status(rejected)['status'] == FAILED
+    assert engine.status(rejected)['attempts'] == 1, 'a 400 must not be retried'
+    assert engine.status(down)['status'] == FAILED
+    assert engine.status(down)['attempts'] == 3
+    assert 'HTTP 503' in engine.status(down)['last_error']
+    assert not stub.paid
+
+
+def test_idempotent_enqueue_and_crash_recovery():
+    stub = StubLNbits()
+    engine = _engine(stub, 'recovery')
+    key = engine.enqueue('lnbc-ok-1', 75, idempotency_key='winner-7-puzzle-42')
+    assert engine.enqueue('lnbc-ok-1', 75, idempotency_key=key) == key
+    assert sum(engine.counts().values()) == 1
+
+    # Crash after claiming: the row is stuck in flight until the next open()
+    engine._claim_due(10)
+    assert engine.counts()['in_flight'] == 1
+    engine.close()
+
+    restarted = _engine(stub, 'recovery')
+    restarted.open()
+    restarted.run(timeout=30)
+    restarted.close()
+    stub.close()
+
+    assert restarted.status(key)['status'] == PAID
+    assert stub.paid == {key: 75}
+
+
+def test_lightning_payout_reuses_session():
+    stub = StubLNbits()
+    payout = LightningPayout(stub.url, API_KEY)
+    results = [payout.send_payment(10, f'lnbc-ok-{i}') for i in range(10)]
+    stub.close()
+
+    assert all(result['success'] for result in results), results
+    assert len(stub.client_ports) == 1, 'sequential payments should share one connection'
+
+
+def main():
+    print("🧪 Testing Lightning payouts against a stub LNbits server...")
+    tests = (test_batch_payouts_with_retries, test_permanent_and_exhausted_failures,
+             test_idempotent_enqueue_and_crash_recovery, test_lightning_payout_reuses_session)
+    for test in tests:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print("\n🎉 Payouts are pooled, bounded, retried and paid exactly once")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
@@ -0,0 +1,171 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for /api/bitcoin/puzzle/solve
+Many players race to solve the same puzzle; exactly one may be paid
+"""
+
+import os
+import sys
+import tempfile
+import threading
+
+WORKDIR = tempfile.mkdtemp(prefix='tetrohash-solve-')
+# Keep the test database out of the repo without changing the working directory
+os.environ['TETROHASH_DB_FILE'] = os.path.join(WORKDIR, 'tetrohash.db')
+os.environ['TETROHASH_RATE_LIMIT'] = '0'  # every racer shares one client address
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import server  # noqa: E402
+
+SOLVERS = 32
+ROUNDS = 5
+
+
+def _register_players(client, count):
+    player_ids = []
+    for _ in range(count):
+        username = f'solver_{len(player_ids)}_{os.urandom(4).hex()}'
+        response = client.post('/api/player/register', json={'username': username})
+        player_ids.append(response.get_json()['player_id'])
+    return player_ids
+
+
+def _new_puzzle(client):
+    puzzle = client.post('/api/bitcoin/puzzle/generate', json={'difficulty': 1}).get_json()
+    with server.db_pool.connection() as conn:
+        preimage = conn.execute('SELECT preimage FROM bitcoin_puzzles WHERE id = ?',
+                                (puzzle['puzzle_id'],)).fetchone()[0]
+    return puzzle, preimage
+
+
+def _race(puzzle, preimage, player_ids):
+    """Fire every solve at once; return the status codes"""
+    barrier = threading.Barrier(len(player_ids))
+    statuses = []
+    lock = threading.Lock()
+
+    def attempt(player_id):
+        client = server.app.test_client()
+        barrier.wait()
+        response = client.post('/api/bitcoin/puzzle/solve', json={
+            **puzzle,
+            'preimage': preimage,
+            'player_id': player_id
+        })
+        with lock:
+            statuses.append(response.status_code)
+
+    threads = [threading.Thread(target=attempt, args=(pid,)) for pid in player_ids]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return statuses
+
+
+def _total_sats(player_ids):
+    placeholders = ','.join('?' * len(player_ids))
+    with server.db_pool.connection() as conn:
+        return conn.execute(f'SELECT SUM(total_sats) FROM players WHERE id IN ({placeholders})',
+                            player_ids).fetchone()[0]
+
+
+def _check_exactly_once(client, bypass_negative_cache):
+    player_ids = _register_players(client, SOLVERS)
+    paid = 0
+    for _ in range(ROUNDS):
+        puzzle, preimage = _new_puzzle(client)
+        if bypass_negative_cache:
+            # Force every racer through the database compare-and-set
+            server.solved_puzzles = server.SolvedPuzzles()
+        statuses = _race({'puzzle_id': puzzle['puzzle_id']}, preimage, player_ids)
+
+        assert statuses.count(200) == 1, f'expected one winner, got {statuses}'
+        assert statuses.count(409) == SOLVERS - 1, f'unexpected statuses: {statuses}'
+        paid += puzzle['sats_reward']
+
+        # A late duplicate is rejected from the negative cache
+        late = client.post('/api/bitcoin/puzzle/solve', json={
+            'puzzle_id': puzzle['puzzle_id'], 'preimage': preimage, 'player_id': player_ids[0]
+        })
+        assert late.status_code == 409
+
+    assert _total_sats(player_ids) == paid, 'payout total does not match one reward per puzzle'
+
+
+def test_concurrent_solves_pay_exactly_once():
+    server.init_db()
+    _check_exactly_once(server.app.test_client(), bypass_negative_cache=True)
+
+
+def test_negative_cache_rejects_duplicates():
+    server.init_db()
+    client = server.app.test_client()
+    _check_exactly_once(client, bypass_negative_cache=False)
+    assert server.solved_puzzles.stats()['rejections'] >= ROUNDS
+
+
+def test_token_solves_pay_exactly_once():
+    server.init_db()
+    client = server.app.test_client()
+    player_ids = _register_players(client, SOLVERS)
+    paid = 0
+    for round_number in range(ROUNDS):
+        preimage = server.generate_preimage(1)
+        token, puzzle = server.token_signer.issue(
+            server.hashlib.sha256(preimage.encode()).hexdigest(), 1, server.puzzle_reward(1))
+        if round_number % 2:
+            # Another worker never saw the claim: the primary key must catch it
+            server.used_tokens = server.UsedTokens()
+        statuses = _race({'puzzle_token': token}, preimage, player_ids)
+
+        assert statuses.count(200) == 1, f'expected one winner, got {statuses}'
+        assert statuses.count(409) == SOLVERS - 1, f'unexpected statuses: {statuses}'
+        paid += puzzle.sats_reward
+
+        server.used_tokens = server.UsedTokens()
+        replay = client.post('/api/bitcoin/puzzle/solve', json={
+            'puzzle_token': token, 'preimage': preimage, 'player_id': player_ids[0]
+        })
+        assert replay.status_code == 409
+
+    assert _total_sats(player_ids) == paid, 'payout total does not match one reward per token'
+
+    forged, _ = server.TokenSigner('not-the-server-key').issue(puzzle.puzzle_hash, 1, 10 ** 6)
+    response = client.post('/api/bitcoin/puzzle/solve', json={
+        'puzzle_token': forged, 'preimage': preimage, 'player_id': player_ids[0]
+    })
+    assert response.status_code == 400
+
+
+def test_malformed_solves_are_rejected():
+    server.init_db()
+    client = server.app.test_client()
+    player_id = _register_players(client, 1)[0]
+    puzzle, preimage = _new_puzzle(client)
+    for body in ({'puzzle_id': [puzzle['puzzle_id']], 'preimage': preimage},
+                 {'puzzle_id': {'id': 1}, 'preimage': preimage},
+                 {'puzzle_id': True, 'preimage': preimage},
+                 {'puzzle_id': puzzle['puzzle_id'], 'preimage': ['x']}):
+        response = client.post('/api/bitcoin/puzzle/solve', json={**body, 'player_id': player_id})
+        assert response.status_code == 400, f'{body} answered {response.status_code}'
+        assert response.is_json
+
+
+def main():
+    print("🧪 Stress testing puzzle solving...")
+    for test in (test_concurrent_solves_pay_exactly_once, test_negative_cache_rejects_duplicates,
+                 test_token_solves_pay_exactly_once, test_malformed_solves_are_rejected):
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError as e:
+            print(f"❌ {test.__name__}: {e}")
+            return False
+    print(f"\n🎉 {SOLVERS} concurrent solvers x {ROUNDS} puzzles (and tokens): exactly one payout each")
+    return True
+
+
+if __name__ == "__main__":
+    success = main()
+    exit(0 if success else 1)
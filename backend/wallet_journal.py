@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+"""
+TetroHashUnlock wallet journal
+Crash-safe balance storage: append-only ledger of deltas plus atomic snapshots
+"""
+
+import atexit
+import os
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+# Group-commit window: appends arriving within it share one write + fsync
+WALLET_COMMIT_INTERVAL = float(os.environ.get('TETROHASH_WALLET_COMMIT_INTERVAL', 0.01))
+# Fold the journal into a fresh snapshot after this many entries
+WALLET_COMPACT_EVERY = int(os.environ.get('TETROHASH_WALLET_COMPACT_EVERY', 10000))
+
+
+class JournalCorrupt(Exception):
+    """Raised when the snapshot cannot be parsed (never silently read as 0)"""
+
+
+def _entry(seq: int, delta: int) -> str:
+    body = f'{seq} {delta:+d}'
+    return f'{body} {zlib.crc32(body.encode()):08x}\n'
+
+
+def _parse_entry(line: bytes) -> Optional[Tuple[int, int]]:
+    """(seq, delta) for a complete, checksummed line, else None"""
+    if not line.endswith(b'\n'):
+        return None
+    try:
+        body, crc = line[:-1].rsplit(b' ', 1)
+        if zlib.crc32(body) != int(crc, 16):
+            return None
+        seq, delta = body.split(b' ')
+        return int(seq), int(delta)
+    except ValueError:
+        return None
+
+
+def _fsync_dir(path: str) -> None:
+    """Make a rename in `path`'s directory durable (no-op where unsupported)"""
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+class WalletJournal:
+    """Balance kept as a snapshot file plus a journal of signed deltas.
+
+    The snapshot (`path`) holds "<balance> <seq>", where seq is the last
+    journal entry folded into it. It is only ever replaced whole, via a
+    temp file, fsync and os.replace. Each credit or debit appends
+    "<seq> <delta> <crc32>" to `path`.journal. A writer thread batches the
+    appends that arrive within `commit_interval` into one write and one
+    fsync. Recovery loads the snapshot and replays entries after its seq.
+    It stops at the first torn or corrupt line and truncates it away.
+    A legacy snapshot holding just "<balance>" reads as seq 0.
+    """
+
+    def __init__(self, path: str, commit_interval: float = WALLET_COMMIT_INTERVAL,
+                 compact_every: int = WALLET_COMPACT_EVERY):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.commit_interval = commit_interval
+        self.compact_every = compact_every
+        self._lock = threading.Lock()          # balance, seq and the append buffer
+        self._io_lock = threading.Lock()       # journal and snapshot files
+        self._durable = threading.Condition(self._lock)
+        self._buffer: List[str] = []
+        self._balance = 0
+        self._seq = 0
+        self._durable_seq = 0
+        self._durable_balance = 0
+        self._snapshot_seq = 0
+        self._journal = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._stats = {'appends': 0, 'commits': 0, 'fsyncs': 0, 'compactions': 0,
+                       'replayed': 0, 'truncated_bytes': 0, 'last_commit_ms': 0.0}
+
+    @property
+    def balance(self) -> int:
+        with self._lock:
+            return self._balance
+
+    def _read_snapshot(self) -> Tuple[int, int]:
+        if not os.path.exists(self.path):
+            return 0, 0
+        with open(self.path, 'r') as f:
+            text = f.read().split()
+        try:
+            if len(text) == 1:
+                return int(text[0]), 0
+            balance, seq = text
+            return int(balance), int(seq)
+        except ValueError as e:
+            raise JournalCorrupt(f'Unreadable wallet snapshot {self.path!r}: {text!r}') from e
+
+    def recover(self) -> int:
+        """Load the snapshot, replay the journal after it and open it for appends"""
+        with self._io_lock, self._lock:
+            balance, seq = self._read_snapshot()
+            self._snapshot_seq = seq
+            good_bytes = 0
+            replayed = 0
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, 'rb') as f:
+                    for line in f:
+                        entry = _parse_entry(line)
+                        if entry is None or entry[0] > seq + 1:
+                            break  # torn tail or a gap: nothing after it is trustworthy
+                        if entry[0] == seq + 1:
+                            seq, balance = entry[0], balance + entry[1]
+                            replayed += 1
+                        good_bytes += len(line)
+                    size = f.seek(0, os.SEEK_END)
+                if size > good_bytes:
+                    with open(self.journal_path, 'r+b') as f:
+                        f.truncate(good_bytes)
+                        os.fsync(f.fileno())
+                    self._stats['truncated_bytes'] += size - good_bytes
+
+            self._balance = self._durable_balance = balance
+            self._seq = self._durable_seq = seq
+            self._stats['replayed'] += replayed
+            self._journal = open(self.journal_path, 'ab')
+            return balance
+
+    def append(self, delta: int) -> int:
+        """Record a credit (or debit, if negative); durable after the next commit"""
+        with self._lock:
+            self._seq += 1
+            self._balance += delta
+            self._buffer.append(_entry(self._seq, delta))
+            self._stats['appends'] += 1
+            first = len(self._buffer) == 1
+            balance = self._balance
+        if first:
+            self._wake.set()
+        return balance
+
+    def commit(self) -> int:
+        """Write and fsync everything appended so far; returns the durable seq"""
+        with self._io_lock:
+            return self._commit()
+
+    def _commit(self) -> int:
+        """commit() with the io lock already held"""
+        with self._lock:
+            if not self._buffer:
+                return self._durable_seq
+            pending, self._buffer = self._buffer, []
+            seq, balance = self._seq, self._balance
+        started = time.perf_counter()
+        self._journal.write(''.join(pending).encode())
+        self._journal.flush()
+        os.fsync(self._journal.fileno())
+        with self._lock:
+            self._durable_seq, self._durable_balance = seq, balance
+            self._stats['commits'] += 1
+            self._stats['fsyncs'] += 1
+            self._stats['last_commit_ms'] = round((time.perf_counter() - started) * 1000, 3)
+            self._durable.notify_all()
+        if seq - self._snapshot_seq >= self.compact_every:
+            self._compact(balance, seq)
+        return seq
+
+    def snapshot(self, balance: Optional[int] = None) -> None:
+        """Fold the journal into the snapshot, optionally resetting the balance"""
+        with self._io_lock:
+            self._commit()
+            with self._lock:
+                if balance is not None:
+                    # Appends that arrived after the commit sit past the snapshot
+                    # seq and replay on top of it, so keep them on top in memory too
+                    self._balance = balance + (self._balance - self._durable_balance)
+                    self._durable_balance = balance
+                balance, seq = self._durable_balance, self._durable_seq
+            self._compact(balance, seq)
+
+    def _compact(self, balance: int, seq: int) -> None:
+        """Atomically replace the snapshot, then empty the journal (io lock held)"""
+        temp_path = f'{self.path}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(f'{balance} {seq}\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        _fsync_dir(self.path)
+        # Safe to lose: entries at or below the snapshot seq are skipped on replay
+        self._journal.truncate(0)
+        self._journal.seek(0)
+        os.fsync(self._journal.fileno())
+        self._snapshot_seq = seq
+        with self._lock:
+            self._stats['compactions'] += 1
+            self._stats['fsyncs'] += 3
+
+    def wait_durable(self, timeout: Optional[float] = None) -> bool:
+        """Block until everything appended so far has been committed"""
+        with self._lock:
+            target = self._seq
+            self._wake.set()
+            return self._durable.wait_for(lambda: self._durable_seq >= target, timeout)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(timeout=1.0)
+            self._wake.clear()
+            # Let a burst accumulate so it lands in one group commit
+            time.sleep(self.commit_interval)
+            try:
+                self.commit()
+            except Exception as e:
+                print(f"⚠️  Wallet journal commit error: {e}")
+                time.sleep(1.0)
+
+    def start(self) -> int:
+        """Recover, then start the group-commit writer; returns the balance"""
+        balance = self.recover()
+        if not (self._thread and self._thread.is_alive()):
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='wallet-journal', daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+        return balance
+
+    def close(self) -> None:
+        """Stop the writer and commit whatever is still buffered"""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=5.0)
+            self._thread = None
+        if self._journal and not self._journal.closed:
+            self.commit()
+            self._journal.close()
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            snapshot = dict(self._stats)
+            snapshot['seq'] = self._seq
+            snapshot['durable_seq'] = self._durable_seq
+            snapshot['snapshot_seq'] = self._snapshot_seq
+        return snapshot